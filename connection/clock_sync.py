@@ -0,0 +1,108 @@
+import math
+import threading
+from collections import deque
+
+class ClockSync:
+    """
+    Estimates the offset and drift of one iPad's clock against the server.
+
+    Each live check gives an NTP-style exchange, all in epoch ms:
+        t1  server sends LIVE_CHECK         t2  iPad receives it
+        t3  iPad sends LIVE_CHECK_ACK       t4  server receives the ACK
+    offset = ((t2 - t1) + (t3 - t4)) / 2    (iPad clock minus server clock)
+    delay  = (t4 - t1) - (t3 - t2)          (network round trip)
+
+    Only the lowest-delay exchanges of a sliding window are trusted (queued
+    or retransmitted packets inflate the delay and bias the offset), and a
+    least-squares line through them gives the offset now and the drift.
+    The published accuracy is half the best round trip plus the RMS
+    residual of the fit.
+    """
+
+    def __init__(self, window=64, best_fraction=0.25, min_best=4, min_drift_span_s=60):
+        self.samples = deque(maxlen=window)     # (server time, offset, delay)
+        self.best_fraction = best_fraction
+        self.min_best = min_best
+        self.min_drift_span_ms = min_drift_span_s * 1000
+        self.offset_ms = None
+        self.drift_ppm = 0.0
+        self.accuracy_ms = None
+        self.min_delay_ms = None
+        self._reference_ms = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def synchronized(self):
+        return self.offset_ms is not None
+
+    def add_exchange(self, t1, t2, t3, t4):
+        delay = max(0.0, (t4 - t1) - (t3 - t2))
+        offset = ((t2 - t1) + (t3 - t4)) / 2
+        with self._lock:
+            self.samples.append(((t1 + t4) / 2, offset, delay))
+            self._fit()
+        return offset, delay
+
+    def _fit(self):
+        count = max(self.min_best, int(len(self.samples) * self.best_fraction))
+        best = sorted(self.samples, key=lambda sample: sample[2])[:count]
+        self.min_delay_ms = best[0][2]
+
+        times = [sample[0] for sample in best]
+        offsets = [sample[1] for sample in best]
+        mean_t = sum(times) / len(times)
+        mean_offset = sum(offsets) / len(offsets)
+        spread = sum((t - mean_t) ** 2 for t in times)
+
+        # Over a short span the slope is mostly noise; until the samples
+        # cover min_drift_span_s, assume no drift
+        slope = 0.0
+        if len(best) >= 2 and max(times) - min(times) >= self.min_drift_span_ms:
+            slope = sum((t - mean_t) * (o - mean_offset) for t, o in zip(times, offsets)) / spread
+
+        # Publish the offset as of the latest exchange
+        self._reference_ms = self.samples[-1][0]
+        self.offset_ms = mean_offset + slope * (self._reference_ms - mean_t)
+        self.drift_ppm = slope * 1e6
+        residual = math.sqrt(sum((o - (mean_offset + slope * (t - mean_t))) ** 2 for t, o in zip(times, offsets)) / len(best))
+        self.accuracy_ms = self.min_delay_ms / 2 + residual
+
+    def offset_at(self, server_ms):
+        """Estimated iPad-minus-server offset at a server time, in ms."""
+        if self.offset_ms is None:
+            return None
+        return self.offset_ms + self.drift_ppm * 1e-6 * (server_ms - self._reference_ms)
+
+    def to_server_time(self, client_ms):
+        """Maps an iPad timestamp (epoch ms) onto the server timebase."""
+        if self.offset_ms is None:
+            return None
+        # The offset barely changes over one offset's worth of time, so one
+        # correction step is enough
+        return client_ms - self.offset_at(client_ms)
+
+    def event_server_time(self, received_ms):
+        """
+        Server-timebase time of an iPad event that carries no timestamp of
+        its own: its receive time minus the estimated one-way delay.
+        """
+        if self.min_delay_ms is None:
+            return received_ms
+        return received_ms - self.min_delay_ms / 2
+
+    def stats(self):
+        with self._lock:
+            return {
+                "samples": len(self.samples),
+                "offset_ms": self.offset_ms,
+                "drift_ppm": self.drift_ppm,
+                "accuracy_ms": self.accuracy_ms,
+                "min_delay_ms": self.min_delay_ms,
+            }
+
+    def describe(self):
+        """One-line summary for the server log."""
+        if self.offset_ms is None:
+            return "Clock sync: no exchanges yet"
+        return (f"Clock sync: offset {self.offset_ms:+.2f} ms (+/- {self.accuracy_ms:.2f} ms), "
+                f"drift {self.drift_ppm:+.1f} ppm, min RTT {self.min_delay_ms:.2f} ms over {len(self.samples)} exchanges")
@@ -1,44 +1,101 @@
 import socket
 import threading
-import select
+import selectors
 import time
 import os
 from datetime import datetime, time as dt_time
+from utils.scheduler.schedule_planner import SchedulePlanner
 from utils.scheduler.scheduler import Scheduler
-from utils.audio.audio_alert import AudioAlert
+from utils.scheduler.timer_scheduler import TimerScheduler
+from connection.device_session import DeviceSession
+from connection.message_dispatcher import MessageDispatcher
+from connection.send_queue import PRIORITY_REALTIME, PRIORITY_NORMAL, PRIORITY_BACKGROUND
+from connection.session_resume import ReliableChannel
+from connection.durable_queue import DurableQueue
+from core.state_store import StateStore
+from utils.logger.log_writer import LogWriter
+from utils.photodiode.flicker_engine import FlickerEngine, FLASH_ON
 #from utils.bci2000.bci2000_handler import BCI2000Handler
 
 class ConnectionManager:
 
-    def __init__(self, ui_instance, update_ui_callback, reporter_instance):
+    def __init__(self, ui_instance, update_ui_callback, reporter_instance, host='localhost', port=4100, log_writer=None, timers=None, state=None, journal=None, planner=None, log_dir=None):
         self.server_running = True
-        self.connection = None
-        self.address = None
+
+        # Every periodic task (live checks, battery and BCI checks, EMA
+        # triggers, audio timeouts) runs on this single timer thread
+        self.timers = timers or TimerScheduler.default()
+
+        # Background log writer (see LogWriter for the durability policy)
+        self.log_writer = log_writer or LogWriter()
+        self.connection_lock = threading.Lock()
         self.ui = ui_instance
-        self.update_ui_callback = update_ui_callback
 
-        # Initialize Scheduler
-        self.scheduler = Scheduler(self, update_ui_callback)
+        # Flags, counters and battery/EMA status shared with the (optional)
+        # UI; background threads only ever touch the store, never Tk
+        self.state = state or StateStore()
+        # Optional core.journal.Journal for session events (ready, EMA
+        # outcomes, disconnects)
+        self.journal = journal
+        self.update_ui_callback = update_ui_callback
 
-        # Initialize AudioAlert
-        self.audio_alert = AudioAlert(alert_interval=120, skip_callback=self.send_skip_signal, ui_instance= self.ui, log_timestamped=self.log_timestamped)
+        # Connected sockets -> DeviceSession, and device ID -> DeviceSession.
+        # Identified sessions outlive their socket so a reconnecting device
+        # keeps its counters, EMA log file and scheduler.
+        self.clients = {}
+        self.sessions = {}
+
+        # Backpressure: most bytes that may wait in one device's send queue
+        self.send_queue_limit = 256 * 1024
+
+        # Session resumption (CLIENT_RESUME clients only): how long a dropped
+        # device still receives commands into its retransmit buffer, and
+        # the size of that buffer
+        self.resume_window = 120
+        self.resume_buffer_messages = 256
+
+        # Inbound message routing; anything without a registered verb is an
+        # EMA payload line
+        self.dispatcher = MessageDispatcher(default_handler=lambda session, line: self.log_ema_message(line, session))
+        self.dispatcher.register("CLIENT_READY", self._on_client_ready)
+        self.dispatcher.register("CLIENT_RESUME", self._on_client_resume)
+        self.dispatcher.register("SEQ", self._on_sequenced)
+        self.dispatcher.register("SACK", self._on_sack)
+        self.dispatcher.register("EMA_Session_ACK", self._on_ema_ack)
+        self.dispatcher.register("Session_Complete", self._on_session_complete)
+        self.dispatcher.register("BATTERY", self._on_battery)
+        self.dispatcher.register("LIVE_CHECK_ACK", self._on_live_check_ack)
+        self.dispatcher.register("BCI_Sync", self._on_bci_sync)
 
         # Set up the Python server
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.server.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # Disable Nagle's Algorithm
-        self.server.bind(('localhost', 4100))
+        self.server.bind((host, port))
         #self.server.bind(('192.168.1.152', 4100))
         #self.server.bind(('192.168.0.101', 4100))
         #self.server.bind(('192.168.0.103', 4100))
         #self.server.bind(('192.168.1.164', 4100))
         #self.server.bind(('192.168.10.20', 4100))
-        self.server.listen(1)
+        self.server.listen(socket.SOMAXCONN)
+        self.server.setblocking(False)
+
+        # Event-driven I/O: the loop only wakes when the listener, a client
+        # socket or the wakeup pipe (used by stop_server) becomes readable
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.server, selectors.EVENT_READ, self._accept_client)
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+        self._write_requests = set()    # sessions with messages queued by other threads
+        self._io_thread_id = None
+        self.selector.register(self._wakeup_reader, selectors.EVENT_READ, self._drain_wakeup)
+        self._recv_view = memoryview(bytearray(65536))
 
         # Get script path
         script_dir = os.path.dirname(os.path.abspath(__file__))
         project_root = os.path.dirname(script_dir)
-        log_base_dir = os.path.join(project_root, "logs")
+        log_base_dir = log_dir or os.path.join(project_root, "logs")
         server_log_dir = os.path.join(log_base_dir, "server_log")
         self.ema_log_dir = os.path.join(log_base_dir, "ema_log")
         self.latency_log_dir = os.path.join(log_base_dir, "latency_log")
@@ -49,212 +106,532 @@ class ConnectionManager:
 
         # Generate unique log file names
         self.server_log_file = os.path.join(server_log_dir, f"server_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
-        self.ema_log_file = None
         self.latency_log_file = None
 
+        # Initialize Scheduler (triggers every connected device). The
+        # planner's seed and constraints fix the whole study's schedule;
+        # device schedules use seeds derived from it. The shared schedule is
+        # saved to disk so a restart can resume() it.
+        self.planner = planner or SchedulePlanner()
+        self.scheduler = Scheduler(self, update_ui_callback or (lambda next_time: self.state.set(next_start=next_time)), timers=self.timers,
+                                   planner=self.planner, state_path=os.path.join(log_base_dir, "scheduler_state.json"))
+
+        # EMA starts triggered while no iPad is connected wait here (on disk)
+        # and are delivered when one completes its handshake
+        self.pending_ema_ttl = 15 * 60     # seconds an EMA start stays deliverable
+        self.pending_messages = DurableQueue(os.path.join(log_base_dir, "pending_messages.jsonl"),
+                                             clock=lambda: self.timers.wall_clock().timestamp())
+
         # Define the Nighttime period
         self.night_start = datetime.strptime("21:30", "%H:%M").time()   # 9:30 pm
         self.night_end = datetime.strptime("08:30", "%H:%M").time()     # 8:30 am
 
-        # Start a background thread to accept connections
-        self.connection_thread = threading.Thread(target=self.accept_connections, daemon=True)
-        self.connection_thread.start()
-
-        # Live check thread
-        self.live_check_running = False
+        # Live check: one periodic task probes every ready device
+        self.live_check_task = None
         self.live_check_interval = 3
-        self.liveCheckIdCounter = 0
         self.liveCheckIdLimit = 1000
-        self.last_live_check_id = None 
-        self.last_live_check_time = None  # Store timestamp for latency check
-        self.last_live_check_ack_time = time.time()   # Track the lastest LIVE_CHECK_ACK received time
-        self.live_check_thread = None #threading.Thread(target=self.live_check_loop, daemon=True)
+        self.live_check_window = 64     # outstanding probes still matched when their ACK is late
+        self.live_check_stats_every = 100   # log RTT statistics every N probes
+        self.clock_sync_window = 64     # live check exchanges used for the clock offset fit
 
-        # Battery check thread
+        # Battery check
         self.battery_check_interval = 1800  # 30 minutes in seconds
-        self.battery_check_thread = threading.Thread(target=self.battery_check_loop, daemon=True)
-        self.battery_check_thread.start()
-
-        # Message buffer for incoming data from EMA
-        self.buffer = ""
+        self.battery_check_task = self.timers.call_every(self.battery_check_interval, self.periodic_battery_check)
 
         # Experiment Reporter
         self.reporter = reporter_instance
 
-        # Photodiode flicker test running flag
+        # Photodiode flicker test: running flag and default timing
         self.photodiode_test_running = False
+        self.photodiode_engine = None
+        self.photodiode_frequency_hz = 0.5  # one white/black cycle every 2 s
+        self.photodiode_duty_cycle = 0.5
+        self.photodiode_pattern = (1,)      # square wave; see flicker_engine.prbs()
 
         # BCI2000 component
         #self.bci_handler = BCI2000Handler(self.log_bci_timestamped, self.reporter.send_email)
 
-        # Start BCI2000 connection check thread
+        # Start BCI2000 connection check
         self.bci_check_interval = 1800  # 30 mins
-        self.bci_check_thread = threading.Thread(target=self.bci_check_loop, daemon=True)
-        self.bci_check_thread.start()
+        self.bci_check_task = self.timers.call_every(self.bci_check_interval, self.periodic_bci_check, first_delay=0)
+
+        # Start the I/O loop last so handlers never see a half-built manager
+        self.connection_thread = threading.Thread(target=self.accept_connections, daemon=True)
+        self.connection_thread.start()
 
     # accept new connections and handle disconnections
     def accept_connections(self):
-        # TODO: handle reconnect on server side
-    
+        """Runs the I/O loop, dispatching readiness events to the registered callbacks."""
+        self._io_thread_id = threading.get_ident()
         try:
             while self.server_running:
-                readable, _, _ = select.select([self.server], [], [], 0.1)
-                if self.server in readable:
-                    if self.connection is None:
-                        self.log_timestamped("Waiting for a new client to connect...")
-                        self.connection, self.address = self.server.accept()
-                        self.log_timestamped(f"Connected to {self.address}")
-                        #self.connection.sendall("Server Initiated".encode('utf-8'))
-                        #self.log_timestamped("Sent INIT message to Unity client")
-                        
-                        self.last_live_check_ack_time = time.time()
-
-                        # Start live check once a connection is established
-                        #if self.live_check_thread is None or not self.live_check_thread.is_alive():
-                        ##    time.sleep(1)
-                        #    self.live_check_running = True
-                        #    self.live_check_thread = threading.Thread(target=self.live_check_loop, daemon=True)
-                        #    self.live_check_thread.start()
-                        
-                        # First battery check on connection
-                        #self.check_battery()
-                    else:
-                        try:
-                            data = self.connection.recv(1024)
-                            if not data:
-                                self.handle_disconnection()
-                        except (ConnectionResetError, BrokenPipeError):
-                            self.handle_disconnection()
-                if self.connection:
-                    try:
-                        data = self.connection.recv(4096).decode('utf-8')
-                        if data:
-                            self.process_received_message(data)
-                        else:
-                            self.handle_disconnection()
-                    except (ConnectionResetError, BrokenPipeError):
-                        self.handle_disconnection()
-                else:
-                    continue
+                for key, mask in self.selector.select():
+                    key.data(key.fileobj, mask)
         except OSError:
-            self.log_timestamped("Server socket closed on OSError.")
-            time.sleep(1)
-            self.log_timestamped("Server waiting for new connection")
+            if self.server_running:
+                self.log_timestamped("Server socket closed on OSError.")
 
-    # send messages to unity
-    def send_message(self, message):
-        if self.connection:
-            self.connection.sendall(message.encode('utf-8'))
-            self.log_timestamped(f"Sent message to iPad: {message}")
+    def _accept_client(self, server, mask):
+        try:
+            connection, address = server.accept()
+        except BlockingIOError:
+            return
+
+        # Writes go through the session's OutboundQueue, drained by this loop
+        connection.setblocking(False)
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.connection_lock:
+            self.clients[connection] = DeviceSession(self, connection, address)
+        self.selector.register(connection, selectors.EVENT_READ, self._client_event)
+        self.log_timestamped(f"Connected to {address}")
+
+    def _client_event(self, connection, mask):
+        if mask & selectors.EVENT_WRITE:
+            session = self.clients.get(connection)
+            if session is not None:
+                self._flush(session)
+        if mask & selectors.EVENT_READ:
+            self._read_client(connection)
+
+    def _read_client(self, connection):
+        session = self.clients.get(connection)
+        if session is None:
+            return
+
+        # Only called on readiness, so recv returns immediately. The I/O loop
+        # is single threaded, so one receive buffer is reused for all clients.
+        try:
+            received = connection.recv_into(self._recv_view)
+        except (ConnectionResetError, BrokenPipeError, OSError):
+            received = 0
+
+        if received:
+            # The framer keeps the unterminated tail, so it gets its own copy
+            self.process_received_message(self._recv_view[:received].tobytes(), session)
         else:
-            self.log_timestamped("No client connected!")
+            self.handle_disconnection(session)
 
-    def send_start_signal(self):
-        self.ui.update_qr_code()
+    def _drain_wakeup(self, reader, mask):
+        try:
+            reader.recv(4096)
+        except BlockingIOError:
+            pass
 
-        if self.connection:
-            # Get log file name from BCI2000
-            if self.ui.is_bci_enabled.get():
-                bciSubject = self.bci_handler.get_bci_subjectName() + self.bci_handler.get_bci_subjectID()
-                self.ema_log_file = os.path.join(self.ema_log_dir, f"{bciSubject}_EMA_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
+        # Write out what other threads queued since the last wakeup
+        with self.connection_lock:
+            requests, self._write_requests = self._write_requests, set()
+        for session in requests:
+            self._flush(session)
 
-                with open(self.ema_log_file, "w") as log_file:
-                    log_file.write(f"New EMA session log started at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            else:
-                self.ema_log_file = os.path.join(self.ema_log_dir, f"EMA_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
+    def _wakeup(self):
+        try:
+            self._wakeup_writer.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def _flush(self, session):
+        """Writes a session's queued messages; waits for writability if the socket is full."""
+        connection = session.connection
+        if connection is None:
+            return
+        try:
+            done = session.outbound.write_to(connection)
+        except OSError as e:
+            session.log_timestamped(f"Error sending to iPad: {e}")
+            self.handle_disconnection(session)
+            return
 
-            # Send the appropriate signal based on the mode
-            if self.ui.is_testmode_enabled.get():
-                self.connection.sendall("EMA_START_Test".encode('utf-8'))
-                self.log_timestamped(f"Initiated an EMA session [Test]")
-            else:
-                self.connection.sendall("EMA_START_Live".encode('utf-8'))
-                self.log_timestamped(f"Initiated an EMA session [Live]")
-            
-            self.ui.increment_triggered();
-            self.audio_alert.play_audio()
-            self.log_timestamped(f"Audio alert - Start")
-            
+        events = selectors.EVENT_READ if done else selectors.EVENT_READ | selectors.EVENT_WRITE
+        if events != session.selector_events:
+            try:
+                self.selector.modify(connection, events, self._client_event)
+                session.selector_events = events
+            except (KeyError, ValueError):
+                pass
+
+    def _identify(self, session, device_id):
+        """
+        Binds a freshly accepted session to the device ID from its handshake.
+        Returns the session that now owns the socket, which is the existing
+        one if this device has been seen before.
+        """
+        stale = None
+        with self.connection_lock:
+            known = self.sessions.get(device_id)
+            if known is None or known is session:
+                session.device_id = device_id
+                session.identified = True
+                # The device's own schedule is seeded by its ID, not its address
+                session.scheduler.planner = self.planner.derive(device_id)
+                self.sessions[device_id] = session
+                return session
+
+            # Reconnect of a known device: drop its old socket if still held
+            # and move the new socket into the existing session
+            stale = known.detach()
+            if stale is not None:
+                self.clients.pop(stale, None)
+            known.attach(session)
+            session.connection = None
+            self.clients[known.connection] = known
+
+        if stale is not None:
+            known.log_timestamped("Device reconnected while its previous socket was still held, replacing it.")
+            self._close_socket(stale)
+        return known
+
+    def _legacy_device_id(self, session):
+        """
+        ID of a client that does not announce one. It is keyed by its IP, so
+        a reconnect from a new port finds its session. While that session is
+        connected, another such client at the same IP (NAT, the simulator)
+        is a different device: it takes a disconnected session of its own
+        from that IP, or keeps its ip:port ID.
+        """
+        if not session.address:
+            return session.device_id
+        ip = session.legacy_ip = session.address[0]
+        with self.connection_lock:
+            known = self.sessions.get(ip)
+            if known is None or known is session or not known.connected:
+                return ip
+            for other in self.sessions.values():
+                if other.legacy_ip == ip and other is not known and not other.connected:
+                    return other.device_id
+        self.log_timestamped(f"Another device without an ID connected from {ip}, keeping it apart as {session.device_id}")
+        return session.device_id
+
+    def connected_sessions(self):
+        return [session for session in list(self.clients.values()) if session.connected]
+
+    def _reachable(self, session):
+        """Connected, or resumable and dropped less than resume_window seconds ago."""
+        if session.connected:
+            return True
+        return (session.reliable is not None and session.disconnected_at is not None
+                and time.monotonic() - session.disconnected_at < self.resume_window)
+
+    def _target_sessions(self, device_id=None):
+        """
+        Sessions a command is addressed to: one device, or every connected
+        device. Resumable devices within resume_window count as connected;
+        their messages are replayed when they resume.
+        """
+        if device_id is None:
+            resuming = [session for session in list(self.sessions.values()) if not session.connected and self._reachable(session)]
+            return self.connected_sessions() + resuming
+        session = self.sessions.get(device_id)
+        return [session] if session and self._reachable(session) else []
+
+    def _send(self, session, message, priority=PRIORITY_NORMAL, on_sent=None, sequenced=None):
+        """
+        Queues a message for a device without blocking the calling thread.
+        Returns False if the message was refused because the queue is full
+        or the device disconnected since it was targeted.
+
+        For resumable sessions, messages above background priority are
+        sequenced and kept until acknowledged (sequenced=False opts out).
+        Sequenced messages share the realtime lane so they go out in order.
+        """
+        channel = session.reliable
+        if channel is not None:
+            message = message.rstrip("\n")
+            if sequenced is None:
+                sequenced = priority != PRIORITY_BACKGROUND
+            if sequenced:
+                with channel.lock:
+                    wrapped = channel.wrap(message)
+                    if channel.paused or session.connection is None:
+                        return True     # replayed when the device resumes
+                    return self._enqueue(session, wrapped, PRIORITY_REALTIME, on_sent)
+            message += "\n"
+        if session.connection is None:
+            session.log_timestamped(f"Device disconnected, dropped message: {message.strip()}")
+            return False
+        return self._enqueue(session, message, priority, on_sent)
+
+    def _enqueue(self, session, message, priority, on_sent=None):
+        if not session.outbound.put(message.encode('utf-8'), priority, on_sent):
+            session.log_timestamped(f"Send queue full, dropped message: {message}")
+            return False
+
+        if threading.get_ident() == self._io_thread_id:
+            self._flush(session)
         else:
-            self.log_timestamped("EMA Start Error: No client connected!")
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            with self.connection_lock:
+                wake = not self._write_requests
+                self._write_requests.add(session)
+            if wake:
+                self._wakeup()
+        return True
+
+    # send messages to unity
+    def send_message(self, message, device_id=None, priority=PRIORITY_NORMAL):
+        targets = self._target_sessions(device_id)
+        if not targets:
+            self.log_timestamped("No client connected!")
+        for session in targets:
+            self._send(session, message, priority)
+            session.log_timestamped(f"Sent message to iPad: {message}")
+
+    def send_start_signal(self, device_id=None):
+        self.state.set(last_start=self.timers.wall_clock())
+
+        # Send the appropriate signal based on the mode
+        signal = "EMA_START_Test" if self.state.get("test_mode") else "EMA_START_Live"
+        try:
+            self._trigger_ema(signal, device_id)
+        finally:
+            # A device-triggered start re-arms that device's own scheduler;
+            # whatever happened above, the schedule must go on
+            if device_id in self.sessions:
+                self.sessions[device_id].scheduler.schedule_start()
+            else:
+                self.scheduler.schedule_start()
+        #next_schedule_time =
+        #self.log_timestamped(f"Next EMA session scheduled at: {next_schedule_time}")
+
+    def _trigger_ema(self, signal, device_id):
+        targets = self._target_sessions(device_id)
+        for session in targets:
+            self._start_ema(session, signal)
+
+        if not targets:
+            target = device_id or "iPad"
+            self.pending_messages.put(signal, device_id, ttl=self.pending_ema_ttl, priority=PRIORITY_REALTIME)
+            minutes = self.pending_ema_ttl / 60
+            self.log_timestamped(f"EMA Start Error: No client connected! ({target}) Queued for {minutes:.0f} min.")
+            timestamp = self.timers.wall_clock().strftime("%Y-%m-%d %H:%M:%S")
             self.reporter.send_email(
                 subject="EMA Start Failed - No Client Connected",
-                body=f"The server attempted to trigger a EMA session, but no iPad client was connected at {timestamp}"
+                body=f"The server attempted to trigger a EMA session, but no {target} client was connected at {timestamp}. "
+                     f"It will be started if the {target} connects within {minutes:.0f} minutes.",
+                kind="ema_start_no_client", source=target
             )
-        
-        self.scheduler.schedule_start()
-        #next_schedule_time = 
-        #self.log_timestamped(f"Next EMA session scheduled at: {next_schedule_time}")
 
-    def send_skip_signal(self):
-        if self.connection:
-            self.audio_alert.stop_audio()
-            self.log_timestamped(f"Audio alert - Stop")
-            self.connection.sendall("EMA_SKIP".encode('utf-8'))
-            self.log_timestamped("EMA session comfirmed or cancelled")
+    def _start_ema(self, session, signal):
+        # The previous EMA session of this device is over
+        if session.ema_log_file:
+            self.log_writer.close_file(session.ema_log_file)
+
+        # Get log file name from BCI2000
+        if self.state.get("bci_enabled"):
+            bciSubject = self.bci_handler.get_bci_subjectName() + self.bci_handler.get_bci_subjectID()
+            session.ema_log_file = os.path.join(self.ema_log_dir, f"{bciSubject}_{session.file_tag}_EMA_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
+
+            self.log_writer.write(session.ema_log_file, f"New EMA session log started at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", timestamped=False)
         else:
-            self.log_timestamped("No client connected!")
+            session.ema_log_file = os.path.join(self.ema_log_dir, f"{session.file_tag}_EMA_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
 
-    def process_received_message(self, message):
-        self.buffer += message
-        while "\n" in self.buffer:  # Split at newlines
-            message_line, self.buffer = self.buffer.split("\n", 1)
+        if not self._send(session, signal, PRIORITY_REALTIME):
+            session.log_timestamped(f"EMA session not started [{signal.rsplit('_', 1)[1]}]")
+            return
+        session.log_timestamped(f"Initiated an EMA session [{signal.rsplit('_', 1)[1]}]")
+
+        session.increment_triggered()
+        session.audio_alert.play_audio()
+        session.log_timestamped(f"Audio alert - Start")
+
+    def _deliver_pending(self, session):
+        """
+        Sends what was queued while no iPad was connected, once a device is
+        ready. Of several queued EMA starts only the newest one is started.
+        """
+        entries = self.pending_messages.take(session.device_id)
+        starts = [entry for entry in entries if entry["message"].startswith("EMA_START")]
+        for entry in entries:
+            late = self.pending_messages.clock() - entry["queued"]
+            if entry["message"].startswith("EMA_START") and entry is not starts[-1]:
+                session.log_timestamped(f"Dropped queued {entry['message']} ({late:.0f} s late), superseded by a later one")
+                continue
+            session.log_timestamped(f"Delivering queued message {entry['message']} ({late:.0f} s late)")
+            if entry["message"].startswith("EMA_START"):
+                self._start_ema(session, entry["message"])
+            else:
+                self._send(session, entry["message"], entry["priority"])
+
+    def start_device_schedule(self, device_id):
+        """Runs a device on its own EMA cadence instead of the shared one."""
+        session = self.sessions.get(device_id)
+        if session is None:
+            self.log_timestamped(f"Cannot schedule unknown device: {device_id}")
+            return None
+        return session.scheduler.schedule_start()
+
+    def skip_ema(self, device_id=None):
+        """Skip from the operator (UI): counted as ignored per device, as when an alert times out."""
+        for session in self._target_sessions(device_id):
+            session.increment_ignored()
+        self.send_skip_signal(device_id)
+
+    def send_skip_signal(self, device_id=None):
+        targets = self._target_sessions(device_id)
+        if not targets:
+            self.log_timestamped("No client connected!")
+        for session in targets:
+            session.audio_alert.stop_audio()
+            session.log_timestamped(f"Audio alert - Stop")
+            self._send(session, "EMA_SKIP", PRIORITY_REALTIME)
+            session.log_timestamped("EMA session comfirmed or cancelled")
+
+    def process_received_message(self, data, session):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        # Every line of this read is stamped with its receive time, corrected
+        # onto the server timebase by the estimated one-way delay
+        received_ms = time.time_ns() / 1e6
+        for message_line in session.framer.feed(data):  # Complete lines only
             message_line = message_line.strip()  # Remove any leading/trailing spaces or newlines
+            session.received_ms = received_ms
+            session.event_time_ms = session.clock_sync.event_server_time(received_ms)
+            try:
+                session = self.dispatcher.dispatch(session, message_line) or session
+            except Exception as e:
+                session.log_timestamped(f"Error handling message '{message_line}': {e}")
+
+        # One cumulative ACK per read for resumable sessions
+        ack = session.reliable.pending_ack() if session.reliable else None
+        if ack is not None and session.connected:
+            self._send(session, f"SACK:{ack}", PRIORITY_REALTIME, sequenced=False)
+
+    # Handlers for the built-in message verbs, see MessageDispatcher
+    def _on_client_ready(self, session, fields, message_line):
+        # Handshake: "CLIENT_READY:<device_id>"; a bare CLIENT_READY (current
+        # iPad builds) is keyed by its IP, so its reconnects from a new port
+        # find the same session
+        device_id = ":".join(fields).strip() or self._legacy_device_id(session)
+        session = self._identify(session, device_id)
+        session.reliable = None
+        session.ready = True
+        session.log_event("iPad ready for the study")
+        session.journal_event("ready")
+        self.start_live_check(session)
+        self._deliver_pending(session)
+        return session
+
+    def _on_client_resume(self, session, fields, message_line):
+        # Handshake of a resumable client, see ReliableChannel:
+        # "CLIENT_RESUME:<device_id>:<token or ->:<last seq received>"
+        if len(fields) < 3:
+            session.log_timestamped(f"Invalid CLIENT_RESUME received: {message_line}")
+            return
+        device_id = ":".join(fields[:-2]).strip() or self._legacy_device_id(session)
+        token = fields[-2].strip()
+        peer_received = int(fields[-1])
+        # Past resume_window the messages held for the device are stale
+        # (an old EMA_START must not pop up hours later): start afresh
+        known = self.sessions.get(device_id)
+        expired = (known is not None and known.reliable is not None and known.disconnected_at is not None
+                   and time.monotonic() - known.disconnected_at >= self.resume_window)
+        session = self._identify(session, device_id)
+        session.ready = True
+
+        channel = session.reliable
+        if expired:
+            session.log_timestamped(f"Resume window expired, dropping {len(channel.unacked)} unacknowledged messages")
+        resumed = channel is not None and channel.token == token and not expired
+        if not resumed:
+            channel = session.reliable = ReliableChannel(self.resume_buffer_messages)
+        with channel.lock:
+            replay, missing = channel.resume(peer_received)
+            self._enqueue(session, f"SEQ_WELCOME:{channel.token}:{channel.received}\n", PRIORITY_REALTIME)
+            for message in replay:
+                self._enqueue(session, message, PRIORITY_REALTIME)
+            channel.paused = False
+
+        if resumed:
+            lost = f", {missing} lost from a full buffer" if missing else ""
+            session.log_event(f"iPad resumed its session, replaying {len(replay)} messages{lost}")
+        else:
+            session.log_event("iPad ready for the study (resumable session)")
+        session.journal_event("resumed" if resumed else "ready")
+        self.start_live_check(session)
+        self._deliver_pending(session)
+        return session
+
+    def _on_sequenced(self, session, fields, message_line):
+        # "SEQ:<n>:<message>"; replays of messages already handled are dropped
+        seq, _, inner = message_line.split(":", 1)[1].partition(":")
+        if session.reliable is not None and not session.reliable.accept(int(seq)):
+            return
+        return self.dispatcher.dispatch(session, inner.strip())
+
+    def _on_sack(self, session, fields, message_line):
+        if session.reliable is not None and fields:
+            session.reliable.on_ack(int(fields[0]))
+
+    def _on_ema_ack(self, session, fields, message_line):
+        session.audio_alert.stop_audio()
+        session.log_timestamped(f"Stop audio alert")
+        session.log_event(f"EMA_ACK: First 3 questions completed.")
+        session.increment_responded()
+
+    def _on_session_complete(self, session, fields, message_line):
+        session.log_event(f"Current session completed.")
+        session.increment_completed()
+        # Session boundary: make the EMA answers durable
+        self.log_writer.sync(session.ema_log_file)
+
+    def _on_battery(self, session, fields, message_line):
+        if len(fields) >= 2:
+            battery_level = float(fields[0].strip())
+            battery_status = fields[1].strip()
+            session.log_event(f"Battery Level: {int(battery_level*100)}, Status: {battery_status}")
+            device = session.device_id if len(self.sessions) > 1 else None
+            self.state.set(battery={"device": device, "level": battery_level, "status": battery_status})
+
+    def _on_live_check_ack(self, session, fields, message_line):
+        if not fields:
+            session.log_timestamped(f"Invalid LIVE_CHECK_ACK received")
+            return
 
-            if message_line == "CLIENT_READY":
-                self.log_timestamped("iPad ready for the study")
-                if self.live_check_thread is None or not self.live_check_thread.is_alive():
-                    self.live_check_running = True
-                    self.live_check_thread = threading.Thread(target=self.live_check_loop, daemon=True)
-                    self.live_check_thread.start()
-            elif message_line == "EMA_Session_ACK":
-                self.audio_alert.stop_audio()
-                self.log_timestamped(f"Stop audio alert")
-                self.log_timestamped(f"EMA_ACK: First 3 questions completed.")
-                self.ui.increment_responded()
-            elif message_line == "Session_Complete":
-                self.log_timestamped(f"Current session completed.")
-                self.ui.increment_completed()
-            elif message_line.startswith("BATTERY"):
-                message_parts = message_line.split(":")
-                if len(message_parts) >= 3:
-                    battery_level = float(message_parts[1].strip())
-                    battery_status = message_parts[2].strip()
-                    self.log_timestamped(f"Battery Level: {int(battery_level*100)}, Status: {battery_status}")
-                    if self.ui:
-                        self.ui.battery_level_label.config(text=f"Battery: {int(battery_level*100)}% ({battery_status})")
-            elif message_line.startswith("LIVE_CHECK_ACK"):
-                # Extract the live check ID from the response
-                message_parts = message_line.split(":")
-                if len(message_parts) > 1:
-                    ack_id = message_parts[1].replace("LIVE_CHECK", "").strip()
-                    # Check if the ACK matches the last sent ID
-                    if ack_id == self.last_live_check_id:
-                        latency_ms = None
-                        if len(message_parts) >= 4 and message_parts[2] == "LATENCY":
-                            try:
-                                latency_ms = float(message_parts[3].strip())
-                            except ValueError:
-                                pass
-                            #time.sleep(0.1)
-                            self.log_timestamped(f"Received LIVE_CHECK_ACK:{ack_id} - Latency: {latency_ms:.3f} ms")
-                        self.last_live_check_ack_time = time.time()
-                    else:
-                        #time.sleep(0.1)
-                        self.log_timestamped(f"Received LIVE_CHECK_ACK with unexpected ID: {ack_id}")
-                else:
-                    self.log_timestamped(f"Invalid LIVE_CHECK_ACK received")
-            elif message_line.startswith("BCI_Sync:"):
-                if self.ui.is_bci_enabled.get():
-                    #self.bci_handler.process_bci_data(message_line)
-                    #self.log_timestamped(f"Forwarded BCI_Sync message: {message}")
-                #else:
-                    self.log_timestamped(f"BCI data received but ignored (BCI disabled): {message}")
-            else:
-                self.log_ema_message(message_line)
+        # "LIVE_CHECK_ACK:<id>:LATENCY:<ms>", optionally followed by the iPad's
+        # receive and send times in epoch ms: ":T2:<ms>:T3:<ms>"
+        ack_id = fields[0].replace("LIVE_CHECK", "").strip()
+        values = {}
+        for name, value in zip(fields[1::2], fields[2::2]):
+            try:
+                values[name.strip()] = float(value.strip())
+            except ValueError:
+                session.log_timestamped(f"Invalid {name} in LIVE_CHECK_ACK:{ack_id}: {value}")
+        latency_ms = values.get("LATENCY")
+
+        # Any probe still in the window is matched, even if newer ones were sent since
+        probe = session.live_checks.ack(ack_id, latency_ms)
+        if probe is None:
+            session.log_timestamped(f"Received LIVE_CHECK_ACK with unexpected ID: {ack_id}")
+            return
+        rtt_ms, stamp_ms, sent_ms = probe
+
+        # Clock sync exchange. Without T2/T3, LATENCY is the iPad's receive
+        # time minus the stamp in the probe, and the iPad answers at once.
+        t2 = values.get("T2")
+        if t2 is None and latency_ms is not None:
+            t2 = stamp_ms + latency_ms
+        offset = ""
+        if t2 is not None:
+            offset_ms, _ = session.clock_sync.add_exchange(sent_ms, t2, values.get("T3", t2), session.received_ms)
+            offset = f", offset: {offset_ms:+.3f} ms"
+
+        latency = f"{latency_ms:.3f} ms" if latency_ms is not None else "n/a"
+        session.log_timestamped(f"Received LIVE_CHECK_ACK:{ack_id} - Latency: {latency}, RTT: {rtt_ms:.3f} ms{offset}")
+        session.last_live_check_ack_time = time.time()
+
+    def _on_bci_sync(self, session, fields, message_line):
+        if self.state.get("bci_enabled"):
+            #self.bci_handler.process_bci_data(message_line, at=session.event_time_ms / 1000)
+            #self.log_timestamped(f"Forwarded BCI_Sync message: {message}")
+        #else:
+            session.log_event(f"BCI data received but ignored (BCI disabled): {message_line}")
+
+    def start_live_check(self, session):
+        session.live_check_running = True
+        session.last_live_check_ack_time = time.time()
+        with self.connection_lock:
+            if self.live_check_task is None:
+                self.live_check_task = self.timers.call_every(self.live_check_interval, self.live_check_loop, first_delay=0)
 
-    # Periodically sends a live check signal
+    # Periodically sends a live check signal to every ready device
     def live_check_loop(self):
         clock_time = datetime.now().time()
 
@@ -267,185 +644,250 @@ class ConnectionManager:
             #self.live_check_interval = 3
         timeout_threshold = 100
 
-        if self.server_running and self.live_check_running and self.connection:
+        with self.connection_lock:
+            sessions = [session for session in self.connected_sessions() if session.live_check_running]
+            if not self.server_running or not sessions:
+                if self.live_check_task:
+                    self.live_check_task.cancel()
+                    self.live_check_task = None
+                return
+
+        for session in sessions:
             current_time = time.time()
 
             # Check if the last LIVE_CHECK_ACK was received within the timeout threshold
-            if (current_time - self.last_live_check_ack_time) > timeout_threshold:
-                self.log_timestamped("No LIVE_CHECK_ACK received in time, assuming iPad disconnected.")
-                self.handle_disconnection()
-                return  # Stop sending live checks
-            
+            if (current_time - session.last_live_check_ack_time) > timeout_threshold:
+                session.log_timestamped("No LIVE_CHECK_ACK received in time, assuming iPad disconnected.")
+                self.handle_disconnection(session)
+                continue  # Stop sending live checks to this device
+
             # Generate a unique ID for the live check
-            self.last_live_check_id = str(self.liveCheckIdCounter)
-            current_timestamp_ms = int(time.time() * 1000)
-            live_check_message = f"LIVE_CHECK:{self.last_live_check_id}:{current_timestamp_ms}"
+            probe_id, current_timestamp_ms = session.live_checks.next_probe()
+            live_check_message = f"LIVE_CHECK:{probe_id}:{current_timestamp_ms}"
 
             try:
-                self.last_live_check_time = time.time()
-                self.connection.sendall(live_check_message.encode('utf-8'))
-                #time.sleep(0.1)
-                self.log_timestamped(f"Sent LIVE_CHECK to iPad:{self.last_live_check_id}")
-
-                # Increment the counter and reset it if needed
-                self.liveCheckIdCounter = (self.liveCheckIdCounter + 1) % self.liveCheckIdLimit
+                # Restamp the probe when it actually leaves the queue
+                if self._send(session, live_check_message, PRIORITY_BACKGROUND,
+                              on_sent=lambda session=session, probe_id=probe_id: session.live_checks.mark_sent(probe_id)):
+                    session.log_timestamped(f"Sent LIVE_CHECK to iPad:{probe_id}")
+                else:
+                    session.live_checks.cancel(probe_id)
             except Exception as e:
-                self.log_timestamped(f"Error sending live check: {e}")
-                
-            threading.Timer(self.live_check_interval, self.live_check_loop).start()
-
-    def check_battery(self):
-        if self.connection:
-            self.connection.sendall("BATTERY".encode('utf-8'))
-            self.log_timestamped("Checking iPad Battery Status")
-        else:
+                session.live_checks.cancel(probe_id)
+                session.log_timestamped(f"Error sending live check: {e}")
+
+            if session.live_checks.sent and session.live_checks.sent % self.live_check_stats_every == 0:
+                session.log_timestamped(session.live_checks.describe())
+                session.log_timestamped(session.outbound.describe())
+                session.log_timestamped(session.clock_sync.describe())
+
+    def get_live_check_stats(self, device_id=None):
+        """Live check counters and RTT/latency percentiles, per device."""
+        if device_id is not None:
+            session = self.sessions.get(device_id)
+            return {device_id: session.live_checks.stats()} if session else {}
+        return {session.device_id: session.live_checks.stats() for session in list(self.sessions.values())}
+
+    def get_send_queue_stats(self, device_id=None):
+        """Per-lane sent/dropped counts and queueing delay, per device."""
+        if device_id is not None:
+            session = self.sessions.get(device_id)
+            return {device_id: session.outbound.stats()} if session else {}
+        return {session.device_id: session.outbound.stats() for session in list(self.sessions.values())}
+
+    def get_clock_sync_stats(self, device_id=None):
+        """Clock offset, drift and offset accuracy of each iPad against the server."""
+        if device_id is not None:
+            session = self.sessions.get(device_id)
+            return {device_id: session.clock_sync.stats()} if session else {}
+        return {session.device_id: session.clock_sync.stats() for session in list(self.sessions.values())}
+
+    def get_resume_stats(self, device_id=None):
+        """Sequencing and replay counters of each resumable device."""
+        sessions = [self.sessions.get(device_id)] if device_id is not None else list(self.sessions.values())
+        return {session.device_id: session.reliable.stats() for session in sessions if session and session.reliable}
+
+    def check_battery(self, device_id=None):
+        targets = self._target_sessions(device_id)
+        for session in targets:
+            self._send(session, "BATTERY", PRIORITY_BACKGROUND)
+            session.log_timestamped("Checking iPad Battery Status")
+
+        if not targets:
             self.log_timestamped("Battery Check Error: No client connected!")
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            timestamp = self.timers.wall_clock().strftime("%Y-%m-%d %H:%M:%S")
             self.reporter.send_email(
                 subject="Battery Check Failed - No Client Connected",
-                body=f"The server attempted to check the battery level of the iPad, but no iPad client was connected at {timestamp}"
+                body=f"The server attempted to check the battery level of the iPad, but no iPad client was connected at {timestamp}",
+                kind="battery_no_client", source=device_id or "iPad"
             )
 
-    def battery_check_loop(self):
-        while self.server_running:
-            time.sleep(self.battery_check_interval)
-            if self.connection:
-                self.check_battery()
-            else:
-                self.log_timestamped("Battery check skipped: No client connected.")
-
-    def bci_check_loop(self):
-        while self.server_running:
-            now = datetime.now().time()
-            start = dt_time(9, 0)   # 9:00 AM
-            end = dt_time(21, 0)    # 9:00 PM
+    def periodic_battery_check(self):
+        if self.connected_sessions():
+            self.check_battery()
+        else:
+            self.log_timestamped("Battery check skipped: No client connected.")
 
-            if start <= now <= end and self.ui.is_bci_enabled.get():
-                try:
-                    name = self.bci_handler.get_bci_subjectName()
-                    self.log_bci_timestamped(f"Periodic BCI2000 check: Subject ID: {name}")
-                except Exception as e:
-                    self.log_bci_timestamped(f"Error during BCI2000 check: {e}")
+    def periodic_bci_check(self):
+        now = self.timers.wall_clock().time()
+        start = dt_time(9, 0)   # 9:00 AM
+        end = dt_time(21, 0)    # 9:00 PM
 
-            time.sleep(self.bci_check_interval)
+        if start <= now <= end and self.state.get("bci_enabled"):
+            try:
+                name = self.bci_handler.get_bci_subjectName()
+                self.log_bci_timestamped(f"Periodic BCI2000 check: Subject ID: {name}")
+            except Exception as e:
+                self.log_bci_timestamped(f"Error during BCI2000 check: {e}")
 
     # Handles client disconnection
-    def handle_disconnection(self):
-        """Handles client disconnection."""
-        if self.connection:
-            self.log_timestamped(f"Client {self.address} disconnected.")
-            self.connection.close()
-            self.connection = None
-            self.live_check_running = False
+    def handle_disconnection(self, session=None):
+        """Handles disconnection of one device, or of every device if none is given."""
+        sessions = [session] if session else list(self.clients.values())
+        for session in sessions:
+            with self.connection_lock:
+                address = session.address
+                connection = session.detach()
+                if connection is None:
+                    continue
+                self.clients.pop(connection, None)
+            session.log_timestamped(f"Client {address} disconnected.")
+            session.journal_event("disconnected")
+            self._close_socket(connection)
+            self.log_writer.sync()
+
+    def _close_socket(self, connection):
+        try:
+            self.selector.unregister(connection)
+        except (KeyError, ValueError):
+            pass
+        connection.close()
 
     def get_next_start_time(self):
         return self.next_start_time
 
     def stop_server(self):
         self.server_running = False
-        self.live_check_running = False
-        if self.connection:
-            self.connection.close()
-            self.connection = None
+        for task in (self.live_check_task, self.battery_check_task, self.bci_check_task):
+            if task:
+                task.cancel()
+        self.handle_disconnection()
         if self.server:
-            self.server.close()
+            self._close_socket(self.server)
             self.server = None
+        # Wake the I/O loop so it can observe server_running and exit
+        self._wakeup()
+        self.pending_messages.close()
         self.log_timestamped("Server stopped")
+        self.log_writer.stop()
 
-    # Log and save server messages with timestamp
-    def log_timestamped(self, message):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S") + f".{datetime.now().microsecond // 1000:03d}"
-        server_log_message = f"{timestamp} - {message}"
-        print(server_log_message)
-        with open(self.server_log_file, "a") as log_file:
-            log_file.write(server_log_message + "\n")
-
-    def log_bci_timestamped(self, message):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S") + f".{datetime.now().microsecond // 1000:03d}"
-        server_log_message = f"{timestamp} - {message}"
-        #print(server_log_message)
-        with open(self.server_log_file, "a") as log_file:
-            log_file.write(server_log_message + "\n")
-    
-    # Log and save EMA messages with timestamp
-    def log_ema_message(self, message):
-        if not self.ema_log_file:
-            self.log_timestamped("Warning: Attempted to log EMA message before EMA session started.")
-            return  
-        with open(self.ema_log_file, "a") as log_file:
-            log_file.write(message.strip() + "\n")
+    # Log and save server messages with timestamp. All log writes are handed
+    # to the LogWriter thread, so callers never wait on the disk.
+    def log_timestamped(self, message, at=None):
+        self.log_writer.write(self.server_log_file, message, echo=True, at=at)
+
+    def log_bci_timestamped(self, message, at=None):
+        self.log_writer.write(self.server_log_file, message, at=at)
+
+    # Log and save EMA messages with timestamp, on the server timebase
+    def log_ema_message(self, message, session):
+        if not session.ema_log_file:
+            session.log_timestamped("Warning: Attempted to log EMA message before EMA session started.")
+            return
+        at = session.event_time_ms / 1000 if session.event_time_ms is not None else None
+        self.log_writer.write(session.ema_log_file, message.strip(), at=at)
 
     # Photodiode Latency Test
-    def start_photodiode_flicker_test(self):
-        if not self.connection:
+    def start_photodiode_flicker_test(self, device_id=None, frequency_hz=None, duty_cycle=None, pattern=None):
+        targets = self._target_sessions(device_id)
+        if not targets:
             self.log_timestamped("Photodiode test aborted: No client connected.")
             return
+        if self.photodiode_test_running:
+            self.log_timestamped("Photodiode test already running.")
+            return
 
         # Generate latency log file name if not already set
         if not self.latency_log_file:
             self.latency_log_file = os.path.join(self.latency_log_dir, f"photodiode_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
 
-        self.log_timestamped("Starting photodiode flicker test: Freq 2Hz)...")
+        frequency_hz = frequency_hz or self.photodiode_frequency_hz
+        duty_cycle = duty_cycle or self.photodiode_duty_cycle
+        pattern = pattern or self.photodiode_pattern
+        pattern_name = "square" if pattern == (1,) else ("PRBS" if not isinstance(pattern, (list, tuple, str)) else "".join(map(str, pattern)))
+
+        def send(signal, transition):
+            for session in targets:
+                # A stale flash is worse than none: never replayed on resume
+                self._send(session, f"{signal}\n", PRIORITY_REALTIME, sequenced=False,
+                           on_sent=lambda: engine.mark_sent(transition))
+
+        # Logging and BCI event marking run after the send, off the deadline
+        def after_send(transition):
+            color = "WHITE" if transition.signal == FLASH_ON else "BLACK"
+            at = engine.start_wall + (transition.actual_ns - engine.start_ns) / 1e9
+            self.log_latency_timestamped(
+                f"Sent photodiode signal: {transition.signal} - Screen color: {color} - "
+                f"intended +{(transition.intended_ns - engine.start_ns) / 1e6:.3f} ms, error {transition.error_ms:+.3f} ms",
+                at=at)
+            if self.state.get("bci_enabled"):
+                # Queued for the BCI2000 worker, stamped with when the flash was sent
+                if transition.signal == FLASH_ON:
+                    self.bci_handler.sync_bci_event("EmaColor", 1, at=at)   # 1 for white
+                else:
+                    self.bci_handler.sync_bci_event("EmaColor", 2, at=at)   # 2 for black
 
-        flicker_interval = 1.0  # 0.5 Hz => 2s per cycle => 1s per on/off
+        try:
+            engine = self.photodiode_engine = FlickerEngine(send, frequency_hz=frequency_hz, duty_cycle=duty_cycle,
+                                                            pattern=pattern, after_send=after_send)
+        except ValueError as e:
+            self.log_timestamped(f"Photodiode test aborted: {e}")
+            return
+        self.log_timestamped(f"Starting photodiode flicker test: {frequency_hz:g} Hz, duty cycle {duty_cycle:.0%}, pattern {pattern_name}...")
 
         self.photodiode_test_running = True
 
         def flicker_loop():
             try:
-                self.connection.sendall("FLASH_START\n".encode('utf-8'))
+                for session in targets:
+                    self._send(session, "FLASH_START\n", PRIORITY_REALTIME)
                 self.log_latency_timestamped("Sent photodiode signal: FLASH_START")
             except Exception as e:
                 self.log_latency_timestamped(f"Error sending FLASH_START: {e}")
+                self.photodiode_test_running = False
                 return
 
-            state = False  # Start with off
-            while self.photodiode_test_running and self.connection:
-                state = not state
-                signal = "FLASH_ON" if state else "FLASH_OFF"
-                try:
-                    self.connection.sendall(f"{signal}\n".encode('utf-8'))
-                    color = "WHITE" if signal == "FLASH_ON" else "BLACK"
-                    self.log_latency_timestamped(f"Sent photodiode signal: {signal} - Screen color: {color}")
-                    # BCI event marking after logging the latency timestamp
-                    if self.ui.is_bci_enabled.get():
-                        if not self.bci_handler.bci.connected:
-                            self.bci_handler.bci.Connect()
-                            self.bci_handler.bci.connected = True
-                        if signal == "FLASH_ON":
-                            self.bci_handler.bci.SetEventVariable("EmaColor", 1)    # 1 for white
-                        else:
-                            self.bci_handler.bci.SetEventVariable("EmaColor", 2)    # 2 for black
-                except Exception as e:
-                    self.log_latency_timestamped(f"Error sending photodiode signal: {e}")
-                    break
-                time.sleep(flicker_interval)
+            try:
+                engine.run(keep_running=lambda: self.photodiode_test_running and all(session.connected for session in targets))
+            except Exception as e:
+                self.log_latency_timestamped(f"Error sending photodiode signal: {e}")
 
             try:
-                self.connection.sendall("FLASH_END\n".encode('utf-8'))
+                for session in targets:
+                    self._send(session, "FLASH_END\n", PRIORITY_REALTIME)
                 self.log_latency_timestamped("Sent photodiode signal: FLASH_END")
             except Exception as e:
                 self.log_latency_timestamped(f"Error sending FLASH_END: {e}")
 
+            self.log_latency_timestamped(engine.describe())
             self.photodiode_test_running = False
 
-        threading.Thread(target=flicker_loop, daemon=True).start()
+        threading.Thread(target=flicker_loop, name="PhotodiodeFlicker", daemon=True).start()
 
-    def stop_photodiode_flicker_test(self):
+    def stop_photodiode_flicker_test(self, device_id=None):
         self.photodiode_test_running = False
-        if self.connection:
+        if self.photodiode_engine:
+            self.photodiode_engine.stop()
+        targets = self._target_sessions(device_id)
+        if not targets:
+            self.log_latency_timestamped("No client connected!")
+        for session in targets:
             try:
-                self.connection.sendall("FLASH_END\n".encode('utf-8'))
+                self._send(session, "FLASH_END\n", PRIORITY_REALTIME)
                 self.log_latency_timestamped("Sent photodiode signal: FLASH_END")
             except Exception as e:
                 self.log_latency_timestamped(f"Error sending FLASH_END: {e}")
-        else:
-            self.log_latency_timestamped("No client connected!")
 
 
-    def log_latency_timestamped(self, message):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S") + f".{datetime.now().microsecond // 1000:03d}"
-        log_message = f"{timestamp} - {message}"
-        print(log_message)
-        with open(self.latency_log_file, "a") as log_file:
-            log_file.write(log_message + "\n")
\ No newline at end of file
+    def log_latency_timestamped(self, message, at=None):
+        self.log_writer.write(self.latency_log_file, message, echo=True, at=at)
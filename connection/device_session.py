@@ -0,0 +1,144 @@
+import re
+import time
+import selectors
+from utils.scheduler.scheduler import Scheduler
+from utils.audio.audio_alert import AudioAlert
+from connection.frame_parser import LineFramer
+from connection.live_check_tracker import LiveCheckTracker
+from connection.clock_sync import ClockSync
+from connection.send_queue import OutboundQueue
+
+class DeviceSession:
+    """
+    State owned by one Unity client (one iPad).
+
+    A session is created when a socket is accepted and is keyed by the
+    device ID announced in the CLIENT_READY handshake. When the same device
+    reconnects, its existing session (counters, EMA log file, scheduler) is
+    re-attached to the new socket instead of starting over. Clients that
+    send a bare CLIENT_READY are keyed by their IP address, or by IP and
+    port for a second such device behind the same address.
+    """
+
+    def __init__(self, manager, connection, address):
+        self.manager = manager
+        self.connection = connection
+        self.address = address
+        # Until the handshake arrives the device is known by its address
+        self.device_id = f"{address[0]}:{address[1]}" if address else "unknown"
+        self.identified = False
+        self.legacy_ip = None   # set for clients keyed by IP (bare CLIENT_READY)
+        self.ready = False
+
+        # Line framer for incoming data from EMA
+        self.framer = LineFramer()
+
+        # Outbound messages, written by the I/O loop
+        self.outbound = OutboundQueue(max_bytes=manager.send_queue_limit)
+        self.selector_events = selectors.EVENT_READ
+
+        # Live check state
+        self.live_check_running = False
+        self.live_checks = LiveCheckTracker(window=manager.live_check_window, id_limit=manager.liveCheckIdLimit)
+        self.last_live_check_ack_time = time.time()
+
+        # Clock offset of this iPad, estimated from the live checks. Kept
+        # across reconnects: the iPad clock does not change with the socket.
+        self.clock_sync = ClockSync(window=manager.clock_sync_window)
+        # Sequencing for clients that resume sessions (see ReliableChannel);
+        # None for plain CLIENT_READY clients
+        self.reliable = None
+        self.disconnected_at = None     # time.monotonic() of the last disconnect
+
+        # Receive time and server-timebase time (epoch ms) of the inbound
+        # event being handled
+        self.received_ms = None
+        self.event_time_ms = None
+
+        # EMA log file of the current session on this device
+        self.ema_log_file = None
+
+        # Per-device counters; the UI shows the totals across devices
+        self.triggered_count = 0
+        self.responded_count = 0
+        self.completed_count = 0
+        self.ignored_count = 0
+
+        # Each device can run on its own EMA cadence
+        self.scheduler = Scheduler(self, timers=manager.timers, planner=manager.planner.derive(self.device_id))
+
+        self.audio_alert = AudioAlert(alert_interval=120, skip_callback=self.send_skip_signal, ui_instance=self, log_timestamped=self.log_timestamped, timers=manager.timers)
+
+    @property
+    def connected(self):
+        return self.connection is not None
+
+    @property
+    def file_tag(self):
+        """Device ID made safe for use in log file names."""
+        return re.sub(r"[^A-Za-z0-9_-]", "_", self.device_id)
+
+    def attach(self, other):
+        """Takes over the socket and unread data of a freshly accepted session."""
+        self.connection = other.connection
+        self.address = other.address
+        self.framer = other.framer
+        self.outbound = other.outbound
+        self.selector_events = other.selector_events
+        self.last_live_check_ack_time = time.time()
+        self.disconnected_at = None
+
+    def detach(self):
+        connection, self.connection = self.connection, None
+        self.ready = False
+        self.live_check_running = False
+        self.live_checks.reset()
+        self.framer = LineFramer()
+        self.outbound.clear()
+        self.selector_events = selectors.EVENT_READ
+        if connection is not None:
+            self.disconnected_at = time.monotonic()
+        if self.reliable:
+            # Keep numbering but stop writing until the device resumes
+            self.reliable.paused = True
+        return connection
+
+    # Hooks used by Scheduler and AudioAlert
+    def send_start_signal(self):
+        self.manager.send_start_signal(self.device_id)
+
+    def send_skip_signal(self):
+        self.manager.send_skip_signal(self.device_id)
+
+    def log_timestamped(self, message):
+        self.manager.log_timestamped(f"[{self.device_id}] {message}")
+
+    def log_event(self, message):
+        """Logs an inbound event stamped with its server-timebase time."""
+        at = self.event_time_ms / 1000 if self.event_time_ms is not None else None
+        self.manager.log_timestamped(f"[{self.device_id}] {message}", at=at)
+
+    def journal_event(self, event):
+        # Called on the I/O thread: written and fsynced by the journal's writer thread
+        if self.manager.journal is not None:
+            self.manager.journal.post("session", device=self.device_id, event=event)
+
+    def increment_triggered(self):
+        self.triggered_count += 1
+        self.manager.state.increment("triggered")
+        self.journal_event("triggered")
+
+    def increment_responded(self):
+        self.responded_count += 1
+        self.manager.state.increment("responded")
+        self.journal_event("responded")
+
+    def increment_completed(self):
+        self.completed_count += 1
+        self.manager.state.increment("completed")
+        self.journal_event("completed")
+
+    def increment_ignored(self):
+        self.ignored_count += 1
+        self.manager.state.increment("ignored")
+        self.journal_event("ignored")
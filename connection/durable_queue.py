@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+import time
+
+
+class DurableQueue:
+    """
+    Messages waiting for a device that is not connected, kept in an
+    append-only file so they survive a server restart.
+
+    Each line of the file is one JSON record:
+        {"op": "put", "id": 7, "device": "pad01" or null, "message": "EMA_START_Live",
+         "priority": 0, "queued": <epoch s>, "expires": <epoch s>}
+        {"op": "done", "id": 7}
+    A put is fsynced before put() returns; done records are only flushed,
+    losing one just means an expired or delivered entry is dropped on the
+    next take(). On open the file is replayed (a torn last line from a
+    crash is cut off, so the next put starts on a line of its own) and
+    rewritten without dead records once they make up more than half of it.
+    """
+
+    def __init__(self, path, fsync=True, compact_min_records=1024, clock=time.time):
+        self.path = path
+        self.clock = clock          # epoch seconds, for queueing times and expiry
+        self.fsync = fsync
+        self.compact_min_records = compact_min_records
+        self._lock = threading.Lock()
+        self._entries = {}      # id -> put record, in queueing order
+        self._next_id = 1
+        self._records = 0       # lines in the file
+        self.corrupt = 0        # unreadable lines skipped on recovery
+        self.expired = 0
+
+        self._recover()
+        self._file = open(self.path, "a", encoding="utf-8")
+        if self._records >= self.compact_min_records and self._records > 2 * len(self._entries):
+            self._compact()
+
+    def _recover(self):
+        if not os.path.exists(self.path):
+            return
+        valid_end = 0   # offset just past the last complete line
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    self.corrupt += 1
+                    break
+                valid_end += len(line)
+                self._records += 1
+                try:
+                    record = json.loads(line)
+                    if record["op"] == "put":
+                        self._entries[record["id"]] = record
+                        self._next_id = max(self._next_id, record["id"] + 1)
+                    else:
+                        self._entries.pop(record["id"], None)
+                except (ValueError, KeyError, TypeError):
+                    self.corrupt += 1
+        if os.path.getsize(self.path) > valid_end:
+            os.truncate(self.path, valid_end)
+
+    def _append(self, record, durable):
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+        if durable and self.fsync:
+            os.fsync(self._file.fileno())
+        self._records += 1
+
+    def _compact(self):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for record in self._entries.values():
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.replace(temp_path, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._records = len(self._entries)
+
+    def put(self, message, device_id=None, ttl=900, priority=0):
+        """Queues a message for one device (or the first one to connect) for `ttl` seconds."""
+        now = self.clock()
+        with self._lock:
+            record = {"op": "put", "id": self._next_id, "device": device_id, "message": message,
+                      "priority": priority, "queued": now, "expires": now + ttl}
+            self._next_id += 1
+            self._append(record, durable=True)
+            self._entries[record["id"]] = record
+        return record["id"]
+
+    def take(self, device_id):
+        """
+        Removes and returns the unexpired entries for a device, oldest first;
+        entries queued for any device go to the first one that asks.
+        """
+        now = self.clock()
+        taken = []
+        with self._lock:
+            for entry_id, record in list(self._entries.items()):
+                if record["device"] not in (None, device_id) and record["expires"] > now:
+                    continue
+                if record["expires"] > now:
+                    taken.append(record)
+                else:
+                    self.expired += 1
+                del self._entries[entry_id]
+                self._append({"op": "done", "id": entry_id}, durable=False)
+            if self._records >= self.compact_min_records and self._records > 2 * len(self._entries):
+                self._compact()
+        return taken
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self._entries),
+                "records": self._records,
+                "bytes": os.path.getsize(self.path),
+                "expired": self.expired,
+                "corrupt": self.corrupt,
+            }
+
+    def close(self):
+        with self._lock:
+            self._file.close()
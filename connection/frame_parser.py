@@ -0,0 +1,53 @@
+class LineFramer:
+    """
+    Splits the byte stream of one client into newline-terminated lines.
+
+    The bytes after the last newline are kept as the tail; it never holds
+    a newline, so each feed only scans the new data. A chunk without one
+    (the common case for fragmented packets) is appended to the tail,
+    which is plain bytes while short (cheapest per call) and becomes a
+    bytearray, appended in place, once a partial line grows long. When
+    lines complete, the tail and the new bytes up to the last newline are
+    decoded and split in one pass, so a long backlog (e.g. thousands of
+    EMA lines queued during a reconnect) is framed in linear time. Only
+    complete lines are decoded, so a multibyte UTF-8 character split
+    across two recv() calls is never broken.
+    """
+
+    def __init__(self, max_line_length=1024 * 1024, grow_in_place=4096):
+        self._tail = b""   # the incomplete last line, never holds a newline
+        self.max_line_length = max_line_length
+        self.grow_in_place = grow_in_place
+        self.dropped_bytes = 0
+
+    def feed(self, data):
+        """Adds received bytes and returns the list of complete lines, decoded."""
+        end = data.rfind(b"\n")
+        if end < 0:
+            self._tail += data
+            if len(self._tail) > self.grow_in_place:
+                self._grow()
+            return []
+
+        # Everything up to the last newline is a run of complete lines:
+        # decode and split it in one pass, keep only what follows. (The
+        # size of the new tail is checked when the next chunk is appended.)
+        lines = (self._tail + data[:end]).decode('utf-8', 'replace').split("\n")
+        self._tail = data[end + 1:]
+        return lines
+
+    def _grow(self):
+        tail = self._tail
+        # A client that never sends a newline must not grow memory forever
+        if len(tail) > self.max_line_length:
+            self.dropped_bytes += len(tail)
+            self._tail = b""
+        elif type(tail) is bytes:
+            self._tail = bytearray(tail)   # long partial line: append in place from now on
+
+    def pending(self):
+        """Number of buffered bytes that do not form a complete line yet."""
+        return len(self._tail)
+
+    def clear(self):
+        self._tail = b""
@@ -0,0 +1,188 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+class LatencyHistogram:
+    """
+    Streaming latency statistics in fixed memory.
+
+    Samples (in ms) go into log-spaced buckets with a relative width of
+    `precision`, so percentiles are accurate to about that fraction no matter
+    how many samples are recorded. Jitter is the RFC 3550 running estimate
+    of the difference between consecutive samples.
+    """
+
+    def __init__(self, min_ms=0.01, max_ms=120000.0, precision=0.02):
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self._log_base = math.log1p(precision)
+        self._counts = [0] * (self._bucket(max_ms) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.jitter = 0.0
+        self._previous = None
+
+    def _bucket(self, value):
+        if value <= self.min_ms:
+            return 0
+        return int(math.log(value / self.min_ms) / self._log_base) + 1
+
+    def _bucket_value(self, index):
+        # Geometric middle of the bucket
+        if index == 0:
+            return self.min_ms
+        return self.min_ms * math.exp((index - 0.5) * self._log_base)
+
+    def record(self, value):
+        value = min(max(value, 0.0), self.max_ms)
+        self._counts[self._bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+        if self._previous is not None:
+            self.jitter += (abs(value - self._previous) - self.jitter) / 16
+        self._previous = value
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for index, bucket_count in enumerate(self._counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(max(self._bucket_value(index), self.minimum), self.maximum)
+        return self.maximum
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.minimum,
+            "max": self.maximum,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "jitter": self.jitter,
+        }
+
+
+class LiveCheckTracker:
+    """
+    Live check probes of one device, with a window of outstanding IDs.
+
+    Every probe keeps its perf_counter_ns send time until it is acknowledged
+    or pushed out of the window, so an ACK that arrives after the next probe
+    has been sent is still matched. The server-side RTT and the RTT reported
+    by the iPad (the LATENCY field) are kept in separate histograms.
+    Each probe also keeps its wall-clock (epoch ms) stamp and send time for
+    clock synchronization, see ClockSync.
+    """
+
+    def __init__(self, window=64, id_limit=1000):
+        if window >= id_limit:
+            raise ValueError("Live check window must be smaller than the ID range")
+        self.window = window
+        self.id_limit = id_limit
+        self.next_id = 0
+        self.outstanding = OrderedDict()   # probe ID -> [perf_counter_ns, stamped epoch ms, sent epoch ms]
+        # Probes are sent from the timer thread and ACKs matched on the I/O thread
+        self._lock = threading.Lock()
+        self.rtt = LatencyHistogram()
+        self.client_latency = LatencyHistogram()
+        self.sent = 0
+        self.acked = 0
+        self.late = 0
+        self.lost = 0
+        self.unknown = 0
+
+    @property
+    def last_id(self):
+        return next(reversed(self.outstanding), None)
+
+    def next_probe(self):
+        """
+        Allocates the next probe ID and stamps its send time.
+        Returns (probe ID, epoch ms stamp to put in the LIVE_CHECK message).
+        """
+        stamp_ms = time.time_ns() // 1_000_000
+        with self._lock:
+            probe_id = str(self.next_id)
+            self.next_id = (self.next_id + 1) % self.id_limit
+            if len(self.outstanding) >= self.window:
+                self.outstanding.popitem(last=False)
+                self.lost += 1
+            self.sent += 1
+            self.outstanding[probe_id] = [time.perf_counter_ns(), stamp_ms, stamp_ms]
+        return probe_id, stamp_ms
+
+    def mark_sent(self, probe_id):
+        """Restamps a probe with the time it actually left the send queue."""
+        with self._lock:
+            probe = self.outstanding.get(probe_id)
+            if probe is not None:
+                probe[0] = time.perf_counter_ns()
+                probe[2] = time.time_ns() / 1e6
+
+    def cancel(self, probe_id):
+        """Forgets a probe that could not be sent."""
+        with self._lock:
+            if self.outstanding.pop(probe_id, None) is not None:
+                self.sent -= 1
+
+    def ack(self, probe_id, client_latency_ms=None):
+        """
+        Matches an ACK to its probe. Returns (RTT in ms, stamped epoch ms,
+        sent epoch ms), or None for an unknown ID.
+        """
+        received = time.perf_counter_ns()
+        with self._lock:
+            is_latest = probe_id == self.last_id
+            probe = self.outstanding.pop(probe_id, None)
+            if probe is None:
+                self.unknown += 1
+                return None
+
+            sent, stamp_ms, sent_ms = probe
+            rtt_ms = (received - sent) / 1e6
+            self.acked += 1
+            if not is_latest:
+                self.late += 1
+            self.rtt.record(rtt_ms)
+            if client_latency_ms is not None:
+                self.client_latency.record(client_latency_ms)
+        return rtt_ms, stamp_ms, sent_ms
+
+    def reset(self):
+        """Drops outstanding probes, e.g. on disconnect. Statistics are kept."""
+        with self._lock:
+            self.lost += len(self.outstanding)
+            self.outstanding.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sent": self.sent,
+                "acked": self.acked,
+                "late": self.late,
+                "lost": self.lost,
+                "unknown": self.unknown,
+                "outstanding": len(self.outstanding),
+                "rtt_ms": self.rtt.summary(),
+                "client_latency_ms": self.client_latency.summary(),
+            }
+
+    def describe(self):
+        """One-line summary for the server log."""
+        def fmt(value):
+            return "n/a" if value is None else f"{value:.2f}"
+        with self._lock:
+            rtt = self.rtt.summary()
+            client = self.client_latency.summary()
+        return (f"Live check stats: sent {self.sent}, acked {self.acked} ({self.late} late), lost {self.lost} - "
+                f"RTT p50 {fmt(rtt['p50'])} / p95 {fmt(rtt['p95'])} / p99 {fmt(rtt['p99'])} ms, jitter {fmt(rtt['jitter'])} ms - "
+                f"iPad latency p50 {fmt(client['p50'])} / p95 {fmt(client['p95'])} / p99 {fmt(client['p99'])} ms")
@@ -0,0 +1,39 @@
+class MessageDispatcher:
+    """
+    Routes inbound protocol lines to handlers by their verb.
+
+    The verb is the text before the first ':' (the whole line if there is
+    none), so every line costs one partition and one dict lookup. Handlers
+    are called as handler(session, fields, line), where fields are the
+    ':'-separated parts after the verb. Lines with an unknown verb (the EMA
+    payload lines) go to the default handler as default_handler(session, line)
+    without being split.
+
+    Handlers may return a session to continue with, which lets the handshake
+    hand the rest of a batch over to the session it re-attached to.
+    Plugins can add verbs with register() without touching ConnectionManager.
+    """
+
+    def __init__(self, default_handler=None):
+        self._handlers = {}
+        self.default_handler = default_handler
+
+    def register(self, verb, handler):
+        if ":" in verb:
+            raise ValueError(f"Message verb cannot contain ':': {verb}")
+        self._handlers[verb] = handler
+
+    def unregister(self, verb):
+        self._handlers.pop(verb, None)
+
+    def verbs(self):
+        return list(self._handlers)
+
+    def dispatch(self, session, line):
+        verb, separator, rest = line.partition(":")
+        handler = self._handlers.get(verb)
+        if handler is None:
+            if self.default_handler:
+                return self.default_handler(session, line)
+            return None
+        return handler(session, rest.split(":") if separator else [], line)
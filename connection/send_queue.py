@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import deque
+from connection.live_check_tracker import LatencyHistogram
+
+# Priority lanes, drained in this order
+PRIORITY_REALTIME = 0       # FLASH_*, EMA_START_*, EMA_SKIP
+PRIORITY_NORMAL = 1         # operator messages
+PRIORITY_BACKGROUND = 2     # BATTERY, LIVE_CHECK
+LANE_NAMES = ("realtime", "normal", "background")
+
+
+class OutboundQueue:
+    """
+    Messages waiting to be written to one client socket.
+
+    Any thread may put() a message; only the I/O loop writes, so a stalled
+    socket never blocks the caller and concurrent writers cannot interleave.
+    Each message is written with its own send() call (never merged with the
+    next one), realtime messages first. When more than max_bytes are queued,
+    background messages are dropped to make room and new normal/background
+    messages are refused; realtime messages are always accepted.
+    The time each message spent queued is recorded per lane.
+    """
+
+    def __init__(self, max_bytes=256 * 1024):
+        self.max_bytes = max_bytes
+        self._lanes = tuple(deque() for _ in LANE_NAMES)
+        self._lock = threading.Lock()
+        self.queued_bytes = 0
+        self._current = None    # [remaining memoryview, message entry, lane] being written
+        self.sent = [0] * len(LANE_NAMES)
+        self.dropped = [0] * len(LANE_NAMES)
+        self.delay = [LatencyHistogram() for _ in LANE_NAMES]
+
+    def __len__(self):
+        return sum(len(lane) for lane in self._lanes) + (self._current is not None)
+
+    def put(self, data, priority=PRIORITY_NORMAL, on_sent=None):
+        """Queues a message. Returns False if it was refused by backpressure."""
+        with self._lock:
+            if self.queued_bytes + len(data) > self.max_bytes and priority != PRIORITY_REALTIME:
+                background = self._lanes[PRIORITY_BACKGROUND]
+                while background and self.queued_bytes + len(data) > self.max_bytes and priority != PRIORITY_BACKGROUND:
+                    dropped_data, _, _ = background.popleft()
+                    self.queued_bytes -= len(dropped_data)
+                    self.dropped[PRIORITY_BACKGROUND] += 1
+                if self.queued_bytes + len(data) > self.max_bytes:
+                    self.dropped[priority] += 1
+                    return False
+            self._lanes[priority].append((data, time.perf_counter_ns(), on_sent))
+            self.queued_bytes += len(data)
+        return True
+
+    def _next(self):
+        with self._lock:
+            for lane, messages in enumerate(self._lanes):
+                if messages:
+                    entry = messages.popleft()
+                    return [memoryview(entry[0]), entry, lane]
+        return None
+
+    def write_to(self, sock):
+        """
+        Writes queued messages to a non-blocking socket until it would block.
+        Returns True once the queue is empty. Socket errors are raised.
+        """
+        while True:
+            if self._current is None:
+                self._current = self._next()
+                if self._current is None:
+                    return True
+
+            current = self._current
+            view, entry, lane = current
+            try:
+                written = sock.send(view)
+            except BlockingIOError:
+                return False
+            if written < len(view):
+                current[0] = view[written:]
+                return False
+
+            # Message fully handed to the kernel
+            self._current = None
+            data, enqueued_ns, on_sent = entry
+            with self._lock:
+                self.queued_bytes = max(0, self.queued_bytes - len(data))
+                self.sent[lane] += 1
+                self.delay[lane].record((time.perf_counter_ns() - enqueued_ns) / 1e6)
+            if on_sent:
+                on_sent()
+
+    def clear(self):
+        """Drops everything still queued, e.g. when the socket is gone."""
+        with self._lock:
+            for lane, messages in enumerate(self._lanes):
+                self.dropped[lane] += len(messages)
+                messages.clear()
+            if self._current is not None:
+                self.dropped[self._current[2]] += 1
+                self._current = None
+            self.queued_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    "queued": len(self._lanes[lane]),
+                    "sent": self.sent[lane],
+                    "dropped": self.dropped[lane],
+                    "delay_ms": self.delay[lane].summary(),
+                }
+                for lane, name in enumerate(LANE_NAMES)
+            }
+
+    def describe(self):
+        """One-line summary of queueing delay for the server log."""
+        parts = []
+        with self._lock:
+            for lane, name in enumerate(LANE_NAMES):
+                p50 = self.delay[lane].percentile(50)
+                p99 = self.delay[lane].percentile(99)
+                if p50 is None:
+                    continue
+                parts.append(f"{name} {self.sent[lane]} sent/{self.dropped[lane]} dropped, p50 {p50:.2f} / p99 {p99:.2f} ms")
+        return "Send queue: " + ("; ".join(parts) if parts else "idle")
@@ -0,0 +1,103 @@
+import secrets
+import threading
+from collections import deque
+
+class ReliableChannel:
+    """
+    Sequence numbers, cumulative ACKs and a bounded retransmit buffer for
+    one device, so a dropped Wi-Fi connection can be resumed without losing
+    the messages that were in flight.
+
+    Protocol (only used by clients that ask for it):
+        iPad -> server  CLIENT_RESUME:<device_id>:<token or ->:<last seq received>
+        server -> iPad  SEQ_WELCOME:<token>:<last seq received>
+        either way      SEQ:<n>:<message>   sequenced message
+                        SACK:<n>            everything up to n was received
+    After SEQ_WELCOME both sides replay their unacknowledged messages after
+    the peer's last received seq. A token the server does not know (e.g.
+    after a server restart) starts a new channel; the iPad then replays
+    all its unacknowledged messages under new numbers.
+    In resumable mode every server message ends with a newline; live checks
+    and battery requests are not sequenced, there is no point replaying them.
+
+    Callers hold `lock` around wrap() and queueing the result, so messages
+    hit the wire in seq order; while `paused` (no socket) they are only kept.
+    """
+
+    def __init__(self, max_messages=256, max_bytes=256 * 1024):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.token = secrets.token_hex(8)
+        self.next_seq = 1
+        self.received = 0           # highest seq received from the iPad
+        self.acked_received = 0     # highest seq we have acknowledged
+        self.unacked = deque()      # (seq, wrapped message), oldest first
+        self.unacked_bytes = 0
+        self.evicted = 0            # messages dropped from a full buffer
+        self.replayed = 0
+        self.duplicates = 0
+        self.paused = False
+        self.lock = threading.RLock()
+
+    def wrap(self, message):
+        """Numbers an outgoing message and keeps it until acknowledged."""
+        with self.lock:
+            wrapped = f"SEQ:{self.next_seq}:{message}\n"
+            self.unacked.append((self.next_seq, wrapped))
+            self.unacked_bytes += len(wrapped)
+            self.next_seq += 1
+            while self.unacked and (len(self.unacked) > self.max_messages or self.unacked_bytes > self.max_bytes):
+                _, dropped = self.unacked.popleft()
+                self.unacked_bytes -= len(dropped)
+                self.evicted += 1
+        return wrapped
+
+    def on_ack(self, seq):
+        with self.lock:
+            while self.unacked and self.unacked[0][0] <= seq:
+                _, message = self.unacked.popleft()
+                self.unacked_bytes -= len(message)
+
+    def accept(self, seq):
+        """True if an incoming seq is new, False for a replayed duplicate."""
+        with self.lock:
+            if seq <= self.received:
+                self.duplicates += 1
+                return False
+            # A gap means the iPad's buffer overflowed; take what arrives
+            self.received = seq
+            return True
+
+    def pending_ack(self):
+        """The cumulative ACK to send, or None if nothing new arrived since the last one."""
+        with self.lock:
+            if self.received == self.acked_received:
+                return None
+            self.acked_received = self.received
+            return self.received
+
+    def resume(self, peer_received):
+        """
+        Messages to replay after the peer's last received seq, and how many
+        of those were already evicted from the buffer.
+        """
+        self.on_ack(peer_received)
+        with self.lock:
+            replay = [message for _, message in self.unacked]
+            first = self.unacked[0][0] if self.unacked else self.next_seq
+            self.replayed += len(replay)
+            # SEQ_WELCOME carries our receive position
+            self.acked_received = self.received
+        return replay, max(0, first - peer_received - 1)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "next_seq": self.next_seq,
+                "received": self.received,
+                "unacked": len(self.unacked),
+                "unacked_bytes": self.unacked_bytes,
+                "evicted": self.evicted,
+                "replayed": self.replayed,
+                "duplicates": self.duplicates,
+            }
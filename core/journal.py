@@ -0,0 +1,270 @@
+import json
+import os
+import queue
+import sys
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+COUNTS_RECORD = "counters"
+_STOP = object()
+
+
+class Journal:
+    """
+    Append-only write-ahead journal of typed events, one segment per day
+    (<dir>/<YYYY-MM-DD>.wal), with the day's folded state snapshotted to a
+    sidecar (<date>.snap) every `snapshot_every` records.
+
+    A record is one line, "<crc32 hex>\\t<json>", where the JSON has the
+    event type ("type"), its wall time ("t") and its fields. Record types:
+        counters    {"values": {"triggered": 3, ...}}  absolute counter values
+        session     {"device": ..., "event": "completed"}
+        report      {"values": {...}}                   the daily report went out
+    Appends are O(1): one write, one flush and, with fsync, one fsync.
+    post() is the same without waiting: the record is stamped at once and
+    written by a background thread, which drains everything queued and
+    fsyncs it as one batch. The network thread journals session events
+    this way so it never waits on the disk.
+    Recovery loads the snapshot and replays only the records after it; a
+    record with a bad checksum ends the segment (a torn write from a crash)
+    and is cut off when the segment is reopened for appending.
+    """
+
+    def __init__(self, directory, snapshot_every=256, fsync=True, clock=datetime.now):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.clock = clock
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = None
+        self.day = None
+        self.state = None           # folded state of the open day, see fold()
+        self.corrupt = 0            # records cut off during recovery
+        self._queue = queue.SimpleQueue()
+        self._writer = None         # started by the first post()
+        self._open(self.clock().date())
+
+    # Layout
+    def segment_path(self, day):
+        return os.path.join(self.directory, f"{day.isoformat()}.wal")
+
+    def snapshot_path(self, day):
+        return os.path.join(self.directory, f"{day.isoformat()}.snap")
+
+    @staticmethod
+    def empty_state():
+        return {"counters": {}, "reported": None, "sessions": {}, "records": 0}
+
+    @staticmethod
+    def fold(state, record):
+        """Applies one record to a day's state."""
+        kind = record["type"]
+        if kind == COUNTS_RECORD:
+            state["counters"].update(record["values"])
+        elif kind == "session":
+            state["sessions"][record["event"]] = state["sessions"].get(record["event"], 0) + 1
+        elif kind == "report":
+            state["reported"] = record["values"]
+        state["records"] += 1
+
+    # Encoding
+    @staticmethod
+    def encode(record):
+        payload = json.dumps(record, separators=(",", ":"))
+        return f"{zlib.crc32(payload.encode('utf-8')):08x}\t{payload}\n"
+
+    @staticmethod
+    def decode(line):
+        """The record of a line, or None if it is torn or fails its checksum."""
+        if not line.endswith("\n"):
+            return None
+        checksum, _, payload = line[:-1].partition("\t")
+        try:
+            if int(checksum, 16) != zlib.crc32(payload.encode('utf-8')):
+                return None
+            return json.loads(payload)
+        except ValueError:
+            return None
+
+    # Reading
+    def _read_snapshot(self, day):
+        try:
+            with open(self.snapshot_path(day), encoding="utf-8") as f:
+                snapshot = self.decode(f.read())
+        except OSError:
+            return None
+        if snapshot is None or snapshot["offset"] > self._size(day):
+            return None
+        return snapshot
+
+    def _size(self, day):
+        try:
+            return os.path.getsize(self.segment_path(day))
+        except OSError:
+            return 0
+
+    def _replay(self, day, offset, state, on_record=None):
+        """Folds the valid records from `offset`; returns where the valid part of the segment ends."""
+        path = self.segment_path(day)
+        if not os.path.exists(path):
+            return 0
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for raw in f:
+                record = self.decode(raw.decode('utf-8', errors='replace'))
+                if record is None:
+                    break
+                self.fold(state, record)
+                if on_record:
+                    on_record(record)
+                offset += len(raw)
+        return offset
+
+    def day_state(self, day):
+        """The folded state of a day: its snapshot plus the records after it."""
+        with self._lock:
+            if day == self.day:
+                return json.loads(json.dumps(self.state))
+        snapshot = self._read_snapshot(day)
+        state = snapshot["state"] if snapshot else self.empty_state()
+        self._replay(day, snapshot["offset"] if snapshot else 0, state)
+        return state
+
+    @staticmethod
+    def totals(state):
+        """A day's counters including those already reported (and then reset)."""
+        totals = dict(state["reported"] or {})
+        for key, value in state["counters"].items():
+            totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def days(self, start, end):
+        """{day: folded state} for every day in [start, end] that has a segment."""
+        result = {}
+        day = start
+        while day <= end:
+            if os.path.exists(self.segment_path(day)):
+                result[day] = self.day_state(day)
+            day += timedelta(days=1)
+        return result
+
+    def records(self, start, end, kind=None):
+        """Every valid record of the days in [start, end], oldest first."""
+        day = start
+        while day <= end:
+            found = []
+            self._replay(day, 0, self.empty_state(), found.append)
+            for record in found:
+                if kind is None or record["type"] == kind:
+                    yield record
+            day += timedelta(days=1)
+
+    # Writing
+    def _open(self, day):
+        if self._file:
+            self._write_snapshot()
+            self._file.close()
+        self.day = day
+        snapshot = self._read_snapshot(day)
+        self.state = snapshot["state"] if snapshot else self.empty_state()
+        valid_end = self._replay(day, snapshot["offset"] if snapshot else 0, self.state)
+        self._file = open(self.segment_path(day), "ab")
+        if self._file.tell() > valid_end:
+            self.corrupt += 1
+            self._file.truncate(valid_end)
+            self._file.seek(valid_end)
+        self._since_snapshot = 0
+
+    def _write_snapshot(self):
+        temp_path = self.snapshot_path(self.day) + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.encode({"offset": self._file.tell(), "state": self.state}))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path(self.day))
+        self._since_snapshot = 0
+
+    def _sync(self):
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _write(self, entries):
+        """Writes (time, type, fields) entries with one flush and fsync; returns their records."""
+        records = []
+        with self._lock:
+            for now, kind, fields in entries:
+                record = {"type": kind, "t": round(now.timestamp(), 3), **fields}
+                if now.date() != self.day:
+                    self._sync()
+                    self._open(now.date())
+                self._file.write(self.encode(record).encode('utf-8'))
+                self.fold(self.state, record)
+                self._since_snapshot += 1
+                records.append(record)
+            self._sync()
+            if self._since_snapshot >= self.snapshot_every:
+                self._write_snapshot()
+        return records
+
+    def append(self, kind, **fields):
+        """Writes one record to today's segment and returns it."""
+        return self._write([(self.clock(), kind, fields)])[0]
+
+    def post(self, kind, **fields):
+        """Queues one record for the writer thread; safe from any thread, never touches the disk."""
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._run, name="Journal", daemon=True)
+                    self._writer.start()
+        self._queue.put((self.clock(), kind, fields))
+
+    def flush(self, timeout=5):
+        """Blocks until every posted record is written."""
+        if self._writer is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def _run(self):
+        while True:
+            # Drain whatever is already queued as one batch
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            entries = [item for item in items if isinstance(item, tuple)]
+            if entries:
+                try:
+                    self._write(entries)
+                except (OSError, ValueError) as e:
+                    print(f"Journal: failed to write {len(entries)} records: {e}", file=sys.stderr)
+            for item in items:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if _STOP in items:
+                return
+
+    def counters(self):
+        """Today's counters, as of the last record."""
+        with self._lock:
+            if self.clock().date() != self.day:
+                self._open(self.clock().date())
+            return dict(self.state["counters"])
+
+    def close(self):
+        if self._writer is not None:
+            self._queue.put(_STOP)
+            self._writer.join(5)
+        with self._lock:
+            if self._file:
+                self._write_snapshot()
+                self._file.close()
+                self._file = None
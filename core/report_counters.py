@@ -0,0 +1,74 @@
+import os
+import threading
+from datetime import datetime
+from core.journal import COUNTS_RECORD
+from core.state_store import COUNTERS
+
+
+class ReportCounters:
+    """
+    Keeps today's EMA counters in the Journal, which ExperimentReporter
+    reads at night: loads them into the store at startup and journals their
+    values when a counter changes.
+
+    With `timers`, a burst of changes is journaled once, save_delay seconds
+    after the first of them; without, every change is journaled at once.
+    """
+
+    def __init__(self, state, journal, timers=None, save_delay=0.5):
+        self.state = state
+        self.journal = journal
+        self.timers = timers
+        self.save_delay = save_delay
+        self._lock = threading.Lock()
+        self._pending = None
+        self.writes = 0
+
+        self.load()
+        self.unsubscribe = state.subscribe(self._changed, keys=COUNTERS)
+
+    def load(self):
+        counts = self.journal.counters()
+        if not counts:
+            counts = self._load_legacy()
+        self.state.set(**{key: counts[key] for key in COUNTERS if key in counts})
+
+    def _load_legacy(self):
+        # Counters written before the journal: "Triggered: n, Responded: n, ..."
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        file_path = os.path.join(project_root, "logs", "email_report", f"{datetime.now().strftime('%Y-%m-%d')}.unsent.txt")
+        counts = {}
+        if os.path.exists(file_path):
+            try:
+                with open(file_path, "r") as f:
+                    for part in f.read().split(","):
+                        key, val = part.strip().split(":")
+                        counts[key.strip().lower()] = int(val.strip())
+            except Exception as e:
+                print(f"Failed to load counters from file: {e}")
+        return counts
+
+    def _changed(self, changes):
+        if self.timers is None:
+            self.save()
+            return
+        with self._lock:
+            if self._pending is None:
+                self._pending = self.timers.call_later(self.save_delay, self.flush)
+
+    def flush(self):
+        """Journals a pending change now."""
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is not None:
+            pending.cancel()
+            self.save()
+
+    def save(self):
+        _, state = self.state.snapshot()
+        self.journal.append(COUNTS_RECORD, values={key: state[key] for key in COUNTERS})
+        self.writes += 1
+
+    def close(self):
+        self.unsubscribe()
+        self.flush()
@@ -0,0 +1,88 @@
+import threading
+
+COUNTERS = ("triggered", "responded", "completed", "ignored")
+
+
+class StateStore:
+    """
+    App state shared by the server threads and the optional Tk UI: mode
+    flags, the daily EMA counters, the last battery report and the EMA
+    start times.
+
+    Reads and writes are atomic (one lock, held only to copy or update).
+    subscribe(callback, keys) calls callback(changes) on the writing thread
+    after the lock is released, so subscribers must be quick and must not
+    touch Tk; the UI reads the store from root.after() callbacks instead.
+    """
+
+    DEFAULTS = {
+        "bci_enabled": False,
+        "test_mode": True,
+        "triggered": 0,
+        "responded": 0,
+        "completed": 0,
+        "ignored": 0,
+        "battery": None,        # {"device": id or None, "level": 0..1, "status": str}
+        "last_start": None,     # datetime of the last EMA start
+        "next_start": None,     # datetime of the next scheduled EMA start
+    }
+
+    def __init__(self, **initial):
+        self._lock = threading.Lock()
+        self._state = dict(self.DEFAULTS)
+        unknown = set(initial) - set(self._state)
+        if unknown:
+            raise KeyError(f"Unknown state keys: {', '.join(sorted(unknown))}")
+        self._state.update(initial)
+        self._subscribers = []      # (callback, keys or None)
+        self.version = 0            # bumped on every change
+
+    def get(self, key):
+        with self._lock:
+            return self._state[key]
+
+    def snapshot(self):
+        """(version, copy of the whole state), read atomically."""
+        with self._lock:
+            return self.version, dict(self._state)
+
+    def set(self, **changes):
+        with self._lock:
+            for key in changes:
+                if key not in self._state:
+                    raise KeyError(f"Unknown state key: {key}")
+            changes = {key: value for key, value in changes.items() if self._state[key] != value}
+            if not changes:
+                return
+            self._state.update(changes)
+            self.version += 1
+            subscribers = list(self._subscribers)
+        self._notify(subscribers, changes)
+
+    def increment(self, key, by=1):
+        """Adds to a counter and returns the new value."""
+        with self._lock:
+            value = self._state[key] + by
+            self._state[key] = value
+            self.version += 1
+            subscribers = list(self._subscribers)
+        self._notify(subscribers, {key: value})
+        return value
+
+    def subscribe(self, callback, keys=None):
+        """Calls callback(changes) when any of `keys` (default: any key) changes. Returns an unsubscribe function."""
+        entry = (callback, frozenset(keys) if keys is not None else None)
+        with self._lock:
+            self._subscribers.append(entry)
+
+        def unsubscribe():
+            with self._lock:
+                if entry in self._subscribers:
+                    self._subscribers.remove(entry)
+        return unsubscribe
+
+    @staticmethod
+    def _notify(subscribers, changes):
+        for callback, keys in subscribers:
+            if keys is None or not keys.isdisjoint(changes):
+                callback(changes)
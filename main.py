@@ -1,11 +1,24 @@
+import os
 import tkinter as tk
 from ui.ui_handler import UI
 from connection.connection_handler import ConnectionManager
+from core.journal import Journal
+from core.report_counters import ReportCounters
+from core.state_store import StateStore
 from utils.qrcode.qrcode_display import QRCodeDisplay
 from utils.reporter.experiment_reporter import ExperimentReporter
+from utils.scheduler.timer_scheduler import TimerScheduler
 
 if __name__ == '__main__':
-    ui = UI(None)
+    # Single thread for every timed task in the app
+    timers = TimerScheduler()
+
+    # State shared by the server threads and the UI (see main_headless.py
+    # for running without Tk)
+    state = StateStore()
+    journal = Journal(os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "journal"))
+    counters = ReportCounters(state, journal, timers=timers)
+    ui = UI(None, state)
 
     email_config = {
         "smtp_server": "smtp.gmail.com",
@@ -15,10 +28,16 @@ if __name__ == '__main__':
         "password": "",
         "recipient": [""]
     }
-    reporter = ExperimentReporter(ui_instance=ui, email_config=email_config)
+    reporter = ExperimentReporter(state, journal, email_config=email_config, timers=timers)
 
-    conn_manager = ConnectionManager(ui, ui.update_next_notification_time, reporter)
+    conn_manager = ConnectionManager(ui, None, reporter, timers=timers, state=state, journal=journal)
     ui.connection_manager = conn_manager
+    reporter.log_timestamped = conn_manager.log_timestamped
 
+    # Pick up the EMA schedule where it was before a restart, if any
+    conn_manager.scheduler.resume()
 
-    ui.start()
\ No newline at end of file
+    ui.start()
+    reporter.close()
+    counters.close()
+    journal.close()
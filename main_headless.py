@@ -0,0 +1,69 @@
+# Runs the server without Tk, the QR window or PIL, e.g. on a headless box.
+# Flags come from the command line; counters and status live in the
+# StateStore exactly as with the UI (see main.py).
+import argparse
+import os
+import signal
+import threading
+from connection.connection_handler import ConnectionManager
+from core.journal import Journal
+from core.report_counters import ReportCounters
+from core.state_store import StateStore
+from utils.reporter.experiment_reporter import ExperimentReporter
+from utils.scheduler.schedule_planner import SchedulePlanner
+from utils.scheduler.scheduler import MISSED_START_POLICIES
+from utils.scheduler.timer_scheduler import TimerScheduler
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="EMA server without the UI")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=4100)
+    parser.add_argument("--live", action="store_true", help="send EMA_START_Live instead of EMA_START_Test")
+    parser.add_argument("--bci", action="store_true", help="enable BCI2000")
+    parser.add_argument("--start", action="store_true", help="schedule EMA sessions right away (the UI's Start button)")
+    parser.add_argument("--seed", type=int, help="seed of the EMA schedule, to reproduce a study's plan")
+    parser.add_argument("--export-plan", metavar="CSV", help="write the EMA schedule for audit, then exit")
+    parser.add_argument("--plan-days", type=int, default=30, help="days covered by --export-plan")
+    parser.add_argument("--missed", choices=MISSED_START_POLICIES, default="skip",
+                        help="what to do with an EMA start missed while the server was down")
+    args = parser.parse_args()
+
+    planner = SchedulePlanner(args.seed)
+    if args.export_plan:
+        plan = planner.export(args.export_plan, args.plan_days)
+        print(f"Wrote {len(plan)} EMA sessions over {args.plan_days} days (seed {planner.seed}) to {args.export_plan}")
+        raise SystemExit(0)
+
+    state = StateStore(test_mode=not args.live, bci_enabled=args.bci)
+
+    # Single thread for every timed task in the app
+    timers = TimerScheduler()
+    journal = Journal(os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "journal"))
+    counters = ReportCounters(state, journal, timers=timers)
+
+    email_config = {
+        "smtp_server": "smtp.gmail.com",
+        "port": 465,
+        # Email and Password for sending daily summary email
+        "sender": "",
+        "password": "",
+        "recipient": [""]
+    }
+    reporter = ExperimentReporter(state, journal, email_config=email_config, timers=timers)
+
+    conn_manager = ConnectionManager(None, None, reporter, host=args.host, port=args.port, timers=timers, state=state, journal=journal, planner=planner)
+    reporter.log_timestamped = conn_manager.log_timestamped
+    # A saved schedule is resumed; --start only begins a new one
+    conn_manager.scheduler.missed_start_policy = args.missed
+    if conn_manager.scheduler.resume() is None and args.start:
+        conn_manager.scheduler.schedule_start()
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stopped.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    stopped.wait()
+    conn_manager.stop_server()
+    reporter.close()
+    counters.close()
+    journal.close()
+    timers.stop()
@@ -0,0 +1,417 @@
+"""
+Send-to-photon latency of a photodiode flicker test.
+
+Reads the FLASH_ON / FLASH_OFF send times from photodiode_log_*.txt and a
+photodiode trace recorded during the test, detects the screen edges in the
+trace, matches every send to the first edge of the right polarity after it
+and reports the latency distribution and its outliers.
+
+Trace formats:
+    .csv    "time,value" rows (epoch seconds; a header row is skipped). It
+            is converted once to a .npy next to it and memory-mapped from then on
+    .npy    (N, 2) array of [epoch seconds, value], or (N,) values together
+            with --rate and --start
+    .dat    BCI2000 data file; --channel selects the photodiode channel. The
+            EmaColor state set by the server after each send, when present,
+            aligns the sample clock to the log (the latency then excludes
+            the time BCI2000 took to set the state); otherwise StorageTime
+            is used. Each marker is matched to the nearest intended send
+            time, so a recording that starts mid-test or a lost marker does
+            not shift the others; markers further than half a send interval
+            from any send are left out and counted
+
+The trace is processed in chunks straight from the memory map, so a
+multi-hour recording never has to fit in memory.
+
+Run from the project root:
+    python "testing tools/analyze_photodiode_latency.py" logs/latency_log/photodiode_log_<date>.txt --trace trace.csv
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from datetime import datetime
+
+import numpy as np
+
+CHUNK = 1 << 20     # samples per processing chunk
+
+SEND_LINE = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3}) - Sent photodiode signal: (FLASH_ON|FLASH_OFF)\b"
+                       r"(?:.*?error ([-+]?\d+\.\d+) ms)?", re.MULTILINE)
+
+BCI2000_FORMATS = {"int16": "<i2", "int32": "<i4", "float32": "<f4"}
+
+
+def read_send_log(paths):
+    """
+    Send times (epoch seconds), whether each send was FLASH_ON and its
+    intended time (the send time less the logged scheduling error), in
+    time order.
+    """
+    stamps, signals, errors = [], [], []
+    for path in paths:
+        rows = np.fromregex(path, SEND_LINE, dtype=[("stamp", "U23"), ("signal", "U9"), ("error", "U16")], encoding="utf-8")
+        stamps.append(rows["stamp"])
+        signals.append(rows["signal"])
+        errors.append(rows["error"])
+    stamps = np.concatenate(stamps)
+    signals = np.concatenate(signals)
+    errors = np.concatenate(errors)
+    if not len(stamps):
+        raise ValueError("No photodiode sends found in the log")
+
+    # Log timestamps are local time; assume one UTC offset for the whole test
+    local = stamps.astype("datetime64[ms]").astype(np.int64) / 1000
+    utc_offset = datetime.strptime(str(stamps[0]), "%Y-%m-%d %H:%M:%S.%f").astimezone().utcoffset().total_seconds()
+    times = local - utc_offset
+
+    # Logs written before the error was logged: intended = sent
+    intended = times - np.where(errors == "", "0", errors).astype(np.float64) / 1000
+
+    order = np.argsort(times, kind="stable")
+    return times[order], (signals == "FLASH_ON")[order], intended[order]
+
+
+def nearest(times, targets):
+    """Index of the nearest of the sorted `times` to each target, and the distance to it."""
+    index = np.clip(np.searchsorted(times, targets), 1, len(times) - 1)
+    index -= (targets - times[index - 1]) < (times[index] - targets)
+    return index, np.abs(times[index] - targets)
+
+
+class Trace:
+    """Photodiode samples plus the mapping from (fractional) sample index to epoch seconds."""
+
+    def __init__(self, values, times=None, start=None, rate=None, markers=None):
+        self.values = values        # 1-D, may be a memory-mapped view
+        self.times = times          # per-sample epoch seconds, or None
+        self.start = start
+        self.rate = rate
+        self.markers = markers      # sample indices of BCI2000 send markers, or None
+        self.offset = 0.0           # seconds added to every sample time
+        self.fit_residual = None
+        self.markers_matched = None
+        self.markers_unmatched = None
+        self.sends_without_marker = None
+        self.clock_shift = None     # seconds the markers moved the nominal clock
+
+    def _match_markers(self, intended, predicted, tolerance):
+        """Send index of each marker at `predicted` times, or -1 if no intended send is within `tolerance`."""
+        index, distance = nearest(intended, predicted)
+        index[distance > tolerance] = -1
+        # A send answers at most one marker: the closest
+        closest = np.argsort(distance, kind="stable")
+        _, first = np.unique(index[closest], return_index=True)
+        keep = np.zeros(len(index), dtype=bool)
+        keep[closest[first]] = True
+        index[~keep] = -1
+        return index
+
+    def align_to_markers(self, send_times, intended=None, candidates=3, sample=200):
+        """
+        Fits sample index -> epoch seconds through the send markers. Each
+        marker is matched to the nearest intended send time; a match further
+        than half the median send interval is rejected, so a recording that
+        starts mid-test or a missing marker costs only that marker.
+        """
+        intended = send_times if intended is None else intended
+        markers = np.asarray(self.markers, dtype=np.float64)
+        if len(markers) < 2 or len(intended) < 2:
+            return False
+        tolerance = float(np.median(np.diff(intended))) / 2
+
+        # Coarse offset at the nominal rate: the one that puts the most of
+        # an even sample of the markers near a send. A flicker is periodic,
+        # so offsets a whole number of intervals apart fit about as well;
+        # the nominal clock (StorageTime or --start) picks among those
+        relative = markers / self.rate
+        probe = relative[np.linspace(0, len(relative) - 1, min(sample, len(relative))).astype(np.int64)]
+        offsets = (intended[None, :] - relative[:candidates, None]).ravel()
+        scores = np.array([np.count_nonzero(nearest(intended, probe + offset)[1] <= tolerance) for offset in offsets])
+        fitting = offsets[scores >= 0.95 * scores.max()]
+        offset = fitting[np.argmin(np.abs(fitting - self.start))]
+        self.clock_shift = float(offset - self.start)
+        predicted = offset + relative
+
+        # Fit through the matches, then match again on the fitted clock
+        for _ in range(2):
+            index = self._match_markers(intended, predicted, tolerance)
+            matched = index >= 0
+            if np.count_nonzero(matched) < 2:
+                return False
+            slope, intercept = np.polyfit(markers[matched], send_times[index[matched]], 1)
+            predicted = intercept + slope * markers
+
+        self.rate, self.start = 1 / slope, intercept
+        self.fit_residual = float(np.std(predicted[matched] - send_times[index[matched]]))
+        self.markers_matched = int(np.count_nonzero(matched))
+        self.markers_unmatched = int(len(markers) - self.markers_matched)
+        # Sends inside the marker span that no marker was matched to (lost or never set)
+        span = (intended >= predicted[0] - tolerance) & (intended <= predicted[-1] + tolerance)
+        self.sends_without_marker = int(np.count_nonzero(span) - self.markers_matched)
+        self.times = None
+        return True
+
+    def time_at(self, samples):
+        if self.times is None:
+            return self.start + samples / self.rate + self.offset
+        index = np.clip(np.floor(samples).astype(np.int64), 0, len(self.times) - 2)
+        t0 = np.asarray(self.times[index], dtype=np.float64)
+        t1 = np.asarray(self.times[index + 1], dtype=np.float64)
+        return t0 + (samples - index) * (t1 - t0) + self.offset
+
+
+def load_trace(path, rate=None, start=None, channel=0):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        cached = path + ".npy"
+        if not os.path.exists(cached) or os.path.getmtime(cached) < os.path.getmtime(path):
+            with open(path, encoding="utf-8") as f:
+                header = not re.match(r"\s*[-+\d.]", f.readline())
+            np.save(cached, np.loadtxt(path, delimiter=",", skiprows=int(header), usecols=(0, 1), ndmin=2))
+        path, ext = cached, ".npy"
+
+    if ext == ".npy":
+        data = np.load(path, mmap_mode="r")
+        if data.ndim == 2:
+            return Trace(data[:, 1], times=data[:, 0])
+        if rate is None or start is None:
+            raise ValueError("A 1-D trace needs --rate and --start")
+        return Trace(data, start=start, rate=rate)
+
+    if ext == ".dat":
+        return load_bci2000(path, channel, rate, start)
+    raise ValueError(f"Unsupported trace format: {path}")
+
+
+def load_bci2000(path, channel=0, rate=None, start=None):
+    with open(path, "rb") as f:
+        first = f.readline().decode("latin-1")
+        fields = dict(re.findall(r"(\w+)=\s*(\S+)", first))
+        header_length = int(fields["HeaderLen"])
+        f.seek(0)
+        header = f.read(header_length).decode("latin-1")
+    source_channels = int(fields["SourceCh"])
+    state_length = int(fields["StatevectorLen"])
+    sample_format = BCI2000_FORMATS[fields.get("DataFormat", "int16")]
+
+    record = np.dtype([("signal", sample_format, (source_channels,)), ("state", "u1", (state_length,))])
+    data = np.memmap(path, dtype=record, mode="r", offset=header_length)
+
+    if rate is None:
+        match = re.search(r"\sSamplingRate=\s*([\d.]+)", header)
+        rate = float(match.group(1))
+    if start is None:
+        match = re.search(r"\sStorageTime=\s*(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})", header)
+        start = datetime.strptime(match.group(1), "%Y-%m-%dT%H:%M:%S").timestamp() if match else 0.0
+
+    # State lines: "Name Length Value ByteLocation BitLocation"
+    markers = None
+    match = re.search(r"^EmaColor (\d+) \d+ (\d+) (\d+)", header, re.MULTILINE)
+    if match:
+        length, byte, bit = map(int, match.groups())
+        markers = state_changes(data["state"], length, byte, bit)
+    return Trace(data["signal"][:, channel], start=start, rate=rate, markers=markers)
+
+
+def state_changes(states, length, byte, bit, chunk=CHUNK):
+    """Sample indices where a BCI2000 state changes to a non-zero value."""
+    width = (bit + length + 7) // 8
+    mask = (1 << length) - 1
+    changes = []
+    previous = 0
+    for begin in range(0, len(states), chunk):
+        raw = np.asarray(states[begin:begin + chunk, byte:byte + width])
+        value = np.zeros(len(raw), dtype=np.uint32)
+        for k in range(width):
+            value |= raw[:, k].astype(np.uint32) << (8 * k)
+        value = (value >> bit) & mask
+        changed = np.flatnonzero((value != np.concatenate(([previous], value[:-1]))) & (value != 0))
+        changes.append(changed + begin)
+        previous = value[-1]
+    return np.concatenate(changes) if changes else np.empty(0, dtype=np.int64)
+
+
+def auto_thresholds(values, samples=1_000_000):
+    """Hysteresis thresholds at 30% / 70% between the dark and bright levels."""
+    step = max(1, len(values) // samples)
+    dark, bright = np.percentile(np.asarray(values[::step], dtype=np.float64), [5, 95])
+    return dark + 0.3 * (bright - dark), dark + 0.7 * (bright - dark)
+
+
+def detect_edges(values, low, high, chunk=CHUNK):
+    """
+    Rising and falling edges with hysteresis, as fractional sample indices.
+
+    A sample at or above `high` means bright, at or below `low` dark, and
+    anything in between keeps the previous state. An edge is a bright/dark
+    sample whose state differs from the last decided one, refined by
+    linear interpolation to where the signal crossed the threshold.
+    """
+    positions, polarities = [], []
+    state = None
+    for begin in range(0, len(values), chunk):
+        x = np.asarray(values[begin:begin + chunk], dtype=np.float64)
+        decided = np.flatnonzero((x >= high) | (x <= low))
+        if not len(decided):
+            continue
+        bright = x[decided] >= high
+        previous = np.concatenate(([bright[0] if state is None else state], bright[:-1]))
+        edges = decided[bright != previous]
+        positions.append(edges + begin)
+        polarities.append(bright[bright != previous])
+        state = bright[-1]
+
+    if not positions:
+        return np.empty(0), np.empty(0)
+    positions = np.concatenate(positions)
+    polarities = np.concatenate(polarities)
+
+    # Sub-sample crossing point between the sample before the edge and the edge
+    before = np.maximum(positions - 1, 0)
+    x0 = np.asarray(values[before], dtype=np.float64)
+    x1 = np.asarray(values[positions], dtype=np.float64)
+    level = np.where(polarities, high, low)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = np.clip(np.nan_to_num((level - x0) / (x1 - x0), nan=1.0), 0.0, 1.0)
+    exact = before + np.where(positions > 0, fraction, 0.0)
+    return exact[polarities], exact[~polarities]
+
+
+def match_sends(send_times, edge_times, min_latency, max_latency):
+    """
+    Latency (s) from each send to the first edge at least min_latency later;
+    NaN when there is none within max_latency. An edge answers at most one
+    send: when several sends reach the same edge, only the latest keeps it.
+    """
+    latency = np.full(len(send_times), np.nan)
+    if not len(edge_times) or not len(send_times):
+        return latency
+    index = np.searchsorted(edge_times, send_times + min_latency)
+    found = index < len(edge_times)
+    latency[found] = edge_times[index[found]] - send_times[found]
+    latency[latency > max_latency] = np.nan
+    duplicate = np.zeros(len(send_times), dtype=bool)
+    duplicate[:-1] = index[:-1] == index[1:]
+    latency[duplicate] = np.nan
+    return latency
+
+
+def summarize(latency_ms, outlier_mads=5.0):
+    matched = latency_ms[~np.isnan(latency_ms)]
+    summary = {"sends": int(len(latency_ms)), "matched": int(len(matched))}
+    if not len(matched):
+        return summary, np.zeros(len(latency_ms), dtype=bool)
+    median = np.median(matched)
+    mad = 1.4826 * np.median(np.abs(matched - median))
+    outliers = ~np.isnan(latency_ms) & (np.abs(latency_ms - median) > outlier_mads * max(mad, 1e-3))
+    p = np.percentile(matched, [1, 5, 50, 95, 99])
+    summary.update({
+        "mean": float(matched.mean()), "std": float(matched.std()),
+        "min": float(matched.min()), "p1": float(p[0]), "p5": float(p[1]), "p50": float(p[2]),
+        "p95": float(p[3]), "p99": float(p[4]), "max": float(matched.max()),
+        "mad": float(mad), "outliers": int(outliers.sum()),
+    })
+    return summary, outliers
+
+
+def analyze(log_paths, trace, threshold=None, invert=False, min_latency_ms=0.0, max_latency_ms=500.0, outlier_mads=5.0):
+    send_times, is_on, intended = read_send_log(log_paths)
+    if trace.markers is not None:
+        trace.align_to_markers(send_times, intended)
+    # Only sends made while the trace was recording can be matched
+    first, last = trace.time_at(np.array([0.0, len(trace.values) - 1.0]))
+    recorded = (send_times >= first) & (send_times <= last)
+    send_times, is_on = send_times[recorded], is_on[recorded]
+
+    low, high = threshold or auto_thresholds(trace.values)
+    rising, falling = detect_edges(trace.values, low, high)
+    rising_times, falling_times = trace.time_at(rising), trace.time_at(falling)
+    # By default the screen turning white raises the photodiode signal
+    on_edges, off_edges = (falling_times, rising_times) if invert else (rising_times, falling_times)
+
+    latency_ms = np.full(len(send_times), np.nan)
+    for selected, edges in ((is_on, on_edges), (~is_on, off_edges)):
+        latency_ms[selected] = 1000 * match_sends(send_times[selected], edges, min_latency_ms / 1000, max_latency_ms / 1000)
+
+    report = {"thresholds": [float(low), float(high)], "edges": {"rising": int(len(rising)), "falling": int(len(falling))}}
+    if trace.fit_residual is not None:
+        report["marker_fit_residual_ms"] = trace.fit_residual * 1000
+        report["markers"] = {"matched": trace.markers_matched, "unmatched": trace.markers_unmatched,
+                             "sends_without_marker": trace.sends_without_marker, "clock_shift_s": trace.clock_shift}
+    outliers = np.zeros(len(send_times), dtype=bool)
+    for name, selected in (("all", np.ones(len(send_times), dtype=bool)), ("FLASH_ON", is_on), ("FLASH_OFF", ~is_on)):
+        summary, flagged = summarize(latency_ms[selected], outlier_mads)
+        report[name] = summary
+        if name == "all":
+            outliers = flagged
+    return report, send_times, is_on, latency_ms, outliers
+
+
+def print_report(report, send_times, is_on, latency_ms, outliers, max_listed=20):
+    print(f"Thresholds: low {report['thresholds'][0]:.4g}, high {report['thresholds'][1]:.4g} - "
+          f"{report['edges']['rising']} rising / {report['edges']['falling']} falling edges")
+    if "marker_fit_residual_ms" in report:
+        markers = report["markers"]
+        print(f"BCI2000 marker alignment residual: {report['marker_fit_residual_ms']:.3f} ms - "
+              f"{markers['matched']} markers matched, {markers['unmatched']} unmatched, "
+              f"{markers['sends_without_marker']} sends without a marker")
+        if markers["unmatched"] or markers["sends_without_marker"]:
+            print("Warning: some markers could not be paired with a send; check the recording covers the test")
+        if abs(markers["clock_shift_s"]) > 1.0:
+            print(f"Warning: markers are {markers['clock_shift_s']:+.3f} s from the recording's own clock; "
+                  f"if that is more than half a send interval the pairing may be off by whole intervals (set --start)")
+    for name in ("all", "FLASH_ON", "FLASH_OFF"):
+        s = report[name]
+        if not s["matched"]:
+            print(f"{name:>9}: {s['sends']} sends, none matched")
+            continue
+        print(f"{name:>9}: {s['matched']}/{s['sends']} matched - mean {s['mean']:.2f} +/- {s['std']:.2f} ms, "
+              f"p5 {s['p5']:.2f} / p50 {s['p50']:.2f} / p95 {s['p95']:.2f} / p99 {s['p99']:.2f} ms, "
+              f"range {s['min']:.2f}..{s['max']:.2f} ms, {s['outliers']} outliers")
+
+    listed = np.flatnonzero(outliers)[:max_listed]
+    if len(listed):
+        print("Outliers:")
+    for i in listed:
+        stamp = datetime.fromtimestamp(send_times[i]).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        print(f"  {stamp} {'FLASH_ON' if is_on[i] else 'FLASH_OFF'}: {latency_ms[i]:.2f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send-to-photon latency of a photodiode flicker test")
+    parser.add_argument("logs", nargs="+", help="photodiode_log_*.txt files")
+    parser.add_argument("--trace", required=True, help="photodiode trace (.csv, .npy or BCI2000 .dat)")
+    parser.add_argument("--channel", type=int, default=0, help="photodiode channel in a BCI2000 file")
+    parser.add_argument("--rate", type=float, help="sampling rate (Hz) of a 1-D .npy trace or to override BCI2000")
+    parser.add_argument("--start", type=float, help="epoch seconds of the first sample of a 1-D .npy trace")
+    parser.add_argument("--offset-ms", type=float, default=0.0, help="added to every trace time")
+    parser.add_argument("--threshold", type=float, nargs=2, metavar=("LOW", "HIGH"), help="hysteresis thresholds")
+    parser.add_argument("--invert", action="store_true", help="white screen lowers the signal")
+    parser.add_argument("--min-latency-ms", type=float, default=0.0)
+    parser.add_argument("--max-latency-ms", type=float, default=500.0)
+    parser.add_argument("--outlier-mads", type=float, default=5.0, help="outlier distance from the median, in MADs")
+    parser.add_argument("--json", help="write the summary to this file")
+    parser.add_argument("--csv", help="write every send with its latency to this file")
+    args = parser.parse_args(argv)
+
+    trace = load_trace(args.trace, rate=args.rate, start=args.start, channel=args.channel)
+    trace.offset = args.offset_ms / 1000
+
+    report, send_times, is_on, latency_ms, outliers = analyze(
+        args.logs, trace, threshold=args.threshold, invert=args.invert,
+        min_latency_ms=args.min_latency_ms, max_latency_ms=args.max_latency_ms, outlier_mads=args.outlier_mads)
+    print_report(report, send_times, is_on, latency_ms, outliers)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.csv:
+        np.savetxt(args.csv, np.column_stack((send_times, is_on, latency_ms, outliers)), delimiter=",",
+                   fmt=("%.3f", "%d", "%.3f", "%d"), header="send_time,flash_on,latency_ms,outlier", comments="")
+    return 0 if report["all"]["matched"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+In-process stand-in for BCI2000Remote (C:\\BCI2000.x64\\prog\\BCI2000Remote.py),
+for exercising BCI2000Handler and BCI2000Worker without BCI2000 (any OS).
+Implements the calls the server makes; each one takes `latency` seconds,
+like a round trip to the Operator.
+
+Example:
+    remote = BCI2000StandIn(latency=0.002)
+    worker = BCI2000Worker(lambda: remote, log)
+    ...
+    remote.events     # [(name, value, time received)]
+    remote.down = True          # Connect() and every call fail
+    remote.stall(3.0)           # the next call takes 3 s
+
+install() registers it as the BCI2000Remote module, so
+utils.bci2000.bci2000_handler imports on machines without BCI2000.
+"""
+import sys
+import threading
+import time
+import types
+
+
+class BCI2000StandIn:
+    def __init__(self, latency=0.0, parameters=None):
+        self.latency = latency
+        self.parameters = dict(parameters or {"SubjectName": "S01", "SubjectSession": "001"})
+        self.Timeout = None
+        self.down = False
+        self.connected = False
+        self.states = {}
+        self.events = []
+        self.calls = 0
+        self.connects = 0
+        self._stall = 0.0
+        self._lock = threading.Lock()
+
+    def stall(self, seconds):
+        self._stall = seconds
+
+    def _round_trip(self):
+        with self._lock:
+            self.calls += 1
+            delay, self._stall = self.latency + self._stall, 0.0
+        if delay:
+            time.sleep(delay)
+        if self.down:
+            self.connected = False
+            raise ConnectionError("BCI2000 Operator not reachable")
+
+    def Connect(self):
+        self._round_trip()
+        self.connected = True
+        self.connects += 1
+        return True
+
+    def Disconnect(self):
+        self.connected = False
+
+    def _require_connection(self):
+        if not self.connected:
+            raise ConnectionError("Not connected")
+
+    def SetEventVariable(self, name, value):
+        self._round_trip()
+        self._require_connection()
+        self.states[name] = value
+        self.events.append((name, value, time.time()))
+        return True
+
+    def GetEventVariable(self, name):
+        self._round_trip()
+        self._require_connection()
+        return self.states.get(name, 0)
+
+    def GetParameter(self, name):
+        self._round_trip()
+        self._require_connection()
+        return self.parameters.get(name, "")
+
+
+def install():
+    """Makes `from BCI2000Remote import BCI2000Remote` give the stand-in, unless the real one is importable."""
+    try:
+        import BCI2000Remote    # noqa: F401
+    except ImportError:
+        module = types.ModuleType("BCI2000Remote")
+        module.BCI2000Remote = BCI2000StandIn
+        sys.modules["BCI2000Remote"] = module
@@ -0,0 +1,125 @@
+"""
+Mail volume of the AlertEngine (utils/reporter/alert_engine.py) during a
+simulated outage with no iPad connected: every scheduled trigger fails
+("EMA Start Failed" + "BCI2000 Not Running"), and the 30-minute battery
+check fails. Compares the number of emails with and without the engine,
+and the cost of one alert() call.
+
+Run from the project root:
+    python "testing tools/bench_alert_engine.py" --hours 72
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.reporter.alert_engine import AlertEngine
+
+
+class FakeTimers:
+    """Just enough of TimerScheduler, on a clock the benchmark advances by hand."""
+
+    def __init__(self, start):
+        self.start = start
+        self.now = 0.0
+        self.periodic = []
+
+    def clock(self):
+        return self.now
+
+    def wall_clock(self):
+        return self.start + timedelta(seconds=self.now)
+
+    def call_every(self, interval, callback, *args, first_delay=None, jitter=0.0):
+        timer = Timer(self, interval, callback)
+        self.periodic.append(timer)
+        return timer
+
+    def advance(self, seconds):
+        target = self.now + seconds
+        for timer in sorted(self.periodic, key=lambda timer: timer.deadline):
+            while not timer.cancelled and timer.deadline <= target:
+                self.now = timer.deadline
+                timer.deadline += timer.interval
+                timer.callback()
+        self.now = target
+
+
+class Timer:
+    def __init__(self, timers, interval, callback):
+        self.interval = interval
+        self.callback = callback
+        self.deadline = timers.now + interval
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+def outage_events(hours, trigger_every):
+    """(seconds since start, kind, source, subject) for every alert the outage raises."""
+    events = []
+    for minute in range(0, hours * 60):
+        second = minute * 60
+        if minute % trigger_every == 0:
+            events.append((second, "ema_start_no_client", "iPad", "EMA Start Failed - No Client Connected"))
+            events.append((second + 5, "[Alert] BCI2000 Not Running at triggered EMA", None, "[Alert] BCI2000 Not Running at triggered EMA"))
+        if minute % 30 == 0:
+            events.append((second, "battery_no_client", "iPad", "Battery Check Failed - No Client Connected"))
+    return sorted(events, key=lambda event: event[0])
+
+
+def separate_kinds():
+    """An EMA start alert must not hide the battery check failures after it, and the digest counts each subject."""
+    timers = FakeTimers(datetime(2025, 1, 6, 9, 0))
+    emails = []
+    engine = AlertEngine(lambda subject, body: emails.append((subject, body)), timers=timers)
+    engine.alert("ema_start_no_client", "iPad", "EMA Start Failed - No Client Connected", "body")
+    for _ in range(5):
+        timers.advance(60)
+        engine.alert("battery_no_client", "iPad", "Battery Check Failed - No Client Connected", "body")
+    engine.close()
+    subjects = [subject for subject, _ in emails]
+    digest = emails[-1][1] if subjects[-1].startswith("[Alert Digest]") else ""
+    return (subjects[:2] == ["EMA Start Failed - No Client Connected", "Battery Check Failed - No Client Connected"]
+            and "4 x Battery Check Failed - No Client Connected [battery_no_client, iPad]" in digest)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Alert email volume during an outage")
+    parser.add_argument("--hours", type=int, default=72)
+    parser.add_argument("--trigger-every", type=int, default=60, help="minutes between scheduled EMA triggers")
+    args = parser.parse_args(argv)
+
+    events = outage_events(args.hours, args.trigger_every)
+    timers = FakeTimers(datetime(2025, 1, 6, 9, 0))
+    emails = []
+    engine = AlertEngine(lambda subject, body: emails.append((timers.now, subject)), timers=timers)
+
+    cost = []
+    for second, kind, source, subject in events:
+        timers.advance(second - timers.now)
+        started = time.perf_counter()
+        engine.alert(kind, source, subject, "body")
+        cost.append(time.perf_counter() - started)
+    engine.close()
+
+    digests = [email for email in emails if email[1].startswith("[Alert Digest]")]
+    print(f"outage of {args.hours} h, trigger every {args.trigger_every} min")
+    print(f"alerts raised        {len(events):6d}  (emails without the engine)")
+    print(f"emails with engine   {len(emails):6d}  ({len(emails) - len(digests)} alerts, {len(digests)} digests)")
+    print(f"reduction            {len(events) / max(1, len(emails)):6.1f}x")
+    print(f"alert() cost         {sum(cost) / len(cost) * 1e6:6.1f} us mean, {max(cost) * 1e6:.1f} us max")
+    print(f"stats                {engine.stats()}")
+    counted = engine.sent + sum(int(subject.split()[2]) for _, subject in digests)
+    print(f"every alert accounted for: {counted == len(events)}")
+    kinds_ok = separate_kinds()
+    print(f"battery failures not hidden by an EMA start alert: {kinds_ok}")
+    return 0 if counted == len(events) and kinds_ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
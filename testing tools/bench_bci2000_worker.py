@@ -0,0 +1,222 @@
+"""
+BCI2000 event writes through BCI2000Worker (utils/bci2000/bci2000_worker.py),
+against the BCI2000Remote stand-in (bci2000_standin.py):
+  1. time the caller spends per event, synchronous SetEventVariable (the
+     old path, on the socket / photodiode thread) vs set_event()
+  2. remote calls per event when redundant writes are skipped, with every
+     distinct value still reaching BCI2000 in order
+  3. log timestamps stay at the event's time however long it was queued
+  4. a stalled call times out for the caller and the worker reconnects
+  5. with BCI2000 down, writes are dropped and reconnects are rate limited
+  6. BCI2000Handler on top of the worker, on a machine without BCI2000
+
+Run from the project root (any OS):
+    python "testing tools/bench_bci2000_worker.py" --latency-ms 2
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.bci2000.bci2000_worker import BCI2000Worker
+from bci2000_standin import BCI2000StandIn, install
+
+failures = []
+STATES = ["EMA_Start", "EMA_Question", "EMA_Response", "EMA_End", "EmaColor"]
+
+
+def check(name, ok, detail=""):
+    print(f"{'ok  ' if ok else 'FAIL'} {name}{f' ({detail})' if detail else ''}")
+    if not ok:
+        failures.append(name)
+
+
+class LogRecorder:
+    def __init__(self):
+        self.lines = []
+
+    def __call__(self, message, at=None):
+        self.lines.append((message, at))
+
+
+def workload(count, burst=25, seed=3):
+    """BCI_Sync-like events: bursts of writes to a few states, then a pause."""
+    rng = random.Random(seed)
+    return [[(rng.choice(STATES), rng.randrange(1, 6)) for _ in range(burst)] for _ in range(count // burst)]
+
+
+def transitions(events):
+    """state -> the values it took, in order, without repeats."""
+    sequences = {}
+    for name, value, _ in events:
+        sequence = sequences.setdefault(name, [])
+        if not sequence or sequence[-1] != value:
+            sequence.append(value)
+    return sequences
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def caller_cost(latency, count):
+    bursts = workload(count)
+
+    remote = BCI2000StandIn(latency)
+    remote.Connect()
+    blocking = []
+    for burst in bursts:
+        for name, value in burst:
+            started = time.perf_counter()
+            remote.SetEventVariable(name, value)
+            blocking.append(time.perf_counter() - started)
+    sync_calls = remote.calls - 1
+    expected = transitions(remote.events)
+
+    remote = BCI2000StandIn(latency)
+    worker = BCI2000Worker(lambda: remote, LogRecorder())
+    queued = []
+    for burst in bursts:
+        for name, value in burst:
+            started = time.perf_counter()
+            worker.set_event(name, value)
+            queued.append(time.perf_counter() - started)
+        time.sleep(latency * 5)     # the gap between messages
+    worker.flush()
+    stats = worker.stats()
+    worker.close()
+
+    print(f"{count} events in bursts of 25, {latency * 1000:g} ms per BCI2000 call")
+    print(f"  synchronous: caller blocked p50 {percentile(blocking, 50) * 1e6:8.0f} us, p99 {percentile(blocking, 99) * 1e6:8.0f} us, "
+          f"total {sum(blocking) * 1000:.0f} ms, {sync_calls} calls")
+    print(f"  worker:      caller blocked p50 {percentile(queued, 50) * 1e6:8.1f} us, p99 {percentile(queued, 99) * 1e6:8.1f} us, "
+          f"total {sum(queued) * 1000:.1f} ms, {stats['sent'] + 1} calls "
+          f"({stats['redundant']} redundant writes skipped)")
+    check("set_event does not wait on BCI2000", percentile(queued, 99) < latency / 4)
+    check("fewer BCI2000 calls than events", stats["sent"] < sync_calls, f"{stats['sent']} writes for {sync_calls} events")
+    check("every distinct value reaches BCI2000, in order", transitions(remote.events) == expected)
+
+
+def timestamps(latency):
+    remote = BCI2000StandIn(latency)
+    log = LogRecorder()
+    worker = BCI2000Worker(lambda: remote, log)
+    stamped = {}
+    for n in range(20):
+        name = f"Marker{n}"
+        stamped[name] = time.time()
+        worker.set_event(name, 1)
+        time.sleep(0.001)
+    worker.flush()
+    worker.close()
+    synced = {message.split()[3]: at for message, at in log.lines if message.startswith("Synced")}
+    lag = max(received - stamped[name] for name, _, received in remote.events)
+    error = max(abs(synced[name] - stamped[name]) for name in stamped)
+    check("log stamped with the enqueue time, not the send time", len(synced) == 20 and error < 0.001,
+          f"sent up to {lag * 1000:.0f} ms late, stamp error {error * 1e6:.0f} us")
+
+
+def stalled_call():
+    remote = BCI2000StandIn()
+    log = LogRecorder()
+    worker = BCI2000Worker(lambda: remote, log, timeout=0.3)
+    worker.call("GetParameter", "SubjectName")
+    remote.stall(1.5)
+    started = time.monotonic()
+    try:
+        worker.call("GetParameter", "SubjectName")
+        timed_out = False
+    except Exception:
+        timed_out = True
+    waited = time.monotonic() - started
+    check("stalled call times out for the caller", timed_out and waited < 0.4, f"{waited * 1000:.0f} ms")
+
+    started = time.monotonic()
+    flicker = [value % 2 + 1 for value in range(1, 200)]
+    for value in flicker:
+        worker.set_event("EmaColor", value)
+        worker.set_event("EmaColor", value)     # redundant
+    check("writes during the stall do not block", time.monotonic() - started < 0.05)
+    worker.flush()
+    stats = worker.stats()
+    check("stall counted, connection renewed", stats["timeouts"] == 1 and remote.connects == 2, f"{stats}")
+    check("every flicker transition queued during the stall is sent, in order",
+          [value for name, value, _ in remote.events] == flicker and stats["redundant"] == len(flicker))
+    worker.close()
+
+
+def bci2000_down():
+    remote = BCI2000StandIn()
+    remote.down = True
+    log = LogRecorder()
+    worker = BCI2000Worker(lambda: remote, log, retry_interval=0.2)
+    started = time.monotonic()
+    while time.monotonic() - started < 1.0:
+        worker.set_event("EmaColor", random.randrange(1, 3))
+        time.sleep(0.01)
+    worker.flush()
+    attempts = remote.calls
+    check("reconnects rate limited while down", attempts <= 7, f"{attempts} connect attempts in 1 s")
+    remote.down = False
+    time.sleep(0.25)
+    worker.set_event("EMA_Start", 1)
+    worker.flush()
+    check("writes flow again once BCI2000 is back", remote.states.get("EMA_Start") == 1 and worker.stats()["dropped"] > 0)
+    worker.close()
+
+
+def handler():
+    install()
+    from utils.bci2000.bci2000_handler import BCI2000Handler
+    from utils.scheduler.timer_scheduler import TimerScheduler
+
+    remote = BCI2000StandIn(0.001)
+    log = LogRecorder()
+    emails = []
+    timers = TimerScheduler()
+    bci_handler = BCI2000Handler(log, lambda subject, body: emails.append(subject), timers=timers,
+                                 remote_factory=lambda: remote)
+    bci_handler.monitor_task.cancel()   # no SignalGenerator.exe here
+
+    at = time.time() - 0.25
+    started = time.perf_counter()
+    bci_handler.process_bci_data("BCI_Sync:EMA_Start=1", at=at)
+    elapsed = time.perf_counter() - started
+    bci_handler.process_bci_data("BCI_Sync:EMA_Start")
+    name = bci_handler.get_bci_subjectName()
+    synced = [stamp for message, stamp in log.lines if message.startswith("Synced BCI event: EMA_Start = 1")]
+    check("handler: BCI_Sync queued, stamped with the event time", remote.states == {"EMA_Start": 1} and synced == [at],
+          f"{elapsed * 1e6:.0f} us on the caller")
+    check("handler: invalid BCI_Sync logged", any(message.startswith("Invalid BCI_Sync") for message, _ in log.lines))
+    check("handler: GetParameter through the worker", name == "S01" and bci_handler.get_bci_subjectID() == "001")
+
+    remote.down = True
+    bci_handler.worker.connection_lost()
+    check("handler: BCI2000 down at an EMA sends the alert",
+          bci_handler.get_bci_subjectName() == "<BCI_SubjectName>" and len(emails) == 1)
+    bci_handler.stop()
+    timers.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="duration of one BCI2000 call")
+    parser.add_argument("--events", type=int, default=1000)
+    args = parser.parse_args()
+
+    caller_cost(args.latency_ms / 1000, args.events)
+    timestamps(0.05)
+    stalled_call()
+    bci2000_down()
+    handler()
+    print("all checks ok" if not failures else f"{len(failures)} check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+Per-message dispatch latency: time from a client sendall() until the server
+hands the line to process_received_message.
+
+Compares the old polling loop (select on the listener every 100 ms, then a
+blocking recv on the client) with the event-driven ConnectionManager loop.
+
+Run from the project root:
+    python "testing tools/bench_dispatch_latency.py"
+"""
+import os
+import random
+import select
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connection.connection_handler import ConnectionManager
+
+MESSAGES = 200
+HOST = 'localhost'
+
+
+class _Var:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+class StubUI:
+    def __init__(self):
+        self.is_bci_enabled = _Var(False)
+        self.is_testmode_enabled = _Var(True)
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class StubReporter:
+    def send_email(self, subject, body, kind=None, source=None):
+        pass
+
+
+class LegacyServer:
+    """Reproduces the previous accept_connections polling loop."""
+
+    def __init__(self, port, on_message):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((HOST, port))
+        self.server.listen(1)
+        self.connection = None
+        self.running = True
+        self.on_message = on_message
+        threading.Thread(target=self.loop, daemon=True).start()
+
+    def loop(self):
+        while self.running:
+            readable, _, _ = select.select([self.server], [], [], 0.1)
+            if self.server in readable and self.connection is None:
+                self.connection, _ = self.server.accept()
+            if self.connection:
+                try:
+                    data = self.connection.recv(4096).decode('utf-8')
+                except OSError:
+                    return
+                if not data:
+                    return
+                self.on_message(data)
+
+    def stop(self):
+        self.running = False
+        if self.connection:
+            self.connection.close()
+        self.server.close()
+
+
+class TimedManager(ConnectionManager):
+    on_message = None
+
+    def process_received_message(self, message, session):
+        self.on_message(message)
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{name:<14} mean {statistics.mean(latencies):8.3f} ms   p50 {p50:8.3f} ms   "
+          f"p99 {p99:8.3f} ms   max {latencies[-1]:8.3f} ms")
+
+
+def run(server_factory, port):
+    holder = {}
+
+    def on_message(message):
+        holder['callback'](message)
+
+    server = server_factory(port, on_message)
+    received = threading.Event()
+    arrival = [0.0]
+
+    def record(message):
+        arrival[0] = time.perf_counter()
+        received.set()
+
+    holder['callback'] = record
+
+    client = socket.create_connection((HOST, port))
+    client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    time.sleep(0.2)
+
+    latencies = []
+    for _ in range(MESSAGES):
+        time.sleep(random.uniform(0.0, 0.05))
+        received.clear()
+        sent = time.perf_counter()
+        client.sendall(b"EMA_PAYLOAD\n")
+        if not received.wait(2):
+            raise RuntimeError("Message was not dispatched")
+        latencies.append((arrival[0] - sent) * 1000)
+
+    client.close()
+    server.stop()
+    return latencies
+
+
+def legacy_factory(port, on_message):
+    return LegacyServer(port, on_message)
+
+
+def event_loop_factory(port, on_message):
+    TimedManager.on_message = staticmethod(on_message)
+    log_dir = tempfile.TemporaryDirectory(prefix="dispatch_")
+    manager = TimedManager(StubUI(), None, StubReporter(), host=HOST, port=port, log_dir=log_dir.name)
+
+    def stop():
+        manager.stop_server()
+        log_dir.cleanup()
+    manager.stop = stop
+    return manager
+
+
+if __name__ == '__main__':
+    random.seed(0)
+    print(f"Dispatch latency over {MESSAGES} messages")
+    report("polling loop", run(legacy_factory, 4191))
+    report("event loop", run(event_loop_factory, 4192))
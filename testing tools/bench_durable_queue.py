@@ -0,0 +1,84 @@
+"""
+Cost of the durable outbound queue (connection/durable_queue.py) with
+thousands of entries: put latency (fsynced and not), file size per entry,
+recovery time when the server restarts, and compaction.
+
+Run from the project root:
+    python "testing tools/bench_durable_queue.py" --entries 1000 5000 20000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connection.durable_queue import DurableQueue
+
+
+def run(entries, fsync, directory):
+    path = os.path.join(directory, f"queue_{entries}_{int(fsync)}.jsonl")
+    queue = DurableQueue(path, fsync=fsync, compact_min_records=entries * 10)
+
+    started = time.perf_counter()
+    for index in range(entries):
+        queue.put("EMA_START_Live", f"pad{index % 2}", ttl=900, priority=0)
+    put_us = (time.perf_counter() - started) / entries * 1e6
+    full_bytes = os.path.getsize(path)
+
+    # Deliver one device's half, leaving done records behind
+    started = time.perf_counter()
+    taken = len(queue.take("pad0"))
+    take_ms = (time.perf_counter() - started) * 1000
+    queue.close()
+    mixed_bytes = os.path.getsize(path)
+
+    started = time.perf_counter()
+    queue = DurableQueue(path, fsync=fsync, compact_min_records=entries * 10)
+    recover_ms = (time.perf_counter() - started) * 1000
+    pending = len(queue)
+    queue.close()
+
+    # A reopen that compacts (half the records are dead)
+    started = time.perf_counter()
+    queue = DurableQueue(path, fsync=fsync, compact_min_records=1)
+    compact_ms = (time.perf_counter() - started) * 1000
+    queue.close()
+    compacted_bytes = os.path.getsize(path)
+
+    return {
+        "entries": entries,
+        "fsync": fsync,
+        "put_us": put_us,
+        "bytes_per_entry": full_bytes / entries,
+        "take_ms": take_ms,
+        "taken": taken,
+        "file_kb": mixed_bytes / 1024,
+        "recover_ms": recover_ms,
+        "pending": pending,
+        "compact_ms": compact_ms,
+        "compacted_kb": compacted_bytes / 1024,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Durable outbound queue cost")
+    parser.add_argument("--entries", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--no-fsync", action="store_true", help="only measure without fsync")
+    args = parser.parse_args(argv)
+
+    print(f"{'entries':>8} {'fsync':>5} {'put us':>8} {'B/entry':>8} {'take ms':>8} {'file KB':>8} "
+          f"{'recover ms':>10} {'pending':>8} {'compact ms':>10} {'after KB':>8}")
+    with tempfile.TemporaryDirectory(prefix="durable_queue_") as directory:
+        for entries in args.entries:
+            for fsync in ([False] if args.no_fsync else [False, True]):
+                r = run(entries, fsync, directory)
+                print(f"{r['entries']:8d} {str(r['fsync']):>5} {r['put_us']:8.1f} {r['bytes_per_entry']:8.1f} "
+                      f"{r['take_ms']:8.1f} {r['file_kb']:8.1f} {r['recover_ms']:10.1f} {r['pending']:8d} "
+                      f"{r['compact_ms']:10.1f} {r['compacted_kb']:8.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Line framing microbenchmark: the previous str buffer + split("\\n", 1) loop
+against LineFramer, for fragmented packets, coalesced packets and a single
+large backlog such as the EMA lines an iPad flushes after a reconnect.
+
+Run from the project root:
+    python "testing tools/bench_frame_parser.py"
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connection.frame_parser import LineFramer
+
+
+class StrBufferFramer:
+    """The framing previously done inline in process_received_message."""
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, data):
+        self.buffer += data.decode('utf-8', errors='replace')
+        lines = []
+        while "\n" in self.buffer:
+            line, self.buffer = self.buffer.split("\n", 1)
+            lines.append(line)
+        return lines
+
+
+def make_stream(lines):
+    payload = "Q{0}: Wie fühlen Sie sich gerade? Antwort={0}\n"
+    return "".join(payload.format(i) for i in range(lines)).encode('utf-8')
+
+
+def fragmented(stream):
+    rng = random.Random(1)
+    chunks, i = [], 0
+    while i < len(stream):
+        size = rng.randint(1, 48)
+        chunks.append(stream[i:i + size])
+        i += size
+    return chunks
+
+
+def coalesced(stream, size=4096):
+    return [stream[i:i + size] for i in range(0, len(stream), size)]
+
+
+def run(framer_class, chunks):
+    framer = framer_class()
+    start = time.perf_counter()
+    count = 0
+    for chunk in chunks:
+        count += len(framer.feed(chunk))
+    return time.perf_counter() - start, count
+
+
+def best_of(chunks, repeat=5, budget=2.0):
+    """Best time of each framer over up to `repeat` interleaved runs (fewer once `budget` seconds are spent)."""
+    times = {StrBufferFramer: [], LineFramer: []}
+    counts = set()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for framer_class, results in times.items():
+            elapsed, count = run(framer_class, chunks)
+            results.append(elapsed)
+            counts.add(count)
+        if time.perf_counter() - started > budget:
+            break
+    return min(times[StrBufferFramer]), min(times[LineFramer]), counts
+
+
+if __name__ == '__main__':
+    for lines in (1000, 10000, 50000):
+        stream = make_stream(lines)
+        cases = [
+            ("fragmented", fragmented(stream)),
+            ("coalesced 4 KiB", coalesced(stream)),
+            ("single backlog", [stream]),
+        ]
+        for name, chunks in cases:
+            old_time, new_time, counts = best_of(chunks)
+            assert counts == {lines}
+            print(f"{lines:>6} lines  {name:<16} str split {old_time * 1000:9.2f} ms   "
+                  f"LineFramer {new_time * 1000:8.2f} ms   x{old_time / new_time:7.1f}")
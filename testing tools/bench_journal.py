@@ -0,0 +1,127 @@
+"""
+Cost and crash safety of the counters/session journal (core/journal.py):
+append latency with and without fsync, the caller's cost of post() (the
+I/O thread's path) and how many fsyncs its batches need, recovery time on startup with and
+without a snapshot, recovery after a torn last record, and a range query
+over --days days of synthetic history.
+
+Run from the project root:
+    python "testing tools/bench_journal.py" --records 20000 --days 90
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.journal import Journal, COUNTS_RECORD
+
+COUNTERS = ("triggered", "responded", "completed", "ignored")
+
+
+class Clock:
+    """A settable datetime.now() for writing history."""
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def fill(journal, records):
+    values = dict.fromkeys(COUNTERS, 0)
+    for index in range(records):
+        if index % 4 == 0:
+            values[COUNTERS[index % 3]] += 1
+            journal.append(COUNTS_RECORD, values=dict(values))
+        else:
+            journal.append("session", device=f"pad{index % 3}", event="ready")
+    return values
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Journal cost and crash safety")
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--snapshot-every", type=int, default=256)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="journal_") as directory:
+        # Appends
+        for fsync in (False, True):
+            path = os.path.join(directory, f"append_{int(fsync)}")
+            journal = Journal(path, snapshot_every=args.snapshot_every, fsync=fsync)
+            count = args.records if not fsync else min(args.records, 2000)
+            _, ms = timed(lambda: fill(journal, count))
+            journal.close()
+            size = os.path.getsize(journal.segment_path(journal.day))
+            print(f"append fsync={fsync!s:<5} {ms * 1000 / count:8.1f} us/record, {size / count:.0f} B/record")
+
+        # post(): the caller only queues; the writer fsyncs per batch
+        path = os.path.join(directory, "post")
+        journal = Journal(path, snapshot_every=args.snapshot_every, fsync=True)
+        syncs = []
+        sync = journal._sync
+        journal._sync = lambda: (syncs.append(1), sync())
+        count = min(args.records, 2000)
+        _, ms = timed(lambda: [journal.post("session", device=f"pad{index % 3}", event="ready") for index in range(count)])
+        _, flush_ms = timed(journal.flush)
+        written = journal.state["records"]
+        journal.close()
+        print(f"post   fsync=True  {ms * 1000 / count:8.1f} us/record on the caller, "
+              f"{written} records in {len(syncs)} fsyncs ({flush_ms:.0f} ms to drain)")
+
+        # Recovery with and without the snapshot
+        path = os.path.join(directory, "append_0")
+        journal, ms = timed(lambda: Journal(path, snapshot_every=args.snapshot_every, fsync=False))
+        expected = journal.counters()
+        journal.close()
+        print(f"recover with snapshot       {ms:8.1f} ms ({args.records} records)")
+        os.remove(journal.snapshot_path(journal.day))
+        journal, ms = timed(lambda: Journal(path, snapshot_every=args.snapshot_every, fsync=False))
+        print(f"recover full replay         {ms:8.1f} ms, counters match: {journal.counters() == expected}")
+        journal.close()
+
+        # Torn last record, as left by a crash mid-write
+        segment = journal.segment_path(journal.day)
+        with open(segment, "ab") as f:
+            f.write(Journal.encode({"type": COUNTS_RECORD, "t": 0, "values": dict.fromkeys(COUNTERS, 999)})[:-20].encode())
+        journal = Journal(path, snapshot_every=args.snapshot_every, fsync=False)
+        print(f"torn record: cut off {journal.corrupt}, counters match: {journal.counters() == expected}")
+        journal.append("session", device="pad0", event="ready")
+        journal.close()
+        journal = Journal(path, fsync=False)
+        print(f"append after the cut readable: {journal.day_state(journal.day)['records'] == args.records + 1}")
+        journal.close()
+
+        # Range query over days of history
+        start = datetime(2025, 1, 1, 12, 0)
+        clock = Clock(start)
+        path = os.path.join(directory, "history")
+        journal = Journal(path, snapshot_every=args.snapshot_every, fsync=False, clock=clock)
+        for day in range(args.days):
+            clock.now = start + timedelta(days=day)
+            fill(journal, 40)
+            journal.append("report", values=journal.counters())
+            journal.append(COUNTS_RECORD, values=dict.fromkeys(COUNTERS, 0))
+        journal.close()
+        journal = Journal(path, fsync=False, clock=clock)
+        days, ms = timed(lambda: journal.days(start.date(), clock.now.date()))
+        triggered = sum(Journal.totals(state).get("triggered", 0) for state in days.values())
+        print(f"range query over {len(days)} days {ms:8.1f} ms, triggered total {triggered}")
+        journal.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
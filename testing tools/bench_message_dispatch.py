@@ -0,0 +1,108 @@
+"""
+Dispatch throughput: the previous if/elif chain in process_received_message
+against MessageDispatcher, on a traffic mix dominated by LIVE_CHECK_ACK and
+EMA payload lines. Handlers only parse their fields so the routing cost is
+what gets measured.
+
+Run from the project root:
+    python "testing tools/bench_message_dispatch.py"
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connection.message_dispatcher import MessageDispatcher
+
+LINES = 500000
+
+
+def make_traffic():
+    rng = random.Random(0)
+    lines = []
+    for i in range(LINES):
+        roll = rng.random()
+        if roll < 0.45:
+            lines.append(f"LIVE_CHECK_ACK:{i % 1000}:LATENCY:{rng.uniform(1, 40):.3f}")
+        elif roll < 0.90:
+            lines.append(f"2025-05-01 10:{i % 60:02d}:00,Q{i % 12},Slider,{rng.randint(0, 100)}")
+        elif roll < 0.93:
+            lines.append("BATTERY:0.81:Charging")
+        elif roll < 0.96:
+            lines.append("BCI_Sync:EmaQuestion=3")
+        elif roll < 0.98:
+            lines.append("EMA_Session_ACK")
+        else:
+            lines.append("Session_Complete")
+    return lines
+
+
+class Handlers:
+    """Stand-in handlers shared by both routers: parse fields and count."""
+
+    def __init__(self):
+        self.handled = 0
+
+    def count(self, session, fields, line):
+        self.handled += 1
+
+    def live_check_ack(self, session, fields, line):
+        fields[0].replace("LIVE_CHECK", "").strip()
+        self.handled += 1
+
+    def ema_line(self, session, line):
+        self.handled += 1
+
+
+def if_chain(lines):
+    """Routing as previously done inline in process_received_message."""
+    handlers = Handlers()
+    for message_line in lines:
+        if message_line == "CLIENT_READY":
+            handlers.count(None, [], message_line)
+        elif message_line == "EMA_Session_ACK":
+            handlers.count(None, [], message_line)
+        elif message_line == "Session_Complete":
+            handlers.count(None, [], message_line)
+        elif message_line.startswith("BATTERY"):
+            handlers.count(None, message_line.split(":")[1:], message_line)
+        elif message_line.startswith("LIVE_CHECK_ACK"):
+            handlers.live_check_ack(None, message_line.split(":")[1:], message_line)
+        elif message_line.startswith("BCI_Sync:"):
+            handlers.count(None, message_line.split(":")[1:], message_line)
+        else:
+            handlers.ema_line(None, message_line)
+    return handlers.handled
+
+
+def table(lines):
+    handlers = Handlers()
+    dispatcher = MessageDispatcher(default_handler=handlers.ema_line)
+    for verb in ("CLIENT_READY", "EMA_Session_ACK", "Session_Complete", "BATTERY", "BCI_Sync"):
+        dispatcher.register(verb, handlers.count)
+    dispatcher.register("LIVE_CHECK_ACK", handlers.live_check_ack)
+
+    dispatch = dispatcher.dispatch
+    for line in lines:
+        dispatch(None, line)
+    return handlers.handled
+
+
+def measure(function, lines, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        assert function(lines) == len(lines)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == '__main__':
+    traffic = make_traffic()
+    old = measure(if_chain, traffic)
+    new = measure(table, traffic)
+    print(f"{LINES} lines")
+    print(f"if/elif chain      {LINES / old / 1e6:6.2f} M lines/s   {old / LINES * 1e9:7.1f} ns/line")
+    print(f"MessageDispatcher  {LINES / new / 1e6:6.2f} M lines/s   {new / LINES * 1e9:7.1f} ns/line")
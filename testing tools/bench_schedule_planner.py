@@ -0,0 +1,112 @@
+"""
+Checks and times the seeded EMA schedule planner
+(utils/scheduler/schedule_planner.py): plans a --days study in one pass,
+compares it with planning slot by slot in Python, verifies every
+constraint (window, gaps, quota, blackouts, blackout dates), that the same
+seed gives the same plan and that planning further ahead keeps the days
+already planned, and writes the audit export.
+
+Run from the project root:
+    python "testing tools/bench_schedule_planner.py" --days 365
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.scheduler.schedule_planner import SchedulePlanner
+from utils.scheduler.scheduler import Scheduler
+
+failures = []
+
+
+def check(name, ok, detail=""):
+    print(f"{'ok  ' if ok else 'FAIL'} {name}{f' ({detail})' if detail else ''}")
+    if not ok:
+        failures.append(name)
+
+
+def plan_loop(planner, days):
+    """The same constraints, one random draw per slot (no blackouts)."""
+    rng = random.Random(planner.seed)
+    plan = []
+    for day in range(days):
+        start = datetime.combine(planner.start_day + timedelta(days=day), datetime.min.time()) + timedelta(hours=9)
+        offset = 0
+        while True:
+            offset += rng.randint(planner.min_gap, planner.max_gap)
+            if offset >= planner.active_minutes:
+                break
+            plan.append(start + timedelta(minutes=offset))
+    return plan
+
+
+def minutes(moment):
+    return moment.hour * 60 + moment.minute
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="EMA schedule planner")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=2024)
+    args = parser.parse_args(argv)
+
+    start_day = date(2025, 3, 3)
+    planner = SchedulePlanner(args.seed, start_day)
+    started = time.perf_counter()
+    plan = planner.plan(args.days)
+    vectorized = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    plan_loop(planner, args.days)
+    loop = (time.perf_counter() - started) * 1000
+    print(f"{args.days} days, {len(plan)} sessions: one pass {vectorized:.1f} ms, slot by slot {loop:.1f} ms")
+
+    gaps = [(b - a).total_seconds() / 60 for a, b in zip(plan, plan[1:]) if a.date() == b.date()]
+    firsts = [b for a, b in zip([None] + plan, plan) if a is None or a.date() != b.date()]
+    check("inside 9:00-21:00", all(9 * 60 <= minutes(t) < 21 * 60 for t in plan))
+    check("gaps within 90-150 min", 90 <= min(gaps) and max(gaps) <= 150, f"{min(gaps):.0f}-{max(gaps):.0f}")
+    check("first start 90-150 min after 9:00", all(90 <= minutes(t) - 540 <= 150 for t in firsts))
+    check("same seed, same plan", SchedulePlanner(args.seed, start_day).plan(args.days) == plan)
+    check("planning further keeps earlier days", SchedulePlanner(args.seed, start_day).plan(args.days * 2)[:len(plan)] == plan)
+    check("another seed, another plan", SchedulePlanner(args.seed + 1, start_day).plan(args.days) != plan)
+    check("device seeds differ", planner.derive("ipad-1").plan(7) != planner.derive("ipad-2").plan(7)
+          and planner.derive("ipad-1").plan(7) == planner.derive("ipad-1").plan(7))
+
+    off = {start_day + timedelta(days=day) for day in (1, 5)}
+    constrained = SchedulePlanner(args.seed, start_day, min_gap=60, max_gap=120, daily_quota=5,
+                                  blackouts=[("12:00", "13:30"), ("17:00", "18:00")], blackout_dates=off)
+    plan = constrained.plan(args.days)
+    per_day = {}
+    for moment in plan:
+        per_day[moment.date()] = per_day.get(moment.date(), 0) + 1
+    check("daily quota", max(per_day.values()) <= 5, f"max {max(per_day.values())} a day")
+    check("no start in a blackout", not any(720 <= minutes(t) < 810 or 1020 <= minutes(t) < 1080 for t in plan))
+    check("no start on blackout dates", not off & set(per_day))
+
+    scheduler = Scheduler(None, planner=planner)
+    first = scheduler.next_planned(datetime.combine(start_day, datetime.min.time()))
+    check("Scheduler walks the plan", first == planner.plan(1)[0] and scheduler.next_planned(first) == planner.plan(1)[1])
+    late = scheduler.next_planned(datetime.combine(start_day + timedelta(days=400), datetime.min.time()))
+    check("Scheduler plans further ahead when needed", late.date() == start_day + timedelta(days=400), f"{scheduler.plan_days} days planned")
+
+    with tempfile.TemporaryDirectory(prefix="plan_") as directory:
+        path = os.path.join(directory, "plan.csv")
+        started = time.perf_counter()
+        constrained.export(path, args.days)
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        print(f"export: {len(lines)} lines in {(time.perf_counter() - started) * 1000:.1f} ms")
+        print("  " + "\n  ".join(lines[:5]))
+        check("export has every session", len(lines) == len(plan) + 2)
+
+    print("all checks ok" if not failures else f"{len(failures)} check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,350 @@
+"""
+Microbenchmarks for the server hot paths, each run in isolation:
+line framing + dispatch (process_received_message), the per-line loggers,
+Scheduler.get_next_start_time, ReportCounters.save (a journaled counter write),
+QRCodeDisplay.generate_qr and BCI2000Handler.check_bci2000_running_status
+(on a tracked, live PID: this process stands in for SignalGenerator.exe).
+
+Tk, sockets and BCI2000 are stubbed out, and every file the benchmarks
+write goes to a temporary directory. For each benchmark the suite reports
+ns/op (p50 / p90 / p99 over timed batches), the peak memory allocated by
+one op and the memory still allocated after it (tracemalloc, all threads).
+
+Results can be saved as JSON and compared with an earlier run; the exit
+code is 1 if any p50 got slower than the baseline by more than --threshold.
+
+Run from the project root:
+    python "testing tools/bench_suite.py" --save bench_before.json
+    python "testing tools/bench_suite.py" --baseline bench_before.json --threshold 0.2
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from datetime import datetime
+
+import psutil
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_dispatch_latency import StubUI, StubReporter
+from connection.connection_handler import ConnectionManager
+from connection.device_session import DeviceSession
+from core.journal import Journal
+from core.report_counters import ReportCounters
+from core.state_store import StateStore
+from utils.logger.log_writer import LogWriter
+from utils.scheduler.scheduler import Scheduler
+from utils.scheduler.timer_scheduler import TimerScheduler
+
+BENCHMARKS = []
+
+
+def benchmark(name, items=1):
+    """
+    Registers a benchmark. The decorated generator sets up, yields the
+    operation to time and tears down when resumed; `items` divides the
+    time of one operation (e.g. lines per chunk).
+    """
+    def register(factory):
+        BENCHMARKS.append((name, items, factory))
+        return factory
+    return register
+
+
+class Environment:
+    """Shared stubs: a ConnectionManager on an ephemeral port whose logs go to a temp directory."""
+
+    def __init__(self):
+        self.tmp = tempfile.TemporaryDirectory(prefix="bench_")
+        self.timers = TimerScheduler(name="BenchTimers")
+        self.log_writer = LogWriter()
+        self.manager = ConnectionManager(StubUI(), None, StubReporter(), port=0, log_writer=self.log_writer, timers=self.timers,
+                                         log_dir=self.tmp.name)
+        self.manager.server_log_file = self.path("server_log.txt")
+        self.manager.latency_log_file = self.path("latency_log.txt")
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def session(self):
+        session = DeviceSession(self.manager, None, ("127.0.0.1", 50000))
+        session.ema_log_file = self.path("ema_log.txt")
+        return session
+
+    def close(self):
+        self.manager.stop_server()
+        self.timers.stop()
+        self.tmp.cleanup()
+
+
+def make_chunk(lines=64):
+    out = []
+    for i in range(lines):
+        if i % 8 == 0:
+            out.append(f"LIVE_CHECK_ACK:{900 + i}:LATENCY:12.5")   # unknown ID: logged and counted
+        elif i % 8 == 1:
+            out.append(f"BCI_Sync:{1760000000000 + i}")
+        else:
+            out.append(f"Q{i}: Wie fühlen Sie sich gerade? Antwort={i}")
+    return ("\n".join(out) + "\n").encode('utf-8')
+
+
+@benchmark("framing+dispatch per line", items=64)
+def bench_framing_dispatch(env):
+    session = env.session()
+    chunk = make_chunk(64)
+    yield lambda: env.manager.process_received_message(chunk, session)
+
+
+@benchmark("framing+dispatch per line, 7-byte fragments", items=64)
+def bench_framing_fragmented(env):
+    session = env.session()
+    chunk = make_chunk(64)
+    pieces = [chunk[i:i + 7] for i in range(0, len(chunk), 7)]
+
+    def op():
+        for piece in pieces:
+            env.manager.process_received_message(piece, session)
+    yield op
+
+
+@benchmark("log_timestamped")
+def bench_log_timestamped(env):
+    yield lambda: env.manager.log_timestamped("[pad01] Received LIVE_CHECK_ACK:17 - Latency: 12.500 ms, RTT: 25.000 ms")
+    env.log_writer.flush()
+
+
+@benchmark("log_ema_message")
+def bench_log_ema_message(env):
+    session = env.session()
+    yield lambda: env.manager.log_ema_message("Q3: Wie fühlen Sie sich gerade? Antwort=42", session)
+    env.log_writer.flush()
+
+
+@benchmark("log_latency_timestamped")
+def bench_log_latency(env):
+    yield lambda: env.manager.log_latency_timestamped("Sent photodiode signal: FLASH_ON - Screen color: WHITE")
+    env.log_writer.flush()
+
+
+@benchmark("Scheduler.get_next_start_time")
+def bench_next_start_time(env):
+    scheduler = Scheduler(None, timers=env.timers)
+    scheduler.is_first_session = False
+    yield scheduler.get_next_start_time
+
+
+@benchmark("ReportCounters.save")
+def bench_report_counters(env):
+    state = StateStore(triggered=12, responded=9, completed=8, ignored=3)
+    journal = Journal(env.path("journal"), fsync=False)
+    counters = ReportCounters(state, journal)
+    yield counters.save
+    counters.unsubscribe()
+    journal.close()
+
+
+@benchmark("QRCodeDisplay.generate_qr(600)")
+def bench_generate_qr(env):
+    from utils.qrcode import qrcode_display
+    # PhotoImage needs a Tk root; the PIL work is what is measured
+    original = qrcode_display.ImageTk
+    qrcode_display.ImageTk = types.SimpleNamespace(PhotoImage=lambda image: image)
+    display = qrcode_display.QRCodeDisplay.__new__(qrcode_display.QRCodeDisplay)
+    yield lambda: display.generate_qr(600)
+    qrcode_display.ImageTk = original
+
+
+@benchmark("BCI2000Handler.check_bci2000_running_status")
+def bench_bci2000_status(env):
+    try:
+        import BCI2000Remote    # noqa: F401
+    except ImportError:
+        stub = types.ModuleType("BCI2000Remote")
+        stub.BCI2000Remote = type("BCI2000Remote", (), {"Connect": lambda self: None})
+        sys.modules["BCI2000Remote"] = stub
+    from utils.bci2000.bci2000_handler import BCI2000Handler
+    from utils.bci2000.process_liveness import PsutilProcessTable
+
+    class ThisProcessTable(PsutilProcessTable):
+        """Finds this process as the BCI2000 module, so the tracked PID path is timed; alive() is the real psutil check."""
+
+        def scan(self, names):
+            return [(os.getpid(), psutil.Process().create_time())]
+
+    handler = BCI2000Handler(lambda message: None, lambda subject, body: None, timers=env.timers,
+                             process_table=ThisProcessTable())
+    handler.monitor_task.cancel()
+    assert handler.check_bci2000_running_status() and handler.liveness.pid == os.getpid()
+    yield handler.check_bci2000_running_status
+    assert handler.liveness.stats()["scans"] == 1, "the benchmark rescanned instead of checking the tracked PID"
+    handler.stop()
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def measure(op, items, min_time=0.5, batches=100):
+    # Calibrate the batch size so one batch takes min_time / batches
+    target_ns = min_time * 1e9 / batches
+    repeat = 1
+    while True:
+        start = time.perf_counter_ns()
+        for _ in range(repeat):
+            op()
+        elapsed = time.perf_counter_ns() - start
+        if elapsed >= target_ns or repeat >= 1 << 20:
+            break
+        repeat = max(repeat * 2, int(repeat * target_ns / max(elapsed, 1)))
+
+    gc.collect()
+    per_op = []
+    for _ in range(batches):
+        start = time.perf_counter_ns()
+        for _ in range(repeat):
+            op()
+        per_op.append((time.perf_counter_ns() - start) / repeat / items)
+    per_op.sort()
+
+    # Allocation pass, separate so tracing does not skew the timings
+    calls = max(1, min(repeat, 200))
+    tracemalloc.start()
+    op()
+    peaks = 0
+    start_current, _ = tracemalloc.get_traced_memory()
+    for _ in range(calls):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        op()
+        peaks += tracemalloc.get_traced_memory()[1] - before
+    end_current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "items_per_op": items,
+        "ops": repeat * batches,
+        "ns_per_item": {
+            "mean": sum(per_op) / len(per_op),
+            "min": per_op[0],
+            "p50": percentile(per_op, 50),
+            "p90": percentile(per_op, 90),
+            "p99": percentile(per_op, 99),
+        },
+        "peak_alloc_bytes_per_op": peaks / calls,
+        "retained_bytes_per_op": (end_current - start_current) / calls,
+    }
+
+
+def run_suite(selected=None, min_time=0.5):
+    results = {}
+    # The loggers echo to stdout from their own thread; keep the report readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        env = Environment()
+        try:
+            for name, items, factory in BENCHMARKS:
+                if selected and not any(token in name for token in selected):
+                    continue
+                steps = factory(env)
+                try:
+                    op = next(steps)
+                    results[name] = measure(op, items, min_time=min_time)
+                except Exception as e:
+                    results[name] = {"skipped": f"{type(e).__name__}: {e}"}
+                next(steps, None)   # teardown
+        finally:
+            env.close()
+    return results
+
+
+def format_ns(ns):
+    if ns >= 1e6:
+        return f"{ns / 1e6:.2f} ms"
+    if ns >= 1e3:
+        return f"{ns / 1e3:.2f} us"
+    return f"{ns:.0f} ns"
+
+
+def print_results(results, baseline=None):
+    print(f"{'benchmark':<48} {'p50':>10} {'p90':>10} {'p99':>10} {'peak B/op':>10} {'kept B/op':>10} {'vs base':>8}")
+    for name, result in results.items():
+        if "skipped" in result:
+            print(f"{name:<48} skipped ({result['skipped']})")
+            continue
+        ns = result["ns_per_item"]
+        change = ""
+        base = (baseline or {}).get(name)
+        if base and "ns_per_item" in base:
+            change = f"{ns['p50'] / base['ns_per_item']['p50'] - 1:+.0%}"
+        print(f"{name:<48} {format_ns(ns['p50']):>10} {format_ns(ns['p90']):>10} {format_ns(ns['p99']):>10} "
+              f"{result['peak_alloc_bytes_per_op']:>10.0f} {result['retained_bytes_per_op']:>10.0f} {change:>8}")
+
+
+def regressions(results, baseline, threshold):
+    failed = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or "ns_per_item" not in base or "ns_per_item" not in result:
+            continue
+        ratio = result["ns_per_item"]["p50"] / base["ns_per_item"]["p50"]
+        if ratio > 1 + threshold:
+            failed.append((name, ratio))
+    return failed
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the server hot paths")
+    parser.add_argument("only", nargs="*", help="run only benchmarks whose name contains one of these")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds of timed batches per benchmark")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p50 slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.only, min_time=args.min_time)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({
+                "meta": {
+                    "created": datetime.now().isoformat(timespec="seconds"),
+                    "revision": git_revision(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                },
+                "results": results,
+            }, f, indent=2)
+
+    if baseline is not None:
+        failed = regressions(results, baseline, args.threshold)
+        for name, ratio in failed:
+            print(f"REGRESSION: {name} is {ratio - 1:.0%} slower than the baseline (threshold {args.threshold:.0%})")
+        return 1 if failed else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Event-to-screen latency and coalescing of the UI refresh pipeline
+(ui/refresh_loop.py + core/report_counters.py) under bursts of state
+changes from several threads.
+
+Tk's event loop is emulated by a single thread running after() callbacks
+(no display needed); --tk uses a real Tk root instead. render() sleeps
+--render-ms to stand in for label reconfiguration.
+
+Run from the project root:
+    python "testing tools/bench_ui_refresh.py" --threads 4 --bursts 50 --burst-size 200
+"""
+import argparse
+import heapq
+import itertools
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.journal import Journal
+from core.report_counters import ReportCounters
+from core.state_store import StateStore
+from ui.refresh_loop import RefreshLoop
+from utils.scheduler.timer_scheduler import TimerScheduler
+
+
+class FakeTk:
+    """One thread running after() callbacks in deadline order, like Tk's mainloop."""
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+        self._running = True
+
+    def after(self, ms, callback):
+        heapq.heappush(self._heap, (time.perf_counter() + ms / 1000, next(self._counter), callback))
+
+    def mainloop(self):
+        while self._running:
+            if not self._heap:
+                time.sleep(0.001)
+                continue
+            deadline, _, callback = self._heap[0]
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(min(delay, 0.001))
+                continue
+            heapq.heappop(self._heap)
+            callback()
+
+    def quit(self):
+        self._running = False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="UI refresh pipeline latency and coalescing")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--bursts", type=int, default=50)
+    parser.add_argument("--burst-size", type=int, default=200, help="state changes per burst per thread")
+    parser.add_argument("--gap-ms", type=float, default=20, help="pause between bursts")
+    parser.add_argument("--frame-ms", type=int, default=50)
+    parser.add_argument("--render-ms", type=float, default=2.0)
+    parser.add_argument("--tk", action="store_true", help="use a real Tk root (needs a display)")
+    args = parser.parse_args(argv)
+
+    if args.tk:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+    else:
+        root = FakeTk()
+
+    timers = TimerScheduler(name="BenchTimers")
+    state = StateStore()
+    renders = []
+
+    def render(keys, snapshot):
+        renders.append(len(keys))
+        time.sleep(args.render_ms / 1000)
+
+    with tempfile.TemporaryDirectory(prefix="ui_refresh_") as directory:
+        journal = Journal(directory)
+        counters = ReportCounters(state, journal, timers=timers)
+        writes_before = counters.writes
+        loop = RefreshLoop(root.after, state, render, frame_ms=args.frame_ms)
+        root.after(0, lambda: loop.start([]))
+
+        def producer(index):
+            keys = ("triggered", "responded", "completed", "ignored")
+            for _ in range(args.bursts):
+                for _ in range(args.burst_size):
+                    state.increment(keys[index % len(keys)])
+                time.sleep(args.gap_ms / 1000)
+
+        def run():
+            threads = [threading.Thread(target=producer, args=(i,)) for i in range(args.threads)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            time.sleep((args.frame_ms * 2 + args.render_ms) / 1000 + counters.save_delay)
+            root.after(0, root.quit)
+
+        started = time.perf_counter()
+        threading.Thread(target=run, daemon=True).start()
+        root.mainloop()
+        elapsed = time.perf_counter() - started
+        loop.stop()
+        counters.close()
+        journal.close()
+        writes = counters.writes - writes_before
+    timers.stop()
+
+    stats = loop.stats()
+    latency = stats["latency_ms"]
+    events = args.threads * args.bursts * args.burst_size
+    print(f"{events} state changes from {args.threads} threads in {elapsed:.2f} s")
+    print(f"redraws: {stats['frames']} ({stats['events'] / max(1, stats['frames']):.0f} changes per redraw), "
+          f"journaled counter writes: {writes}")
+    print(f"event-to-screen ms: p50 {latency['p50']:.1f}, p99 {latency['p99']:.1f}, max {latency['max']:.1f} "
+          f"(bound: frame {args.frame_ms} ms + render {args.render_ms} ms)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
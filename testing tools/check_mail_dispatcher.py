@@ -0,0 +1,153 @@
+"""
+Checks MailDispatcher (utils/reporter/mail_dispatcher.py) against the
+in-process SMTP stand-in (smtp_standin.py):
+  1. a burst of sends goes out over one connection and send() never waits
+  2. with the server down, messages are retried with backoff and delivered
+     once it comes up
+  3. messages left in the outbox by a stopped dispatcher go out after a restart
+  4. a slow server does not slow down send()
+  5. a message that keeps failing moves to <outbox>/failed
+
+Run from the project root:
+    python "testing tools/check_mail_dispatcher.py"
+"""
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.reporter.mail_dispatcher import MailDispatcher
+from smtp_standin import SMTPStandIn
+
+failures = []
+
+
+def check(name, ok, detail=""):
+    print(f"{'ok  ' if ok else 'FAIL'} {name}{f' ({detail})' if detail else ''}")
+    if not ok:
+        failures.append(name)
+
+
+def config(port):
+    return {"smtp_server": "127.0.0.1", "port": port, "ssl": False, "timeout": 5,
+            "sender": "hub@example.org", "password": "secret", "recipient": ["lab@example.org"]}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+def send_times(dispatcher, count, prefix):
+    times = []
+    for index in range(count):
+        started = time.perf_counter()
+        dispatcher.send(f"{prefix} {index}", f"body {index}")
+        times.append((time.perf_counter() - started) * 1000)
+    return times
+
+
+def returns_at_once(times):
+    """send() only queues: typically microseconds; the max allows for a thread switch, not disk or SMTP."""
+    median = sorted(times)[len(times) // 2]
+    return median < 1 and max(times) < 50, f"median {median:.2f} ms, max {max(times):.2f} ms"
+
+
+def quiet(message):
+    pass
+
+
+def burst(directory):
+    server = SMTPStandIn()
+    dispatcher = MailDispatcher(config(server.port), os.path.join(directory, "burst"), log=quiet)
+    times = send_times(dispatcher, 20, "burst")
+    delivered = wait_for(lambda: len(server.messages) == 20)
+    check("burst delivered", delivered, f"{len(server.messages)}/20")
+    check("burst used one connection", server.connections == 1, f"{server.connections} connections")
+    check("send() returns at once", *returns_at_once(times))
+    subjects = [next(line for line in data.splitlines() if line.startswith("Subject:")) for _, _, data in server.messages]
+    check("burst kept its order", subjects == [f"Subject: burst {i}" for i in range(20)])
+    dispatcher.close()
+    server.close()
+
+
+def server_down(directory):
+    port = free_port()
+    dispatcher = MailDispatcher(config(port), os.path.join(directory, "down"), log=quiet,
+                                base_delay=0.2, max_delay=1.0)
+    send_times(dispatcher, 3, "down")
+    time.sleep(0.8)
+    attempts = [entry["attempts"] for entry in dispatcher._pending]
+    check("retried while the server was down", dispatcher.pending() == 3 and max(attempts) >= 2, f"attempts {attempts}")
+    server = SMTPStandIn(port=port)
+    delivered = wait_for(lambda: len(server.messages) == 3)
+    check("delivered after the server came up", delivered, f"{len(server.messages)}/3")
+    check("outbox empty afterwards", wait_for(lambda: not any(name.endswith(".json") for name in os.listdir(dispatcher.outbox_dir))))
+    dispatcher.close()
+    server.close()
+
+
+def restart(directory):
+    port = free_port()
+    outbox = os.path.join(directory, "restart")
+    dispatcher = MailDispatcher(config(port), outbox, log=quiet, base_delay=60)
+    send_times(dispatcher, 4, "restart")
+    wait_for(lambda: any(entry["attempts"] for entry in dispatcher._pending))
+    dispatcher.close()
+    check("outbox kept unsent messages", len([n for n in os.listdir(outbox) if n.endswith(".json")]) == 4)
+    server = SMTPStandIn(port=port)
+    dispatcher = MailDispatcher(config(port), outbox, log=quiet, base_delay=60)
+    delivered = wait_for(lambda: len(server.messages) == 4)
+    check("delivered after restart", delivered, f"{len(server.messages)}/4")
+    dispatcher.close()
+    server.close()
+
+
+def slow_server(directory):
+    server = SMTPStandIn(greeting_delay=1.0)
+    dispatcher = MailDispatcher(config(server.port), os.path.join(directory, "slow"), log=quiet)
+    times = send_times(dispatcher, 5, "slow")
+    check("send() unaffected by a slow server", *returns_at_once(times))
+    delivered = wait_for(lambda: len(server.messages) == 5)
+    check("slow server got everything", delivered, f"{len(server.messages)}/5")
+    dispatcher.close()
+    server.close()
+
+
+def give_up(directory):
+    outbox = os.path.join(directory, "give_up")
+    dispatcher = MailDispatcher(config(free_port()), outbox, log=quiet,
+                                max_attempts=3, base_delay=0.05, max_delay=0.1)
+    dispatcher.send("doomed", "never delivered")
+    moved = wait_for(lambda: dispatcher.failed == 1)
+    check("gave up after max_attempts", moved and len(os.listdir(dispatcher.failed_dir)) == 1, str(dispatcher.stats()))
+    dispatcher.close()
+
+
+def main():
+    with tempfile.TemporaryDirectory(prefix="mail_") as directory:
+        burst(directory)
+        server_down(directory)
+        restart(directory)
+        slow_server(directory)
+        give_up(directory)
+    print("all checks ok" if not failures else f"{len(failures)} check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
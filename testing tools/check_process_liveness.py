@@ -0,0 +1,142 @@
+"""
+Checks the BCI2000 process liveness tracker (utils/bci2000/process_liveness.py)
+against a fake process table, then compares the cost of a full psutil scan
+with the tracked-PID check on this machine.
+
+Scenarios: found once and then tracked by PID, the process dying and being
+restarted by a watchdog under a new PID, a reused PID (same number, new
+create time), and rescans backing off while the process stays missing.
+
+Run from the project root (any OS):
+    python "testing tools/check_process_liveness.py"
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psutil
+from utils.bci2000.process_liveness import ProcessLiveness, PsutilProcessTable
+
+failures = []
+TARGET = "SignalGenerator.exe"
+
+
+def check(name, ok, detail=""):
+    print(f"{'ok  ' if ok else 'FAIL'} {name}{f' ({detail})' if detail else ''}")
+    if not ok:
+        failures.append(name)
+
+
+class FakeProcessTable:
+    """pid -> (name, create time); counts how it is queried."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.processes = {4: ("System", 0.0), 812: ("explorer.exe", 1.0)}
+        self.scans = 0
+        self.lookups = 0
+
+    def start(self, name, pid):
+        self.processes[pid] = (name, self.clock())
+
+    def kill(self, pid):
+        self.processes.pop(pid, None)
+
+    def scan(self, names):
+        self.scans += 1
+        return [(pid, created) for pid, (name, created) in self.processes.items() if name in names]
+
+    def alive(self, pid, create_time):
+        self.lookups += 1
+        process = self.processes.get(pid)
+        return process is not None and process[1] == create_time
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def tick(clock, liveness, seconds):
+    """Calls check() once a second, like BCI2000Handler.monitor_connection."""
+    results = []
+    for _ in range(seconds):
+        clock.now += 1
+        results.append(liveness.check())
+    return results
+
+
+def fake_table_scenarios():
+    clock = Clock()
+    table = FakeProcessTable(clock)
+    table.start(TARGET, 5120)
+    liveness = ProcessLiveness({TARGET}, table=table, clock=clock)
+
+    results = tick(clock, liveness, 600)
+    check("found once, then tracked by PID", all(results) and table.scans == 1 and table.lookups == 599,
+          f"{table.scans} scans, {table.lookups} lookups in 600 checks")
+
+    table.kill(5120)
+    table.start(TARGET, 6004)
+    scans = table.scans
+    check("restarted process found on the next check", liveness.check() and liveness.pid == 6004 and table.scans == scans + 1)
+
+    table.kill(6004)
+    table.processes[6004] = (TARGET, clock.now + 5)     # same PID number, a new process
+    liveness.check()
+    check("reused PID detected by its create time", liveness.create_time == clock.now + 5 and table.scans == scans + 2)
+
+    table.kill(6004)
+    clock.now += 1
+    scans = table.scans
+    results = tick(clock, liveness, 300)
+    scan_count = table.scans - scans
+    check("missing process rescanned with backoff", not any(results) and scan_count <= 16,
+          f"{scan_count} scans in 300 s instead of 300, backoff now {liveness.stats()['backoff']:.0f} s")
+
+    table.start(TARGET, 7100)
+    results = tick(clock, liveness, 40)
+    first = results.index(True)
+    check("back within max_rescan of returning", first <= 30 and all(results[first:]), f"after {first + 1} s")
+
+
+def real_cost():
+    """Full psutil scan vs tracked PID check, for a process that does exist here."""
+    name = psutil.Process().name()
+    table = PsutilProcessTable()
+    matches = table.scan({name})
+    check("psutil table finds this process", any(pid == os.getpid() for pid, _ in matches), name)
+
+    rounds = 200
+    started = time.perf_counter()
+    for _ in range(rounds):
+        table.scan({name})
+    scan = (time.perf_counter() - started) / rounds
+
+    liveness = ProcessLiveness({name}, table=table)
+    liveness.check()
+    started = time.perf_counter()
+    for _ in range(rounds):
+        liveness.check()
+    tracked = (time.perf_counter() - started) / rounds
+
+    process_count = len(psutil.pids())
+    print(f"{process_count} processes: full scan {scan * 1e6:.0f} us, tracked PID check {tracked * 1e6:.1f} us "
+          f"({scan / tracked:.0f}x less per monitor tick)")
+    check("tracked check stays tracked", liveness.stats()["scans"] == 1)
+
+
+def main():
+    fake_table_scenarios()
+    real_cost()
+    print("all checks ok" if not failures else f"{len(failures)} check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+Checks that the EMA Scheduler survives a restart (utils/scheduler/scheduler.py):
+  1. a restart before the next start re-arms that same start, without
+     replanning, and no session is started twice
+  2. a start missed while the server was down is fired, skipped or
+     re-randomized according to missed_start_policy
+  3. the delay to a start across a DST change is the real elapsed time
+  4. a corrupt state file is ignored
+
+Runs on a VirtualTimerScheduler, so hours of downtime take no time.
+
+Run from the project root:
+    python "testing tools/check_scheduler_resume.py"
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.scheduler.schedule_planner import SchedulePlanner
+from utils.scheduler.scheduler import Scheduler
+from utils.scheduler.timer_scheduler import VirtualTimerScheduler
+
+failures = []
+STUDY_DAY = date(2025, 3, 3)
+
+
+def check(name, ok, detail=""):
+    print(f"{'ok  ' if ok else 'FAIL'} {name}{f' ({detail})' if detail else ''}")
+    if not ok:
+        failures.append(name)
+
+
+class Server:
+    """The connection manager as the Scheduler sees it; records every start."""
+
+    def __init__(self, timers):
+        self.timers = timers
+        self.starts = []
+        self.scheduler = None
+
+    def log_timestamped(self, message):
+        pass
+
+    def send_start_signal(self):
+        self.starts.append(self.timers.wall_clock())
+        self.scheduler.schedule_start()
+
+
+def boot(state_path, timers, policy="skip", planner=None):
+    server = Server(timers)
+    server.scheduler = Scheduler(server, timers=timers, planner=planner or SchedulePlanner(11, STUDY_DAY),
+                                 state_path=state_path, missed_start_policy=policy)
+    return server
+
+
+def crash(server):
+    """The process dies: its timer never fires."""
+    server.scheduler.timer.cancel()
+
+
+def run_study_until(state_path, moment):
+    timers = VirtualTimerScheduler(datetime.combine(STUDY_DAY, datetime.min.time()) + timedelta(hours=8))
+    server = boot(state_path, timers)
+    server.scheduler.schedule_start()
+    timers.run_until(moment)
+    return timers, server
+
+
+def restart_before_start(directory):
+    state_path = os.path.join(directory, "before.json")
+    plan = SchedulePlanner(11, STUDY_DAY).plan(2)
+    timers, server = run_study_until(state_path, plan[1] + timedelta(minutes=10))
+    armed = server.scheduler.armed
+    crash(server)
+    timers.advance(300)
+
+    started = time.perf_counter()
+    server = boot(state_path, timers, planner=SchedulePlanner(99, STUDY_DAY))
+    resumed = server.scheduler.resume()
+    elapsed = (time.perf_counter() - started) * 1000
+    check("resumes the armed start", resumed == armed == plan[2], f"{resumed}")
+    check("resumes the study's seed, not a new one", server.scheduler.planner.seed == 11)
+    check("resume does not replan", server.scheduler.plan_days == 0, f"{elapsed:.2f} ms")
+    timers.run_until(datetime.combine(STUDY_DAY, datetime.min.time()) + timedelta(days=1, hours=23))
+    check("no start fired twice, none skipped", server.starts == [t for t in plan if t > resumed - timedelta(seconds=1)][:len(server.starts)]
+          and len(server.starts) >= 5, f"{len(server.starts)} starts after the restart")
+
+
+def missed(directory, policy):
+    state_path = os.path.join(directory, f"missed_{policy}.json")
+    plan = SchedulePlanner(11, STUDY_DAY).plan(2)
+    timers, server = run_study_until(state_path, plan[1] + timedelta(minutes=10))
+    crash(server)
+    # Down from just before plan[2] until 20 minutes after it
+    timers.run_until(plan[2] + timedelta(minutes=20))
+    now = timers.wall_clock()
+
+    server = boot(state_path, timers, policy)
+    resumed = server.scheduler.resume()
+    if policy == "fire":
+        check("fire: starts right away", timedelta(0) <= resumed - now <= timedelta(seconds=5), f"{resumed:%H:%M:%S}")
+    elif policy == "skip":
+        check("skip: waits for the next planned start", resumed == plan[3], f"{resumed:%H:%M}")
+    else:
+        latest = plan[3] - timedelta(minutes=90)
+        check("rerandomize: between now and min_gap before the next planned start",
+              now <= resumed <= max(now, latest), f"{resumed:%H:%M:%S}, latest {latest:%H:%M}")
+        again = boot(state_path, timers, policy)
+        again.scheduler.save = lambda: None
+        check("rerandomize: reproducible", again.scheduler.resume() == resumed)
+
+    timers.run_until(plan[3] + timedelta(minutes=1))
+    gaps = [(b - a).total_seconds() / 60 for a, b in zip(server.starts, server.starts[1:])]
+    check(f"{policy}: keeps the plan afterwards", plan[3] in server.starts, f"starts {[f'{t:%H:%M}' for t in server.starts]}")
+    if policy != "fire":
+        check(f"{policy}: min_gap kept", all(gap >= 90 for gap in gaps), f"gaps {gaps}")
+
+
+def missed_at_night(directory):
+    state_path = os.path.join(directory, "night.json")
+    plan = SchedulePlanner(11, STUDY_DAY).plan(3)
+    last_today = max(t for t in plan if t.date() == STUDY_DAY)
+    timers, server = run_study_until(state_path, last_today - timedelta(minutes=1))
+    crash(server)
+    timers.run_until(datetime.combine(STUDY_DAY, datetime.min.time()) + timedelta(hours=23, minutes=30))
+    server = boot(state_path, timers, "fire")
+    resumed = server.scheduler.resume()
+    first_tomorrow = min(t for t in plan if t.date() > STUDY_DAY)
+    check("fire outside the window waits for the next planned start", resumed == first_tomorrow, f"{resumed}")
+
+
+def dst(directory):
+    if not hasattr(time, "tzset"):
+        print("skip DST check (no time.tzset on this platform)")
+        return
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = "America/New_York"
+    time.tzset()
+    try:
+        # Clocks jump from 2:00 to 3:00 on 2025-03-09: 01:30 -> 03:30 is one hour
+        timers = VirtualTimerScheduler(datetime(2025, 3, 9, 1, 30))
+        server = boot(None, timers)
+        server.scheduler.is_first_session = False
+        server.scheduler._arm(datetime(2025, 3, 9, 3, 30))
+        delay = server.scheduler.timer.deadline - timers.now
+        check("delay across DST is the real elapsed time", delay == 3600, f"{delay:.0f} s")
+    finally:
+        if previous is None:
+            os.environ.pop("TZ", None)
+        else:
+            os.environ["TZ"] = previous
+        time.tzset()
+
+
+def corrupt(directory):
+    state_path = os.path.join(directory, "corrupt.json")
+    with open(state_path, "w") as f:
+        f.write('{"planner": {"seed": 1')
+    timers = VirtualTimerScheduler(datetime(2025, 3, 3, 8, 0))
+    server = boot(state_path, timers)
+    check("corrupt state file is ignored", server.scheduler.resume() is None)
+
+
+def main():
+    with tempfile.TemporaryDirectory(prefix="scheduler_") as directory:
+        restart_before_start(directory)
+        for policy in ("fire", "skip", "rerandomize"):
+            missed(directory, policy)
+        missed_at_night(directory)
+        dst(directory)
+        corrupt(directory)
+    print("all checks ok" if not failures else f"{len(failures)} check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+Checks session resumption end to end, in process: a real ConnectionManager
+on an ephemeral port and one resumable simulated iPad.
+
+1. The iPad drops; an EMA_START sent while it is away must arrive exactly
+   once after it resumes. Reports how long the catch-up took.
+2. The iPad's Session_Complete reaches the server but the SACK is lost
+   with the connection; SEQ_WELCOME must stop the replay, and a duplicate
+   sent anyway must not be counted twice.
+3. An iPad message written into a dead socket (never reaches the server)
+   must be delivered by the replay.
+4. An iPad back after resume_window gets a fresh session: the EMA_START
+   held for it is stale and must not be replayed.
+
+Run from the project root:
+    python "testing tools/check_session_resume.py"
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_dispatch_latency import StubUI, StubReporter
+from simulated_client import ClientPool, ClientProfile
+from connection.connection_handler import ConnectionManager
+from utils.logger.log_writer import LogWriter
+
+DEVICE = "pad-resume"
+
+
+class QuietLogWriter(LogWriter):
+    def write(self, path, message, timestamped=True, echo=False, at=None):
+        super().write(path, message, timestamped=timestamped, echo=False, at=at)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.005)
+    return False
+
+
+def on_pool(pool, callback):
+    """Runs callback on the pool thread and waits for it."""
+    done = []
+    pool.call_later(0, lambda: done.append(callback()))
+    wait_for(lambda: done)
+
+
+def check(name, ok, detail=""):
+    print(f"{'ok  ' if ok else 'FAIL'} {name}{': ' + detail if detail else ''}")
+    return ok
+
+
+def main():
+    # Logs and the pending EMA queue go to a temp directory, never the study's logs/
+    log_dir = tempfile.TemporaryDirectory(prefix="session_resume_")
+    manager = ConnectionManager(StubUI(), None, StubReporter(), port=0, log_writer=QuietLogWriter(), log_dir=log_dir.name)
+    port = manager.server.getsockname()[1]
+    # Long delays: nothing happens in the client unless the check asks for it
+    profile = ClientProfile(resume=True, ignore_probability=1.0, reconnect_delay=(3600, 3600))
+    pool = ClientPool("localhost", port)
+    client = pool.add(DEVICE, profile)
+    pool.start()
+    results = []
+    try:
+        results.append(check("handshake", wait_for(lambda: client.welcomed and DEVICE in manager.sessions)))
+        session = manager.sessions[DEVICE]
+
+        # 1. Server -> iPad message while the iPad is away
+        on_pool(pool, lambda: client.drop(reconnect=False))
+        wait_for(lambda: not session.connected)
+        manager.send_start_signal(DEVICE)
+        before = client.received.get("EMA_START_Test", 0)
+        started = time.perf_counter()
+        on_pool(pool, client.connect)
+        arrived = wait_for(lambda: client.received.get("EMA_START_Test", 0) > before)
+        catch_up_ms = (time.perf_counter() - started) * 1000
+        time.sleep(0.1)
+        results.append(check("EMA_START replayed after resume", arrived and client.received["EMA_START_Test"] == before + 1,
+                             f"catch-up {catch_up_ms:.1f} ms after reconnect"))
+
+        # 2. iPad -> server message whose SACK is lost
+        on_pool(pool, lambda: setattr(client, "in_ema", True) or client.complete_ema())
+        wait_for(lambda: session.completed_count == 1)
+        wait_for(lambda: not client.unacked)
+
+        def lose_sack():
+            client.unacked = [(client.out_seq, "Session_Complete")]
+            client.drop(reconnect=False)
+        on_pool(pool, lose_sack)
+        wait_for(lambda: not session.connected)
+        on_pool(pool, client.connect)
+        wait_for(lambda: client.welcomed and not client.unacked)
+        on_pool(pool, lambda: client.send_line(f"SEQ:{client.out_seq}:Session_Complete"))
+        wait_for(lambda: session.reliable.duplicates)
+        time.sleep(0.1)
+        results.append(check("duplicate Session_Complete counted once", session.completed_count == 1,
+                             f"completed={session.completed_count}, server duplicates={session.reliable.duplicates}"))
+
+        # 3. iPad -> server message lost in a dead socket
+        def write_into_dead_socket():
+            client.hold_writes = True
+            client.in_ema = True
+            client.complete_ema()
+            client.drop(reconnect=False)
+            client.hold_writes = False
+        on_pool(pool, write_into_dead_socket)
+        wait_for(lambda: not session.connected)
+        on_pool(pool, client.connect)
+        delivered = wait_for(lambda: session.completed_count == 2)
+        results.append(check("lost Session_Complete delivered by the replay", delivered,
+                             f"completed={session.completed_count}"))
+
+        # 4. iPad back after resume_window
+        on_pool(pool, lambda: client.drop(reconnect=False))
+        wait_for(lambda: not session.connected)
+        manager.resume_window = 0.3
+        manager.send_start_signal(DEVICE)
+        before = client.received.get("EMA_START_Test", 0)
+        token = client.token
+        time.sleep(0.4)
+        on_pool(pool, client.connect)
+        wait_for(lambda: client.welcomed)
+        time.sleep(0.1)
+        results.append(check("stale EMA_START not replayed after resume_window",
+                             client.received.get("EMA_START_Test", 0) == before and client.token != token,
+                             f"received {client.received.get('EMA_START_Test', 0) - before}, new token {client.token != token}"))
+
+        stats = manager.get_resume_stats(DEVICE)[DEVICE]
+        print(f"server: {stats}")
+        print(f"client: duplicates={client.duplicates}, replayed={client.replayed}, connects={client.connects}")
+    finally:
+        pool.stop()
+        manager.stop_server()
+        log_dir.cleanup()
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
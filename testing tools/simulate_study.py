@@ -0,0 +1,283 @@
+"""
+Fast-forwards a whole study on a virtual clock: the real Scheduler and
+SchedulePlanner, AudioAlert's 120 s timeout, the reporter's 21:30 report,
+the alert engine, the pending-start queue and the ConnectionManager's
+periodic battery/BCI checks all run on a VirtualTimerScheduler, against a
+scripted participant that answers with given probabilities and delays and
+drops off the network (overnight and at random).
+
+The manager is the real one; only its transport is replaced (_enqueue hands
+messages to the participant, whose replies go through
+process_received_message). Logs, mail and the journal go to a temporary
+directory.
+
+Output: trigger times by hour of day, prompts per day, gaps between
+prompts, EMA outcomes, alert emails, and the daily reports.
+
+Run from the project root:
+    python "testing tools/simulate_study.py" --days 90 --respond 0.7
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connection.connection_handler import ConnectionManager
+from connection.device_session import DeviceSession
+from core.journal import Journal
+from core.report_counters import ReportCounters
+from core.state_store import StateStore
+from utils.reporter.experiment_reporter import ExperimentReporter
+from utils.scheduler.schedule_planner import SchedulePlanner
+from utils.scheduler.timer_scheduler import VirtualTimerScheduler
+
+
+class SimLog:
+    """Collects server log lines with their simulated time (LogWriter interface)."""
+
+    def __init__(self, timers, echo=False):
+        self.timers = timers
+        self.echo = echo
+        self.lines = 0
+
+    def write(self, path, message, timestamped=True, echo=False, at=None):
+        self.lines += 1
+        if self.echo and echo:
+            print(f"{self.timers.wall_clock():%Y-%m-%d %H:%M:%S} - {message}")
+
+    def sync(self, path=None):
+        pass
+
+    def close_file(self, path):
+        pass
+
+    def stop(self):
+        pass
+
+
+class MailRecorder:
+    """Stands in for MailDispatcher: keeps every email with its simulated send time."""
+
+    def __init__(self, timers):
+        self.timers = timers
+        self.sent = []
+
+    def send(self, subject, body):
+        self.sent.append((self.timers.wall_clock(), subject, body))
+
+    def close(self):
+        pass
+
+
+class SimConnection:
+    """The socket of a simulated device; only closed by the manager."""
+
+    def close(self):
+        pass
+
+
+class SimulatedManager(ConnectionManager):
+    """ConnectionManager whose outbound messages go to the participant instead of a socket."""
+
+    participant = None
+
+    def _enqueue(self, session, message, priority, on_sent=None):
+        if on_sent:
+            on_sent()
+        self.participant.receive(message.strip())
+        return True
+
+    def send_start_signal(self, device_id=None):
+        self.participant.attempts.append((self.timers.wall_clock(), self.participant.online))
+        super().send_start_signal(device_id)
+
+
+class Participant:
+    def __init__(self, manager, timers, rng, device_id, respond, complete, response_delay, alert_interval):
+        self.manager = manager
+        self.timers = timers
+        self.rng = rng
+        self.device_id = device_id
+        self.respond = respond
+        self.complete = complete
+        self.response_delay = response_delay
+        self.alert_interval = alert_interval
+        self.session = None
+        self.online = False
+        self.offline_depth = 1      # offline until the first connect()
+        self.connects = 0
+        self.attempts = []          # (time, online) of every scheduled EMA start
+        self.prompts = []           # times an EMA_START reached the iPad
+        self.late_responses = 0     # answered after the audio alert had timed out
+        self.lost_replies = 0       # answers that found the iPad offline
+
+    # Network
+    def connect(self):
+        self.offline_depth -= 1
+        if self.offline_depth > 0 or self.online:
+            return
+        self.connects += 1
+        self.online = True
+        connection = SimConnection()
+        session = DeviceSession(self.manager, connection, ("sim", self.connects))
+        with self.manager.connection_lock:
+            self.manager.clients[connection] = session
+        self.manager.process_received_message(f"CLIENT_READY:{self.device_id}\n", session)
+        self.session = self.manager.sessions[self.device_id]
+
+    def disconnect(self):
+        self.offline_depth += 1
+        if not self.online:
+            return
+        self.online = False
+        self.manager.handle_disconnection(self.session)
+
+    def reply(self, line):
+        if not self.online:
+            self.lost_replies += 1
+            return
+        self.manager.process_received_message(f"{line}\n", self.session)
+
+    # What the iPad does with a message from the server
+    def receive(self, message):
+        if message.startswith("EMA_START"):
+            self.prompts.append(self.timers.wall_clock())
+            if self.rng.random() < self.respond:
+                delay = self.rng.expovariate(1 / self.response_delay)
+                if delay > self.alert_interval:
+                    self.late_responses += 1
+                self.timers.call_later(delay, self.reply, "EMA_Session_ACK")
+                if self.rng.random() < self.complete:
+                    self.timers.call_later(delay + self.rng.uniform(120, 600), self.reply, "Session_Complete")
+        elif message == "BATTERY":
+            self.reply(f"BATTERY:{self.rng.uniform(0.2, 1.0):.2f}:unplugged")
+
+
+def offline_periods(rng, start, days, night_offline, outages_per_week, outage_hours):
+    """(from, to) periods the iPad is off the network: some nights, plus random outages."""
+    periods = []
+    for day in range(days):
+        evening = datetime.combine(start.date() + timedelta(days=day), datetime.min.time()) + timedelta(hours=22)
+        if rng.random() < night_offline:
+            periods.append((evening, evening + timedelta(hours=10, minutes=rng.uniform(0, 60))))
+    moment = start
+    end = start + timedelta(days=days)
+    while outages_per_week > 0:
+        moment += timedelta(days=rng.expovariate(outages_per_week / 7))
+        if moment >= end:
+            break
+        periods.append((moment, moment + timedelta(hours=rng.expovariate(1 / outage_hours))))
+    return sorted(periods)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fast-forward a study on a virtual clock")
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--start", default="2025-03-03", help="first study day (YYYY-MM-DD)")
+    parser.add_argument("--respond", type=float, default=0.75, help="probability of answering a prompt")
+    parser.add_argument("--complete", type=float, default=0.85, help="probability of finishing an answered EMA")
+    parser.add_argument("--response-delay", type=float, default=45, help="mean seconds until the participant answers")
+    parser.add_argument("--night-offline", type=float, default=0.3, help="probability the iPad is off overnight")
+    parser.add_argument("--outages-per-week", type=float, default=1.0)
+    parser.add_argument("--outage-hours", type=float, default=3.0, help="mean length of a random outage")
+    parser.add_argument("--reports", type=int, default=2, help="daily reports to print in full")
+    parser.add_argument("--verbose", action="store_true", help="print the server log")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    start = datetime.combine(date.fromisoformat(args.start), datetime.min.time()) + timedelta(hours=8)
+    timers = VirtualTimerScheduler(start)
+
+    with tempfile.TemporaryDirectory(prefix="study_") as directory:
+        state = StateStore(test_mode=True)
+        journal = Journal(os.path.join(directory, "journal"), fsync=False, clock=timers.wall_clock)
+        counters = ReportCounters(state, journal, timers=timers)
+        mail = MailRecorder(timers)
+        reporter = ExperimentReporter(state, journal, email_config={}, timers=timers, mailer=mail)
+        log = SimLog(timers, echo=args.verbose)
+        planner = SchedulePlanner(args.seed, start.date())
+        manager = SimulatedManager(None, None, reporter, port=0, log_writer=log, timers=timers, state=state,
+                                   journal=journal, planner=planner, log_dir=os.path.join(directory, "logs"))
+        manager.pending_messages.fsync = False
+        manager.live_check_interval = 900   # nothing to measure on a virtual link
+        reporter.log_timestamped = manager.log_timestamped
+
+        participant = Participant(manager, timers, rng, "sim-ipad", args.respond, args.complete,
+                                  args.response_delay, alert_interval=120)
+        manager.participant = participant
+        periods = offline_periods(rng, start, args.days, args.night_offline, args.outages_per_week, args.outage_hours)
+        for begin, end in periods:
+            timers.call_later((begin - start).total_seconds(), participant.disconnect)
+            timers.call_later((end - start).total_seconds(), participant.connect)
+
+        started = time.perf_counter()
+        participant.connect()
+        manager.scheduler.schedule_start()
+        timers.run_until(start + timedelta(days=args.days))
+        elapsed = time.perf_counter() - started
+
+        manager.stop_server()
+        reporter.close()
+        counters.close()
+        journal.flush()
+        events = Counter(record["event"] for record in journal.records(start.date(), start.date() + timedelta(days=args.days), "session"))
+        journal.close()
+
+    attempts = [moment for moment, _ in participant.attempts]
+    print(f"{args.days} simulated days in {elapsed:.1f} s ({timers.ran} timer callbacks, {log.lines} log lines)")
+    print(f"offline periods: {len(periods)}, reconnects: {participant.connects}")
+
+    print("\nScheduled EMA starts by hour of day")
+    by_hour = Counter(moment.hour for moment in attempts)
+    peak = max(by_hour.values()) if by_hour else 1
+    for hour in range(24):
+        if by_hour[hour]:
+            print(f"  {hour:02d}:00  {by_hour[hour]:5d}  {'#' * round(40 * by_hour[hour] / peak)}")
+    outside = sum(1 for moment in attempts[1:] if not 9 <= moment.hour < 21)
+    print(f"  outside 9:00-21:00 (excluding the study's first start): {outside}")
+
+    per_day = Counter(moment.date() for moment in participant.prompts)
+    counts = [per_day.get(start.date() + timedelta(days=day), 0) for day in range(args.days)]
+    print("\nPrompts reaching the iPad per day")
+    print(f"  min {min(counts)}, median {statistics.median(counts)}, max {max(counts)}, total {sum(counts)}")
+    print("  " + ", ".join(f"{n} prompts: {days} days" for n, days in sorted(Counter(counts).items())))
+    planned = attempts[1:]      # the first start runs at once, off the plan
+    gaps = [(b - a).total_seconds() / 60 for a, b in zip(planned, planned[1:]) if a.date() == b.date()]
+    if gaps:
+        print(f"  gap between starts on a day: min {min(gaps):.0f}, p50 {percentile(gaps, 0.5):.0f}, max {max(gaps):.0f} min")
+
+    missed = sum(1 for _, online in participant.attempts if not online)
+    print("\nEMA outcomes")
+    print(f"  scheduled starts {len(attempts)}, while offline {missed}, delivered {len(participant.prompts)} "
+          f"({len(participant.prompts) - (len(attempts) - missed)} from the pending queue)")
+    print(f"  journal: " + ", ".join(f"{event} {events[event]}" for event in ("triggered", "responded", "completed", "ignored", "ready", "disconnected")))
+    print(f"  answered after the 120 s alert timeout (counted as ignored and responded): {participant.late_responses}")
+    print(f"  answers lost to a disconnect: {participant.lost_replies}")
+
+    reports = [(moment, subject, body) for moment, subject, body in mail.sent if subject.startswith("Daily EMA Report")]
+    alerts = Counter(subject for _, subject, _ in mail.sent if not subject.startswith("Daily EMA Report"))
+    print(f"\nEmails: {len(reports)} daily reports, {sum(alerts.values())} alerts")
+    for subject, count in alerts.most_common():
+        print(f"  {count:4d}  {subject}")
+    reported = sum(int(body.split("Total EMAs Triggered: ")[1].split("\n")[0]) for _, _, body in reports)
+    print(f"  triggered in reports {reported} vs journal {events['triggered']} (the last day's report may be after the end)")
+    for moment, subject, body in reports[:args.reports]:
+        print(f"\n--- {moment:%Y-%m-%d %H:%M} {subject}\n{body}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
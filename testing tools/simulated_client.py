@@ -0,0 +1,452 @@
+"""
+Stand-in for the Unity iPad client, for exercising ConnectionManager
+without an iPad.
+
+Every SimulatedClient speaks the full protocol: CLIENT_READY handshake,
+LIVE_CHECK_ACK, BATTERY replies, EMA_Session_ACK / EMA payload lines /
+Session_Complete after EMA_START, BCI_Sync and free-running EMA payload
+lines. With `resume` it uses CLIENT_RESUME instead, sequences its messages
+and replays unacknowledged ones after a reconnect (see ReliableChannel).
+Response delays, message rates, write fragmentation and random
+disconnects come from a ClientProfile; `speed` divides every delay and
+multiplies every rate, so hours of traffic can be replayed in minutes.
+
+All clients of a ClientPool share one thread (a selector plus a timer
+heap), so hundreds of them add a single thread to the process under test.
+
+Example:
+    pool = ClientPool("localhost", 4100)
+    for i in range(20):
+        pool.add(f"pad{i}", ClientProfile(speed=60, bci_sync_rate=1))
+    pool.start()
+"""
+import heapq
+import itertools
+import os
+import random
+import re
+import selectors
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connection.live_check_tracker import LatencyHistogram
+
+# Server messages are not newline-terminated (except FLASH_*), so they are
+# picked out of the stream by pattern. A LIVE_CHECK stamp is 13 digits.
+SERVER_MESSAGE = re.compile(rb"LIVE_CHECK:(\d+):(\d{13})|EMA_START_(?:Test|Live)|EMA_SKIP|BATTERY|FLASH_(?:START|ON|OFF|END)")
+MAX_UNPARSED = 256
+# In resumable mode every server message is a line
+RESUME_MESSAGE = re.compile(rb"SEQ:(\d+):(.*)|SACK:(\d+)|SEQ_WELCOME:(\w+):(\d+)")
+
+
+class ClientProfile:
+    """Behaviour of a simulated iPad. Delays are (min, max) seconds, rates per second."""
+
+    def __init__(self, speed=1.0, ack_delay=(0.0, 0.02), ema_ack_delay=(5.0, 30.0), ema_complete_delay=(30.0, 90.0),
+                 ema_lines=20, ignore_probability=0.1, bci_sync_rate=0.0, payload_rate=0.0,
+                 fragment_probability=0.0, fragment_delay=(0.0, 0.005), disconnect_rate=0.0,
+                 reconnect_delay=(1.0, 5.0), clock_offset_ms=0.0, report_times=False, battery_drain=0.002,
+                 resume=False):
+        self.speed = speed
+        self.ack_delay = ack_delay
+        self.ema_ack_delay = ema_ack_delay
+        self.ema_complete_delay = ema_complete_delay
+        self.ema_lines = ema_lines
+        self.ignore_probability = ignore_probability
+        self.bci_sync_rate = bci_sync_rate
+        self.payload_rate = payload_rate
+        self.fragment_probability = fragment_probability
+        self.fragment_delay = fragment_delay
+        self.disconnect_rate = disconnect_rate      # per hour
+        self.reconnect_delay = reconnect_delay
+        self.clock_offset_ms = clock_offset_ms
+        self.report_times = report_times            # add T2/T3 to LIVE_CHECK_ACK
+        self.battery_drain = battery_drain
+        self.resume = resume                        # CLIENT_RESUME and sequenced messages
+
+    def delay(self, bounds, rng):
+        return rng.uniform(*bounds) / self.speed
+
+    def interval(self, rate, rng):
+        """Exponential gap for a Poisson process of `rate` per (unscaled) second."""
+        return rng.expovariate(rate * self.speed)
+
+
+class SimulatedClient:
+    def __init__(self, pool, device_id, profile, seed=None):
+        self.pool = pool
+        self.device_id = device_id
+        self.profile = profile
+        self.rng = random.Random(seed)
+        self.sock = None
+        self.inbound = bytearray()
+        self.outbound = bytearray()
+        self.next_write_at = 0.0
+        self.delayed = 0        # pieces waiting on a timer
+        self.generation = 0     # bumped on every disconnect, cancels stale timers
+        self.battery_level = 1.0
+        self.in_ema = False
+        self.hold_writes = False    # keep writes in memory, as if lost with the connection
+
+        # Resumable mode
+        self.token = None
+        self.welcomed = False
+        self.out_seq = 0
+        self.unacked = []       # (seq, line), oldest first
+        self.in_received = 0
+        self.in_acked = 0
+        self.duplicates = 0
+        self.replayed = 0
+
+        self.received = {}
+        self.sent_lines = 0
+        self.sent_bytes = 0
+        self.connects = 0
+        self.disconnects = 0
+        self.errors = 0
+        self.server_latency = LatencyHistogram()    # LIVE_CHECK stamp -> arrival, ms
+
+    @property
+    def connected(self):
+        return self.sock is not None
+
+    # Timers tied to the current connection
+    def later(self, delay, callback, *args):
+        generation = self.generation
+
+        def run():
+            if self.generation == generation and self.connected:
+                callback(*args)
+        self.pool.call_later(delay, run)
+
+    def every(self, rate, callback):
+        if rate <= 0:
+            return
+
+        def tick():
+            callback()
+            self.later(self.profile.interval(rate, self.rng), tick)
+        self.later(self.profile.interval(rate, self.rng), tick)
+
+    def now_ms(self):
+        return time.time() * 1000 + self.profile.clock_offset_ms
+
+    def connect(self):
+        try:
+            sock = socket.create_connection((self.pool.host, self.pool.port), timeout=5)
+        except OSError:
+            self.errors += 1
+            self.pool.call_later(self.profile.delay(self.profile.reconnect_delay, self.rng), self.connect)
+            return
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setblocking(False)
+        self.sock = sock
+        self.connects += 1
+        self.inbound.clear()
+        self.outbound.clear()
+        self.next_write_at = 0.0
+        self.delayed = 0
+        self.pool.selector.register(sock, selectors.EVENT_READ, self)
+
+        if self.profile.resume:
+            self.welcomed = False
+            self.in_acked = self.in_received
+            self.send_line(f"CLIENT_RESUME:{self.device_id}:{self.token or '-'}:{self.in_received}")
+        else:
+            self.send_line(f"CLIENT_READY:{self.device_id}")
+        self.every(self.profile.bci_sync_rate, lambda: self.send_reliable(f"BCI_Sync:{int(self.now_ms())}"))
+        self.every(self.profile.payload_rate, lambda: self.send_reliable(f"EMA_PAYLOAD:{self.device_id}:{int(self.now_ms())}"))
+        if self.profile.disconnect_rate > 0:
+            self.later(self.rng.expovariate(self.profile.disconnect_rate * self.profile.speed / 3600), self.drop)
+
+    def drop(self, reconnect=True):
+        """Closes the socket as an iPad losing Wi-Fi would, then reconnects later."""
+        if self.sock is None:
+            return
+        self.generation += 1
+        self.disconnects += 1
+        try:
+            self.pool.selector.unregister(self.sock)
+        except (KeyError, ValueError):
+            pass
+        self.sock.close()
+        self.sock = None
+        self.in_ema = False
+        if reconnect and self.pool.running:
+            self.pool.call_later(self.profile.delay(self.profile.reconnect_delay, self.rng), self.connect)
+
+    # Outbound
+    def send_reliable(self, line):
+        """Sends a line that must survive a reconnect; sequenced in resumable mode."""
+        if not self.profile.resume:
+            self.send_line(line)
+            return
+        self.out_seq += 1
+        self.unacked.append((self.out_seq, line))
+        if self.welcomed:
+            self.send_line(f"SEQ:{self.out_seq}:{line}")
+
+    def send_line(self, line):
+        data = (line + "\n").encode('utf-8')
+        self.sent_lines += 1
+        if self.rng.random() < self.profile.fragment_probability and len(data) > 1:
+            cuts = sorted(self.rng.sample(range(1, len(data)), min(3, len(data) - 1)))
+            pieces = [data[a:b] for a, b in zip([0] + cuts, cuts + [len(data)])]
+        else:
+            pieces = [data]
+
+        # Pieces never overtake earlier ones, even when delayed
+        now = time.monotonic()
+        at = max(now, self.next_write_at)
+        for piece in pieces:
+            if at <= now and not self.delayed:
+                self.write(piece)
+            else:
+                self.delayed += 1
+                self.later(at - now, self.write, piece, True)
+            at += self.profile.delay(self.profile.fragment_delay, self.rng) if len(pieces) > 1 else 0.0
+        self.next_write_at = at
+
+    def write(self, data, delayed=False):
+        if delayed:
+            self.delayed -= 1
+        self.outbound += data
+        self.flush()
+
+    def flush(self):
+        if self.hold_writes:
+            return
+        try:
+            written = self.sock.send(self.outbound)
+        except BlockingIOError:
+            written = 0
+        except OSError:
+            self.errors += 1
+            self.drop()
+            return
+        self.sent_bytes += written
+        del self.outbound[:written]
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if self.outbound else 0)
+        self.pool.selector.modify(self.sock, events, self)
+
+    # Inbound
+    def on_event(self, mask):
+        if mask & selectors.EVENT_WRITE:
+            self.flush()
+            if not self.connected:
+                return
+        if mask & selectors.EVENT_READ:
+            try:
+                data = self.sock.recv(65536)
+            except BlockingIOError:
+                return
+            except OSError:
+                data = b""
+            if not data:
+                self.drop()
+                return
+            self.inbound += data
+            self.parse()
+
+    def parse(self):
+        if self.profile.resume:
+            self.parse_lines()
+            return
+        end = 0
+        for match in SERVER_MESSAGE.finditer(self.inbound):
+            end = match.end()
+            self.handle(match)
+            if not self.connected:
+                return
+        del self.inbound[:end]
+        if len(self.inbound) > MAX_UNPARSED:
+            # Something we do not understand (e.g. an operator message)
+            del self.inbound[:-MAX_UNPARSED // 2]
+
+    def parse_lines(self):
+        *lines, rest = self.inbound.split(b"\n")
+        self.inbound[:] = rest
+        for line in lines:
+            sequenced = RESUME_MESSAGE.match(line)
+            if sequenced is None:
+                payload = line
+            elif sequenced.group(1) is not None:
+                seq = int(sequenced.group(1))
+                if seq <= self.in_received:
+                    self.duplicates += 1
+                    continue
+                self.in_received = seq
+                payload = sequenced.group(2)
+            elif sequenced.group(3) is not None:
+                self.unacked = [(seq, line) for seq, line in self.unacked if seq > int(sequenced.group(3))]
+                continue
+            else:
+                self.welcome(sequenced.group(4).decode(), int(sequenced.group(5)))
+                continue
+            match = SERVER_MESSAGE.match(payload)
+            if match:
+                self.handle(match)
+            if not self.connected:
+                return
+        if self.in_received > self.in_acked:
+            self.in_acked = self.in_received
+            self.send_line(f"SACK:{self.in_received}")
+
+    def welcome(self, token, server_received):
+        if token != self.token:
+            # New channel on the server: it has seen none of our numbers
+            self.token = token
+            self.in_received = self.in_acked = 0
+            self.unacked = [(seq, line) for seq, (_, line) in enumerate(self.unacked, 1)]
+            self.out_seq = len(self.unacked)
+        else:
+            self.unacked = [(seq, line) for seq, line in self.unacked if seq > server_received]
+        self.welcomed = True
+        self.replayed += len(self.unacked)
+        for seq, line in self.unacked:
+            self.send_line(f"SEQ:{seq}:{line}")
+
+    def handle(self, match):
+        arrived_ms = self.now_ms()
+        if match.group(1) is not None:
+            verb = "LIVE_CHECK"
+            probe_id, stamp = match.group(1).decode(), int(match.group(2))
+            self.server_latency.record(max(0.0, time.time() * 1000 - stamp))
+            self.later(self.profile.delay(self.profile.ack_delay, self.rng), self.ack_live_check, probe_id, stamp, arrived_ms)
+        else:
+            verb = match.group(0).decode()
+            if verb == "BATTERY":
+                self.battery_level = max(0.05, self.battery_level - self.profile.battery_drain)
+                self.later(self.profile.delay(self.profile.ack_delay, self.rng), self.send_line,
+                           f"BATTERY:{self.battery_level:.2f}:{'charging' if self.battery_level < 0.2 else 'unplugged'}")
+            elif verb.startswith("EMA_START") and not self.in_ema:
+                if self.rng.random() >= self.profile.ignore_probability:
+                    self.in_ema = True
+                    self.later(self.profile.delay(self.profile.ema_ack_delay, self.rng), self.answer_ema)
+            elif verb == "EMA_SKIP":
+                self.in_ema = False
+        self.received[verb] = self.received.get(verb, 0) + 1
+
+    def ack_live_check(self, probe_id, stamp, arrived_ms):
+        reply = f"LIVE_CHECK_ACK:{probe_id}:LATENCY:{arrived_ms - stamp:.3f}"
+        if self.profile.report_times:
+            reply += f":T2:{arrived_ms:.3f}:T3:{self.now_ms():.3f}"
+        self.send_line(reply)
+
+    def answer_ema(self):
+        if not self.in_ema:
+            return
+        self.send_reliable("EMA_Session_ACK")
+        for question in range(self.profile.ema_lines):
+            self.send_reliable(f"Q{question}: answer={self.rng.randint(0, 100)} t={int(self.now_ms())}")
+        self.later(self.profile.delay(self.profile.ema_complete_delay, self.rng), self.complete_ema)
+
+    def complete_ema(self):
+        if self.in_ema:
+            self.in_ema = False
+            self.send_reliable("Session_Complete")
+
+    def stats(self):
+        return {
+            "device_id": self.device_id,
+            "connected": self.connected,
+            "connects": self.connects,
+            "disconnects": self.disconnects,
+            "errors": self.errors,
+            "sent_lines": self.sent_lines,
+            "sent_bytes": self.sent_bytes,
+            "received": dict(self.received),
+            "duplicates": self.duplicates,
+            "replayed": self.replayed,
+            "server_latency_ms": self.server_latency.summary(),
+        }
+
+
+class ClientPool:
+    """Runs any number of SimulatedClients on one selector thread."""
+
+    def __init__(self, host="localhost", port=4100, seed=0):
+        self.host = host
+        self.port = port
+        self.seed = seed
+        self.clients = []
+        self.selector = selectors.DefaultSelector()
+        self._timers = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self.selector.register(self._wakeup_reader, selectors.EVENT_READ, None)
+        self.running = False
+        self._thread = None
+
+    def add(self, device_id, profile=None):
+        client = SimulatedClient(self, device_id, profile or ClientProfile(), seed=f"{self.seed}:{device_id}")
+        self.clients.append(client)
+        if self.running:
+            self.call_later(0, client.connect)
+        return client
+
+    def call_later(self, delay, callback, *args):
+        """Thread safe; callbacks run on the pool thread."""
+        with self._lock:
+            heapq.heappush(self._timers, (time.monotonic() + delay, next(self._counter), callback, args))
+        if threading.current_thread() is not self._thread:
+            try:
+                self._wakeup_writer.send(b"\0")
+            except OSError:
+                pass
+
+    def start(self, stagger=0.0):
+        """Connects every client (spread over `stagger` seconds) and starts the pool thread."""
+        self.running = True
+        for index, client in enumerate(self.clients):
+            self.call_later(stagger * index / max(1, len(self.clients)), client.connect)
+        self._thread = threading.Thread(target=self._run, name="ClientPool", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        self.call_later(0, lambda: None)
+        if self._thread:
+            self._thread.join(5)
+        for client in self.clients:
+            client.drop(reconnect=False)
+        self.selector.close()
+        self._wakeup_reader.close()
+        self._wakeup_writer.close()
+
+    def _run(self):
+        while self.running:
+            with self._lock:
+                timeout = max(0.0, self._timers[0][0] - time.monotonic()) if self._timers else None
+            for key, mask in self.selector.select(timeout):
+                if key.data is None:
+                    try:
+                        self._wakeup_reader.recv(4096)
+                    except BlockingIOError:
+                        pass
+                else:
+                    self._guard(key.data.on_event, mask)
+
+            now = time.monotonic()
+            while True:
+                with self._lock:
+                    if not self._timers or self._timers[0][0] > now:
+                        break
+                    _, _, callback, args = heapq.heappop(self._timers)
+                self._guard(callback, *args)
+
+    def _guard(self, callback, *args):
+        # A failing client must not stop the others
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"ClientPool: {getattr(callback, '__name__', callback)} failed: {e}", file=sys.stderr)
+
+    def stats(self):
+        return [client.stats() for client in self.clients]
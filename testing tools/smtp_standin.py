@@ -0,0 +1,93 @@
+"""
+Minimal in-process SMTP server for exercising MailDispatcher without a
+mail provider. Plain SMTP only (use "ssl": False in email_config); accepts
+any AUTH and records every message it receives.
+
+Example:
+    server = SMTPStandIn()
+    config = {"smtp_server": "127.0.0.1", "port": server.port, "ssl": False, ...}
+    ...
+    server.messages   # [(mail_from, [rcpt...], data)]
+    server.close()
+"""
+import socket
+import threading
+import time
+
+
+class SMTPStandIn:
+    def __init__(self, host="127.0.0.1", port=0, greeting_delay=0.0):
+        self.greeting_delay = greeting_delay    # seconds before the 220 banner (a slow server)
+        self.messages = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((host, port))
+        self._listener.listen(16)
+        self.host, self.port = self._listener.getsockname()
+        self._running = True
+        threading.Thread(target=self._accept, name="SMTPStandIn", daemon=True).start()
+
+    def _accept(self):
+        while self._running:
+            try:
+                connection, _ = self._listener.accept()
+            except OSError:
+                return
+            with self._lock:
+                self.connections += 1
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection):
+        reader = connection.makefile("rb")
+
+        def reply(line):
+            connection.sendall(line.encode("ascii") + b"\r\n")
+
+        try:
+            time.sleep(self.greeting_delay)
+            reply("220 stand-in ESMTP")
+            mail_from, recipients = None, []
+            for raw in reader:
+                command = raw.decode("utf-8", "replace").strip()
+                verb = command.split(" ", 1)[0].upper()
+                if verb == "EHLO":
+                    reply("250-stand-in")
+                    reply("250 AUTH PLAIN LOGIN")
+                elif verb == "HELO":
+                    reply("250 stand-in")
+                elif verb == "AUTH":
+                    reply("235 2.7.0 Authentication successful")
+                elif verb == "MAIL":
+                    mail_from, recipients = command.split(":", 1)[1].strip(), []
+                    reply("250 OK")
+                elif verb == "RCPT":
+                    recipients.append(command.split(":", 1)[1].strip())
+                    reply("250 OK")
+                elif verb == "DATA":
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    lines = []
+                    for data_line in reader:
+                        if data_line in (b".\r\n", b".\n"):
+                            break
+                        lines.append(data_line)
+                    with self._lock:
+                        self.messages.append((mail_from, recipients, b"".join(lines).decode("utf-8", "replace")))
+                    reply("250 OK queued")
+                elif verb in ("RSET", "NOOP"):
+                    reply("250 OK")
+                elif verb == "QUIT":
+                    reply("221 Bye")
+                    break
+                else:
+                    reply("502 Command not implemented")
+        except OSError:
+            pass
+        finally:
+            reader.close()
+            connection.close()
+
+    def close(self):
+        self._running = False
+        self._listener.close()
@@ -0,0 +1,216 @@
+"""
+Soak / load test: runs the real ConnectionManager headlessly against a
+pool of simulated iPads (see simulated_client.py) and reports, every
+--report-every seconds, throughput, tail latency, memory and thread count.
+
+--speed compresses time: server live checks, battery checks, audio alert
+timeouts and EMA triggers run `speed` times faster, and so do the clients'
+response delays and message rates. With --speed 60 a 10 minute run covers
+10 hours of study traffic.
+
+The exit code is 1 if no device ever connected or client errors
+outnumber the messages exchanged. The RSS growth rate is then fitted over
+the second half of the run (after warm-up); the exit code is also 1 if it
+exceeds --max-rss-growth or the thread count kept growing. Runs shorter
+than 10 report rows are not judged on resource growth.
+
+Run from the project root:
+    python "testing tools/soak_test.py" --clients 50 --duration 600 --speed 60
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+import psutil
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_dispatch_latency import StubUI, StubReporter
+from simulated_client import ClientPool, ClientProfile
+from connection.connection_handler import ConnectionManager
+from utils.logger.log_writer import LogWriter
+
+
+class QuietLogWriter(LogWriter):
+    """Keeps the server logs but does not echo them over the report."""
+
+    def write(self, path, message, timestamped=True, echo=False, at=None):
+        super().write(path, message, timestamped=timestamped, echo=False, at=at)
+
+
+def accelerate(manager, speed, ema_interval, clients):
+    """
+    Scales the server's periodic tasks and triggers an EMA on a random
+    device so that each one gets one every ema_interval (unscaled) seconds.
+    """
+    manager.live_check_interval = 3 / speed
+    manager.battery_check_task.cancel()
+    manager.battery_check_task = manager.timers.call_every(manager.battery_check_interval / speed, manager.periodic_battery_check)
+    rng = random.Random(0)
+
+    def trigger():
+        sessions = manager.connected_sessions()
+        if not sessions:
+            return
+        session = rng.choice(sessions)
+        session.audio_alert._alert_interval = 120 / speed
+        manager.send_start_signal(session.device_id)
+    return manager.timers.call_every(ema_interval / speed / max(1, clients), trigger)
+
+
+def worst(stats, *path):
+    """Largest value at `path` across devices (e.g. the worst device's p99)."""
+    values = []
+    for device in stats.values():
+        for key in path:
+            device = device.get(key) if device else None
+        if device is not None:
+            values.append(device)
+    return max(values) if values else None
+
+
+def fmt(value, spec=".2f"):
+    return "n/a" if value is None else format(value, spec)
+
+
+def sample(manager, pool, process, previous, started):
+    now = time.monotonic()
+    sent_lines = sum(client.sent_lines for client in pool.clients)
+    # Counted at the clients: a session's queue counters restart on reconnect
+    server_sent = sum(sum(client.received.values()) for client in pool.clients)
+    queue_stats = manager.get_send_queue_stats()
+    live_stats = manager.get_live_check_stats()
+    memory = process.memory_info()
+    row = {
+        "elapsed_s": now - started,
+        "clients": len(manager.connected_sessions()),
+        "sessions": len(manager.sessions),
+        "in_lines": sent_lines,
+        "out_messages": server_sent,
+        "in_per_s": (sent_lines - previous["in_lines"]) / (now - previous["time"]),
+        "out_per_s": (server_sent - previous["out_messages"]) / (now - previous["time"]),
+        "rtt_p50_ms": worst(live_stats, "rtt_ms", "p50"),
+        "rtt_p99_ms": worst(live_stats, "rtt_ms", "p99"),
+        "queue_p99_ms": worst({device: lanes["realtime"] for device, lanes in queue_stats.items()}, "delay_ms", "p99"),
+        "lost_probes": sum(device["lost"] for device in live_stats.values()),
+        "reconnects": sum(max(0, client.connects - 1) for client in pool.clients),
+        "rss_mb": memory.rss / 2**20,
+        "threads": process.num_threads(),
+        "fds": process.num_fds() if hasattr(process, "num_fds") else None,
+    }
+    previous.update(time=now, in_lines=sent_lines, out_messages=server_sent)
+    return row
+
+
+def print_row(row, speed, header=False):
+    if header:
+        print(f"{'time':>8} {'sim h':>6} {'clients':>7} {'in/s':>8} {'out/s':>8} {'RTT p50':>8} {'RTT p99':>8} "
+              f"{'queue p99':>9} {'lost':>6} {'reconn':>6} {'RSS MB':>8} {'threads':>7} {'fds':>5}")
+    print(f"{row['elapsed_s']:8.0f} {row['elapsed_s'] * speed / 3600:6.2f} {row['clients']:7d} {row['in_per_s']:8.1f} "
+          f"{row['out_per_s']:8.1f} {fmt(row['rtt_p50_ms']):>8} {fmt(row['rtt_p99_ms']):>8} {fmt(row['queue_p99_ms']):>9} "
+          f"{row['lost_probes']:6d} {row['reconnects']:6d} {row['rss_mb']:8.1f} {row['threads']:7d} {fmt(row['fds'], 'd'):>5}",
+          flush=True)
+
+
+def growth_per_hour(rows, key):
+    """Least-squares slope of `key` over the second half of the run, per real hour."""
+    tail = rows[len(rows) // 2:]
+    if len(tail) < 2:
+        return 0.0
+    xs = [row["elapsed_s"] for row in tail]
+    ys = [row[key] for row in tail]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    spread = sum((x - mean_x) ** 2 for x in xs)
+    if not spread:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / spread * 3600
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Soak test ConnectionManager with simulated iPads")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=600, help="real seconds to run")
+    parser.add_argument("--speed", type=float, default=60, help="time compression factor")
+    parser.add_argument("--port", type=int, default=4150)
+    parser.add_argument("--report-every", type=float, default=10, help="real seconds between report rows")
+    parser.add_argument("--ema-interval", type=float, default=3600, help="seconds between EMA triggers per device")
+    parser.add_argument("--bci-rate", type=float, default=0.0, help="BCI_Sync lines per second per device")
+    parser.add_argument("--payload-rate", type=float, default=0.05, help="EMA payload lines per second per device")
+    parser.add_argument("--fragment", type=float, default=0.1, help="probability a line is written in fragments")
+    parser.add_argument("--disconnect-rate", type=float, default=1.0, help="disconnects per device per hour")
+    parser.add_argument("--resume", action="store_true", help="clients resume sessions (CLIENT_RESUME)")
+    parser.add_argument("--max-rss-growth", type=float, default=50.0, help="MB per real hour before failing")
+    parser.add_argument("--csv", help="write every report row to this file")
+    args = parser.parse_args(argv)
+
+    process = psutil.Process()
+    # Logs and the pending EMA queue go to a temp directory, never the study's logs/
+    log_dir = tempfile.TemporaryDirectory(prefix="soak_")
+    manager = ConnectionManager(StubUI(), None, StubReporter(), port=args.port, log_writer=QuietLogWriter(), log_dir=log_dir.name)
+    trigger_task = accelerate(manager, args.speed, args.ema_interval, args.clients)
+
+    profile = ClientProfile(speed=args.speed, bci_sync_rate=args.bci_rate, payload_rate=args.payload_rate,
+                            fragment_probability=args.fragment, disconnect_rate=args.disconnect_rate,
+                            resume=args.resume)
+    # The port the server actually bound (--port 0 picks a free one)
+    pool = ClientPool("localhost", manager.server.getsockname()[1])
+    for index in range(args.clients):
+        pool.add(f"sim{index:03d}", profile)
+    pool.start(stagger=min(5.0, args.report_every))
+
+    print(f"Soak test: {args.clients} clients, {args.duration:.0f} s at x{args.speed:g} "
+          f"({args.duration * args.speed / 3600:.1f} simulated hours)")
+    started = time.monotonic()
+    previous = {"time": started, "in_lines": 0, "out_messages": 0}
+    rows = []
+    try:
+        while time.monotonic() - started < args.duration:
+            time.sleep(min(args.report_every, max(0.0, args.duration - (time.monotonic() - started))))
+            rows.append(sample(manager, pool, process, previous, started))
+            print_row(rows[-1], args.speed, header=len(rows) == 1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        trigger_task.cancel()
+        pool.stop()
+        manager.stop_server()
+        log_dir.cleanup()
+
+    if args.csv and rows:
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+    if not rows:
+        return 1
+    rss_growth = growth_per_hour(rows, "rss_mb")
+    thread_growth = growth_per_hour(rows, "threads")
+    errors = sum(client.errors for client in pool.clients)
+    total = rows[-1]
+    print(f"Done: {total['in_lines']} lines in, {total['out_messages']} messages out, "
+          f"{total['reconnects']} reconnects, {errors} client errors")
+    print(f"RSS {rows[0]['rss_mb']:.1f} -> {total['rss_mb']:.1f} MB (tail slope {rss_growth:+.1f} MB/h), "
+          f"threads {rows[0]['threads']} -> {total['threads']} (tail slope {thread_growth:+.1f}/h)")
+    if not any(client.connects for client in pool.clients):
+        print("FAIL: no device ever connected")
+        return 1
+    if errors > total["in_lines"] + total["out_messages"]:
+        print("FAIL: more client errors than messages exchanged")
+        return 1
+    if len(rows) < 10:
+        print("Run too short to judge resource growth (fewer than 10 report rows)")
+        return 0
+    leaking = rss_growth > args.max_rss_growth or (thread_growth > 0 and total["threads"] > rows[len(rows) // 2]["threads"])
+    if leaking:
+        print("FAIL: resource growth over the second half of the run")
+    return 1 if leaking else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import queue
+import time
+from connection.live_check_tracker import LatencyHistogram
+
+
+class RefreshLoop:
+    """
+    Coalesces state changes into at most one redraw per frame on the Tk thread.
+
+    Any thread may post(keys); the loop subscribes to the StateStore, so
+    every store change is posted. Tk runs drain() every frame_ms through
+    after(): a drain takes everything posted since the last one, merges the
+    changed keys and calls render(keys, state) once with a fresh snapshot.
+    Event-to-screen latency (oldest post in the frame until render returns,
+    in ms) is kept in `latency`; while Tk is not busy it stays below one
+    frame plus the render time.
+    """
+
+    def __init__(self, after, state, render, frame_ms=50):
+        self.after = after              # e.g. root.after
+        self.state = state
+        self.render = render
+        self.frame_ms = frame_ms
+        self._queue = queue.SimpleQueue()
+        self._running = False
+        self._unsubscribe = state.subscribe(lambda changes: self.post(changes.keys()))
+
+        self.latency = LatencyHistogram()
+        self.render_time = LatencyHistogram()
+        self.events = 0
+        self.frames = 0
+
+    def post(self, keys):
+        """Thread safe; the keys are redrawn on the next frame."""
+        self._queue.put((time.perf_counter(), tuple(keys)))
+
+    def start(self, initial_keys=None):
+        """Starts the frame loop; call on the Tk thread. Renders `initial_keys` (default: all) first."""
+        self._running = True
+        _, state = self.state.snapshot()
+        self.post(initial_keys if initial_keys is not None else state.keys())
+        self.after(0, self.drain)
+
+    def stop(self):
+        self._running = False
+        self._unsubscribe()
+
+    def drain(self):
+        started = time.perf_counter()
+        oldest = None
+        keys = set()
+        while True:
+            try:
+                posted, changed = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            oldest = posted if oldest is None else oldest
+            keys.update(changed)
+            self.events += 1
+
+        if oldest is not None:
+            _, state = self.state.snapshot()
+            self.render(keys, state)
+            done = time.perf_counter()
+            self.frames += 1
+            self.render_time.record((done - started) * 1000)
+            self.latency.record((done - oldest) * 1000)
+
+        if self._running:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.after(max(1, int(self.frame_ms - elapsed_ms)), self.drain)
+
+    def stats(self):
+        return {
+            "events": self.events,
+            "frames": self.frames,
+            "latency_ms": self.latency.summary(),
+            "render_ms": self.render_time.summary(),
+        }
@@ -1,24 +1,27 @@
 import tkinter as tk
-import os
 from datetime import datetime
 from utils.qrcode.qrcode_display import QRCodeDisplay
+from ui.refresh_loop import RefreshLoop
 
 class UI:
-    def __init__(self, conn_manager):
+    """
+    Tk window over the StateStore. Widgets write flags to the store; labels
+    are redrawn from the store by a RefreshLoop on the Tk thread, at most
+    once per frame, so no background thread ever touches Tk.
+    """
+
+    def __init__(self, conn_manager, state):
         self.root = tk.Tk()
         self.root.title("EMA Control Hub")
         self.connection_manager = conn_manager
+        self.state = state
         self.qr_display = QRCodeDisplay(self.root)
+        self.refresh_loop = RefreshLoop(self.root.after, state, self.show, frame_ms=50)
 
-        self.is_bci_enabled = tk.BooleanVar(value=False)
-        self.is_testmode_enabled = tk.BooleanVar(value=True)
-
-        self.last_notification_time = None
-
-        self.triggered_count = 0
-        self.responded_count = 0
-        self.completed_count = 0
-        self.ignored_count = 0
+        self.is_bci_enabled = tk.BooleanVar(value=state.get("bci_enabled"))
+        self.is_testmode_enabled = tk.BooleanVar(value=state.get("test_mode"))
+        self.is_bci_enabled.trace_add("write", lambda *args: state.set(bci_enabled=self.is_bci_enabled.get()))
+        self.is_testmode_enabled.trace_add("write", lambda *args: state.set(test_mode=self.is_testmode_enabled.get()))
 
         """
         # Create and configure the input field and label
@@ -56,40 +59,6 @@ class UI:
         self.ignored_label = tk.Label(counter_frame, text="Ignored: 0")
         self.ignored_label.grid(row=0, column=3, padx=10)
 
-        # Load today's counter values from file
-        date_str = datetime.now().strftime("%Y-%m-%d")
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        project_root = os.path.dirname(script_dir)
-        report_log_dir = os.path.join(project_root, "logs", "email_report")
-        os.makedirs(report_log_dir, exist_ok=True)
-        file_path = os.path.join(report_log_dir, f"{date_str}.unsent.txt")
-
-        if not os.path.exists(file_path):
-            with open(file_path, "w") as f:
-                f.write("Triggered: 0, Responded: 0, Completed: 0, Ignored: 0")
-
-        try:
-            with open(file_path, "r") as f:
-                content = f.read()
-                for part in content.split(","):
-                    key, val = part.strip().split(":")
-                    count = int(val.strip())
-                    if "Triggered" in key:
-                        self.triggered_count = count
-                    elif "Responded" in key:
-                        self.responded_count = count
-                    elif "Completed" in key:
-                        self.completed_count = count
-                    elif "Ignored" in key:
-                        self.ignored_count = count
-        except Exception as e:
-            print(f"Failed to load counters from file: {e}")
-
-        self.triggered_label.config(text=f"Triggered: {self.triggered_count}")
-        self.responded_label.config(text=f"Responded: {self.responded_count}")
-        self.completed_label.config(text=f"Completed: {self.completed_count}")
-        self.ignored_label.config(text=f"Ignored: {self.ignored_count}")
-
         # button for "START" signal
         start_button = tk.Button(self.root, text="Start EMA Sequence", command=self.send_start_signal)
         start_button.pack(padx=5)
@@ -133,6 +102,9 @@ class UI:
         # Set up the Tkinter close event to stop the server
         self.root.protocol("WM_DELETE_WINDOW", self.stop_server)
 
+        # Everything but the QR code, which only changes on a new EMA start
+        self.refresh_loop.start([key for key in state.snapshot()[1] if key != "last_start"])
+
     def set_connection_manager(self, conn_manager):
         """Sets the connection manager to interact with."""
         self.connection_manager = conn_manager
@@ -148,63 +120,48 @@ class UI:
             current_time = datetime.now()
             self.last_start_label.config(text=f"Session Start: {current_time.strftime('%Y-%m-%d %H:%M:%S')}")
 
-            next_schedule_time = self.connection_manager.scheduler.schedule_start()
-            self.update_next_notification_time(next_schedule_time)
+            self.connection_manager.scheduler.schedule_start()
 
     def send_skip_signal(self):
         if self.connection_manager:
-            self.connection_manager.send_skip_signal()
-            self.increment_ignored()
-
-    def update_last_notification_time(self, current_time):
-        self.last_start_label.config(text=f"Last Notification: {current_time}")
+            self.connection_manager.skip_ema()
 
     def check_battery_status(self):
         if self.connection_manager:
-            battery_level = self.connection_manager.check_battery()
-            self.battery_level_label.config(text=f"Battery Level: {battery_level}%")
-
-    def update_next_notification_time(self, next_time):
-        if isinstance(next_time, datetime):
-            if self.last_notification_time:
-                self.last_start_label.config(text=f"Last Notification: {self.last_notification_time.strftime('%Y-%m-%d %H:%M:%S')}")
-            self.next_start_label.config(text=f"Next Notification: {next_time.strftime('%Y-%m-%d %H:%M:%S')}")
-        else:
-            self.next_start_label.config(text="Next Notification: N/A")
-    
-    def increment_triggered(self):
-        self.triggered_count += 1
-        self.triggered_label.config(text=f"Triggered: {self.triggered_count}")
-        self.update_report_counter()
-
-    def increment_responded(self):
-        self.responded_count += 1
-        self.responded_label.config(text=f"Responded: {self.responded_count}")
-        self.update_report_counter()
-
-    def increment_completed(self):
-        self.completed_count += 1
-        self.completed_label.config(text=f"Completed: {self.completed_count}")
-        self.update_report_counter()
-
-    def increment_ignored(self):
-        self.ignored_count += 1
-        self.ignored_label.config(text=f"Ignored: {self.ignored_count}")
-        self.update_report_counter()
-
-    def update_report_counter(self):
-        date_str = datetime.now().strftime("%Y-%m-%d")
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        project_root = os.path.dirname(script_dir)
-        report_log_dir = os.path.join(project_root, "logs", "email_report")
-        os.makedirs(report_log_dir, exist_ok=True)
-
-        file_path = os.path.join(report_log_dir, f"{date_str}.unsent.txt")
-
-        content = f"Triggered: {self.triggered_count}, Responded: {self.responded_count}, Completed: {self.completed_count}, Ignored: {self.ignored_count}"
-        with open(file_path, "w") as f:
-            f.write(content)
-
+            # The reply shows up through the store
+            self.connection_manager.check_battery()
+
+    def show(self, keys, state):
+        """Redraws what depends on the changed keys; called by the RefreshLoop on the Tk thread."""
+        if "triggered" in keys:
+            self.triggered_label.config(text=f"Triggered: {state['triggered']}")
+        if "responded" in keys:
+            self.responded_label.config(text=f"Responded: {state['responded']}")
+        if "completed" in keys:
+            self.completed_label.config(text=f"Completed: {state['completed']}")
+        if "ignored" in keys:
+            self.ignored_label.config(text=f"Ignored: {state['ignored']}")
+
+        if "next_start" in keys:
+            if isinstance(state["next_start"], datetime):
+                self.next_start_label.config(text=f"Next Notification: {state['next_start'].strftime('%Y-%m-%d %H:%M:%S')}")
+            else:
+                self.next_start_label.config(text="Next Notification: N/A")
+
+        # A new EMA start: show it and refresh the QR code timestamp
+        if "last_start" in keys and state["last_start"]:
+            self.last_start_label.config(text=f"Last Notification: {state['last_start'].strftime('%Y-%m-%d %H:%M:%S')}")
+            self.update_qr_code()
+
+        battery = state["battery"]
+        if "battery" in keys and battery:
+            device = f" [{battery['device']}]" if battery["device"] else ""
+            self.battery_level_label.config(text=f"Battery{device}: {int(battery['level']*100)}% ({battery['status']})")
+
+        if "bci_enabled" in keys and self.is_bci_enabled.get() != state["bci_enabled"]:
+            self.is_bci_enabled.set(state["bci_enabled"])
+        if "test_mode" in keys and self.is_testmode_enabled.get() != state["test_mode"]:
+            self.is_testmode_enabled.set(state["test_mode"])
 
     def update_qr_code(self):
         """Call QR update method from outside."""
@@ -212,6 +169,7 @@ class UI:
             self.qr_display.update_qr()
 
     def stop_server(self):
+        self.refresh_loop.stop()
         if self.connection_manager:
             self.connection_manager.stop_server()
         self.root.quit()
@@ -2,49 +2,58 @@ import os
 import time
 import threading
 from datetime import datetime
+from utils.scheduler.timer_scheduler import TimerScheduler
 
 class AudioAlert:
-    def __init__(self, alert_interval = 120, skip_callback = None, ui_instance = None, log_timestamped = None):
+    def __init__(self, alert_interval = 120, skip_callback = None, ui_instance = None, log_timestamped = None, timers = None):
         self.audio_file = "audio_alert.wav"
         self._alert_interval = alert_interval
-        self.end_playing = False
-        self.play_thread = None
+        self.end_playing = True
         self.skip_callback = skip_callback
         self.ui = ui_instance
         self.log_timestamped = log_timestamped
-    
-    def play_audio(self):
-        """Start playing audio in a separate thread."""
-        if self.play_thread and self.play_thread.is_alive():
-            return  # Prevent multiple instances
+        self.timers = timers or TimerScheduler.default()
+        self._timeout = None
+        self._lock = threading.Lock()
 
-        self.end_playing = False
-        self.play_thread = threading.Thread(target=self._play_audio_loop, daemon=True)
-        self.play_thread.start()
+    def play_audio(self):
+        """Start the alert; it ends on stop_audio() or after alert_interval seconds."""
+        with self._lock:
+            if not self.end_playing:
+                return  # Prevent multiple instances
+            self.end_playing = False
+            self._timeout = self.timers.call_later(self._alert_interval, self._finish, True)
 
-    def _play_audio_loop(self):
-        """Plays audio in a loop until stopped."""
-        start_time = time.time()
         self.log_timestamped("Audio started")
+        #os.system(f'afplay {self.audio_file}')  # MacOS
+        # os.system(f'start {self.audio_file}')  # Windows
 
-        while not self.end_playing and (time.time() - start_time) < self._alert_interval:
-            #os.system(f'afplay {self.audio_file}')  # MacOS
-            # os.system(f'start {self.audio_file}')  # Windows
-            time.sleep(0.5)  # Avoid tight loop
-
-        if not self.end_playing:
+    def _finish(self, timed_out):
+        """Ends the alert, counting it as ignored if nobody responded in time."""
+        if timed_out:
+            with self._lock:
+                if self.end_playing:
+                    return
+                self.end_playing = True
+                self._timeout = None
             self.ui.increment_ignored()
+
         self.log_timestamped("Audio stopped")
-        
+
         if self.skip_callback:
             self.skip_callback()
 
-        self.end_playing = True
-
     def stop_audio(self):
         """Stop the audio playback."""
-        self.end_playing = True
-        self.play_thread = None
+        with self._lock:
+            if self.end_playing:
+                return
+            self.end_playing = True
+            if self._timeout:
+                self._timeout.cancel()
+                self._timeout = None
+        # Finish on the timer thread, as the playback thread used to
+        self.timers.call_later(0, self._finish, False)
 
 
     """
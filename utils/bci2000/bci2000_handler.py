@@ -1,95 +1,66 @@
 import sys
-import threading
-import time
-import psutil
 from datetime import datetime, timedelta
+from utils.bci2000.bci2000_worker import BCI2000Worker
+from utils.bci2000.process_liveness import ProcessLiveness
+from utils.scheduler.timer_scheduler import TimerScheduler
 
 sys.path.append('C:\\BCI2000.x64\\prog')
 from BCI2000Remote import BCI2000Remote
 
 class BCI2000Handler:
-    def __init__(self, log_bci_message, send_email):
-        self.bci = BCI2000Remote()
-        self.connected = False
-        self.stop_monitor = threading.Event()
-        self.monitor_thread = threading.Thread(target=self.monitor_connection, daemon=True)
-        self.monitor_thread.start()
+    def __init__(self, log_bci_message, send_email, timers=None, process_table=None, remote_factory=BCI2000Remote):
         self.log_bci_message = log_bci_message  # Use ConnectionManager's logging function
         self.send_email = send_email    # Use ExperimentReporter's send email function
+        self.timers = timers or TimerScheduler.default()
+        # Owns the BCI2000Remote connection; every BCI2000 call runs on its thread
+        self.worker = BCI2000Worker(remote_factory, log_bci_message)
+        # BCI2000 module name .exe; found once, then tracked by PID
+        self.liveness = ProcessLiveness({"SignalGenerator.exe"}, table=process_table)
+        self.monitor_task = self.timers.call_every(1, self.monitor_connection)
         #self.schedule_disconnect_reconnect()
 
+    @property
+    def connected(self):
+        return self.worker.connected
+
     def connect_bci2000(self):
-        if self.connected:
-            return
-        try:
-            self.bci.Connect()
-            self.connected = True
-            self.log_bci_message("Connected to BCI2000")
-        except Exception as e:
-            self.log_bci_message(f"Failed to connect to BCI2000: {e}")
-        
+        if not self.connected:
+            self.worker.connect()
+
     def disconnect_bci2000(self):
-        if self.connected:
-            self.bci.Disconnect()
-            self.connected = False
-            self.log_bci_message("Disconnected from BCI2000")
+        self.worker.disconnect()
 
     def check_bci2000_running_status(self):
-        # BCI2000 module name .exe
-        target_names = {"SignalGenerator.exe"}
-        for proc in psutil.process_iter(attrs=['name']):
-            try:
-                if proc.info['name'] in target_names:
-                    return True
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                continue
-        return False
-
-
-    def handle_disconnection(self):
-        if self.connected:
-            self.connected = False
-            self.log_bci_message("Lost connection to BCI2000. Attempting to reconnect...")
-            self.connect_bci2000()
+        return self.liveness.check()
 
-    def monitor_connection(self):
-        while not self.stop_monitor.is_set():
-            time.sleep(1)
-            if self.connected:
-                if not self.check_bci2000_running_status():
-                    self.connected = False
-                    self.log_bci_message("Lost connection to BCI2000. Waiting for watchdog to restart module...")
-            else:
-                if self.check_bci2000_running_status():
-                    self.log_bci_message("BCI2000 module is back up. Attempting to reconnect...")
-                    self.connect_bci2000()
-
-    def process_bci_data(self, message):
-        self.connect_bci2000()
 
+    def monitor_connection(self):
+        # Runs every second on the shared timer thread
+        if self.connected:
+            if not self.check_bci2000_running_status():
+                self.worker.connection_lost()
+                self.log_bci_message("Lost connection to BCI2000. Waiting for watchdog to restart module...")
+        else:
+            if self.check_bci2000_running_status():
+                self.log_bci_message("BCI2000 module is back up. Attempting to reconnect...")
+                self.connect_bci2000()
+
+    def process_bci_data(self, message, at=None):
+        """Queues the event of a "BCI_Sync:<state>=<value>" line; `at` is when it happened (epoch seconds)."""
         try:
             key_value = message.split(":")[1].strip()
             key, value = key_value.split("=")
-            self.sync_bci_event(key.strip(), int(value.strip()))
-            #self.log_bci_message(f"Synced BCI event [EMA]: {key.strip()} = {int(value.strip())}")
+            self.sync_bci_event(key.strip(), int(value.strip()), at=at)
         except (ValueError, IndexError):
             self.log_bci_message(f"Invalid BCI_Sync message format: {message}")
 
-    def sync_bci_event(self, event_variable, value_variable):
-        self.connect_bci2000()  # Ensure connection before sending data
-        
-        try:
-            self.bci.SetEventVariable(event_variable, value_variable)
-            self.log_bci_message(f"Synced BCI event: {event_variable} = {value_variable}")
-        except Exception as e:
-            self.log_bci_message(f"Failed to sync event: {e}")
-            self.handle_disconnection()
-    
+    def sync_bci_event(self, event_variable, value_variable, at=None):
+        # Returns at once; the worker sends it and logs it stamped with `at`
+        self.worker.set_event(event_variable, value_variable, at=at)
+
     def get_bci_subjectName(self):
-        self.connect_bci2000()
-        
         try:
-            name = self.bci.GetParameter("SubjectName")
+            name = self.worker.call("GetParameter", "SubjectName")
             return name if name else "<BCI_SubjectName>"
         except Exception:
             if self.send_email:
@@ -106,10 +77,8 @@ class BCI2000Handler:
             return "<BCI_SubjectName>"
     
     def get_bci_subjectID(self):
-        self.connect_bci2000()
-
         try:
-            id = self.bci.GetParameter("SubjectSession")
+            id = self.worker.call("GetParameter", "SubjectSession")
             return id if id else "<BCI_SubjectSession>"
         except Exception:
             self.log_bci_message("BCI2000 not connected at EMA log file initialization")
@@ -134,8 +103,9 @@ class BCI2000Handler:
 
         delay = (target_time - now).total_seconds()
 
-        # Schedule the task using a timer
-        threading.Timer(delay, task).start()
+        # Schedule the task on the shared timer thread
+        return self.timers.call_later(delay, task)
 
     def stop(self):
-        self.stop_monitor.set()
\ No newline at end of file
+        self.monitor_task.cancel()
+        self.worker.close()
\ No newline at end of file
@@ -0,0 +1,230 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+
+class BCI2000Worker:
+    """
+    Owns the BCI2000Remote connection and runs every call on one thread,
+    so the socket thread and the photodiode loop never wait on BCI2000.
+
+    set_event() only records the write and returns. Redundant writes are
+    coalesced: a value equal to the one last queued for the state, or to
+    the one BCI2000 already holds, is not sent again. Distinct values are
+    all sent, in order, so pulses (1 -> 0) and steps (question 3 -> 4)
+    reach the recording even after a stall. Each write keeps its enqueue
+    time (or the caller's `at`, e.g. the clock-corrected event time), which
+    is what its log line is stamped with; the time it waited in the queue
+    is logged next to it.
+
+    call() runs any other BCI2000Remote method (e.g. GetParameter) on the
+    worker and waits at most `timeout` seconds for the result.
+
+    Timeouts: `timeout` is also set as the remote's own Timeout, which
+    bounds each call on its socket. A call that fails, or returns later
+    than `timeout`, drops the connection; the next call reconnects, at
+    most once every `retry_interval` seconds. Writes made while BCI2000
+    is unreachable are dropped (a late event marker is worse than none).
+    While a call is stuck the queue holds at most max_pending writes; the
+    oldest are dropped beyond that.
+
+    remote_factory: builds the BCI2000Remote; called on the worker thread.
+    log: log(message, at=None).
+    """
+
+    def __init__(self, remote_factory, log, timeout=2.0, retry_interval=1.0, max_pending=1000, clock=time.time):
+        self.remote_factory = remote_factory
+        self.log = log
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.max_pending = max_pending
+        self.clock = clock
+        self.remote = None
+        self.connected = False
+
+        self._condition = threading.Condition()
+        self._writes = deque()          # (state, value, at, enqueued), oldest first
+        self._queued = {}               # state -> value it was last queued with (sent or not)
+        self._calls = deque()           # (future, function, args)
+        self._written = {}              # state -> value BCI2000 holds, since the last connect
+        self._next_connect = 0.0
+        self._busy = False
+        self._running = True
+        self.events = 0
+        self.sent = 0
+        self.redundant = 0
+        self.dropped = 0
+        self.timeouts = 0
+        self.connections = 0
+        self.max_delay = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="BCI2000Worker", daemon=True)
+        self._thread.start()
+
+    # Producer side: safe from any thread, never touches BCI2000
+    def set_event(self, name, value, at=None):
+        """Queues SetEventVariable(name, value). `at` (epoch seconds) is the event's time, default now."""
+        with self._condition:
+            self.events += 1
+            if self._queued.get(name, self._written.get(name)) == value:
+                self.redundant += 1
+                return
+            if len(self._writes) >= self.max_pending:
+                self._writes.popleft()
+                self.dropped += 1
+            self._queued[name] = value
+            self._writes.append((name, value, at if at is not None else self.clock(), time.monotonic()))
+            self._condition.notify()
+
+    def submit(self, method, *args):
+        """Queues a call of the BCI2000Remote method `method`; returns a Future of its result."""
+        return self._submit(self._invoke, method, *args)
+
+    def _submit(self, function, *args):
+        future = Future()
+        with self._condition:
+            self._calls.append((future, function, args))
+            self._condition.notify()
+        return future
+
+    def call(self, method, *args, timeout=None):
+        """Runs a BCI2000Remote method on the worker; raises its error, or TimeoutError after `timeout` seconds."""
+        future = self.submit(method, *args)
+        try:
+            return future.result(self.timeout if timeout is None else timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise
+
+    def connect(self):
+        """Connects in the background, e.g. when the BCI2000 module is back up."""
+        return self._submit(self._ensure_connected)
+
+    def disconnect(self):
+        """Disconnects in the background, after the writes queued before it."""
+        return self._submit(self._disconnect)
+
+    def connection_lost(self):
+        """BCI2000 went away; the next call reconnects."""
+        with self._condition:
+            self.connected = False
+            self._written.clear()
+            self._queued.clear()
+            self._next_connect = 0.0
+
+    def flush(self, timeout=5.0):
+        """Blocks until everything queued so far has been handled."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._writes or self._calls or self._busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, timeout=5.0):
+        """Sends what is queued, disconnects and stops the worker."""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {"events": self.events, "sent": self.sent, "redundant": self.redundant,
+                "dropped": self.dropped, "timeouts": self.timeouts, "connections": self.connections,
+                "max_delay_ms": self.max_delay * 1000}
+
+    # Worker thread
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and not self._writes and not self._calls:
+                    self._condition.wait()
+                if not self._running and not self._writes and not self._calls:
+                    break
+                writes, self._writes = self._writes, deque()
+                calls, self._calls = self._calls, deque()
+                self._busy = True
+
+            self._send_writes(writes)
+            for future, function, args in calls:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(function(*args))
+                    except Exception as e:
+                        future.set_exception(e)
+
+            with self._condition:
+                self._busy = False
+                self._condition.notify_all()
+
+        self._disconnect()
+
+    def _send_writes(self, writes):
+        for name, value, at, enqueued in writes:
+            if self._written.get(name) == value:
+                self.redundant += 1
+                continue
+            delay = time.monotonic() - enqueued
+            self.max_delay = max(self.max_delay, delay)
+            try:
+                self._invoke("SetEventVariable", name, value)
+            except Exception as e:
+                self.dropped += 1
+                self.log(f"Failed to sync event {name} = {value}: {e}", at=at)
+                continue
+            self._written[name] = value
+            self.sent += 1
+            self.log(f"Synced BCI event: {name} = {value} (queued {delay * 1000:.1f} ms)", at=at)
+
+    def _ensure_connected(self):
+        if self.connected:
+            return True
+        now = time.monotonic()
+        if now < self._next_connect:
+            raise ConnectionError("BCI2000 unreachable, waiting to reconnect")
+        self._next_connect = now + self.retry_interval
+        try:
+            if self.remote is None:
+                self.remote = self.remote_factory()
+                try:
+                    self.remote.Timeout = self.timeout
+                except Exception:
+                    pass
+            self.remote.Connect()
+        except Exception as e:
+            self.log(f"Failed to connect to BCI2000: {e}")
+            raise
+        with self._condition:
+            self.connected = True
+            self._written.clear()
+        self.connections += 1
+        self.log("Connected to BCI2000")
+        return True
+
+    def _invoke(self, method, *args):
+        self._ensure_connected()
+        started = time.monotonic()
+        try:
+            result = getattr(self.remote, method)(*args)
+        except Exception:
+            self.connection_lost()
+            raise
+        elapsed = time.monotonic() - started
+        if elapsed > self.timeout:
+            # Went through, but BCI2000 is stalling; start over with a new connection
+            self.timeouts += 1
+            self.log(f"BCI2000 {method} took {elapsed:.1f} s (timeout {self.timeout:g} s); reconnecting")
+            self.connection_lost()
+        return result
+
+    def _disconnect(self):
+        if self.connected:
+            try:
+                self.remote.Disconnect()
+            except Exception:
+                pass
+            self.connection_lost()
+            self.log("Disconnected from BCI2000")
@@ -0,0 +1,86 @@
+import time
+import psutil
+
+
+class PsutilProcessTable:
+    """The machine's process table, through psutil."""
+
+    def scan(self, names):
+        """(pid, create_time) of every process whose name is in `names`."""
+        found = []
+        for proc in psutil.process_iter(attrs=['name', 'create_time']):
+            try:
+                if proc.info['name'] in names:
+                    found.append((proc.pid, proc.info['create_time']))
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return found
+
+    def alive(self, pid, create_time):
+        """True if `pid` is still the process that was created at `create_time`."""
+        try:
+            return psutil.Process(pid).create_time() == create_time
+        except psutil.NoSuchProcess:
+            return False
+        except psutil.AccessDenied:
+            # Cannot read its create time; assume the PID was not reused
+            return psutil.pid_exists(pid)
+
+
+class ProcessLiveness:
+    """
+    Tells whether a process (e.g. BCI2000's SignalGenerator.exe) is running
+    without walking the whole process table on every check.
+
+    The first check scans the table once and remembers the PID and create
+    time of the match; later checks only look that PID up, which also
+    catches a reused PID through its create time. When the process is gone
+    the table is scanned again right away (a watchdog may already have
+    restarted it), then with a backoff that doubles from min_rescan up to
+    max_rescan seconds while it stays missing; checks in between return
+    False without scanning.
+
+    table: anything with scan(names) and alive(pid, create_time), so the
+    logic can be exercised with a fake table (see
+    "testing tools/check_process_liveness.py").
+    """
+
+    def __init__(self, names, table=None, min_rescan=1.0, max_rescan=30.0, clock=time.monotonic):
+        self.names = set(names)
+        self.table = table or PsutilProcessTable()
+        self.min_rescan = min_rescan
+        self.max_rescan = max_rescan
+        self.clock = clock
+        self.pid = None
+        self.create_time = None
+        self._backoff = 0.0
+        self._next_scan = 0.0
+        self.checks = 0
+        self.scans = 0
+
+    def check(self):
+        self.checks += 1
+        if self.pid is not None:
+            if self.table.alive(self.pid, self.create_time):
+                return True
+            # Gone: look for a restarted instance now
+            self.pid = self.create_time = None
+            self._backoff = 0.0
+            self._next_scan = 0.0
+
+        now = self.clock()
+        if now < self._next_scan:
+            return False
+        self.scans += 1
+        found = self.table.scan(self.names)
+        if found:
+            # The newest instance, if several are running
+            self.pid, self.create_time = max(found, key=lambda match: match[1] or 0)
+            self._backoff = 0.0
+            return True
+        self._backoff = min(self.max_rescan, max(self.min_rescan, self._backoff * 2))
+        self._next_scan = now + self._backoff
+        return False
+
+    def stats(self):
+        return {"pid": self.pid, "checks": self.checks, "scans": self.scans, "backoff": self._backoff}
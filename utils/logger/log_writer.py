@@ -0,0 +1,218 @@
+import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+_WRITE, _SYNC, _FLUSH, _CLOSE, _STOP = range(5)
+
+
+class _LogStream:
+    """An open log file plus the bookkeeping needed for flushing and rotation."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.segment = 0
+        self.size = 0
+        self.day = None
+        self.dirty = False
+
+    def segment_path(self):
+        if self.segment == 0:
+            return self.path
+        root, ext = os.path.splitext(self.path)
+        return f"{root}_{self.segment}{ext}"
+
+
+class LogWriter:
+    """
+    Writes the server, EMA, BCI and latency logs from one background thread.
+
+    Callers only put a record on a SimpleQueue (no lock is held, no disk I/O
+    happens on their thread) and the writer keeps the files open, writing in
+    batches. Durability policy:
+        - flush_every: flush after this many buffered lines
+        - flush_interval_ms: flush at least this often while lines are pending
+        - sync(path): flush and fsync at a session boundary
+    Rotation: a new segment (<name>_<n>.txt) is started when a file exceeds
+    max_bytes, or when the day changes if rotate_daily is set.
+    """
+
+    def __init__(self, flush_every=64, flush_interval_ms=200, fsync_on_sync=True,
+                 max_bytes=None, rotate_daily=False, max_open_files=32):
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval_ms / 1000
+        self.fsync_on_sync = fsync_on_sync
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.max_open_files = max_open_files
+
+        self._queue = queue.SimpleQueue()
+        self._streams = OrderedDict()     # path -> _LogStream, least recently written first
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+        self._stamp_second = None
+        self._stamp_prefix = ""
+        self.dropped = 0
+
+        self._thread = threading.Thread(target=self._run, name="LogWriter", daemon=True)
+        self._thread.start()
+
+    # Producer side: safe from any thread, never touches the disk
+    def write(self, path, message, timestamped=True, echo=False, at=None):
+        """Queues one line. `at` (epoch seconds) overrides the timestamp, e.g. for clock-corrected events."""
+        if path is None:
+            return
+        if timestamped and at is None:
+            at = time.time()
+        self._queue.put((_WRITE, path, at if timestamped else None, message, echo))
+
+    def sync(self, path=None):
+        """Marks a durability boundary: flush and fsync one file, or all files."""
+        self._queue.put((_SYNC, path, None, None, False))
+
+    def close_file(self, path):
+        """Flushes and closes a file that will not be written again (e.g. an ended EMA session)."""
+        self._queue.put((_CLOSE, path, None, None, False))
+
+    def flush(self, timeout=5):
+        """Blocks until everything queued so far is written and flushed."""
+        done = threading.Event()
+        self._queue.put((_FLUSH, None, None, done, False))
+        return done.wait(timeout)
+
+    def stop(self, timeout=5):
+        if self._thread.is_alive():
+            self._queue.put((_STOP, None, None, None, False))
+            self._thread.join(timeout)
+
+    def format_timestamp(self, t):
+        """'YYYY-mm-dd HH:MM:SS.mmm' from a single clock reading."""
+        second = int(t)
+        if second != self._stamp_second:
+            self._stamp_second = second
+            self._stamp_prefix = datetime.fromtimestamp(second).strftime("%Y-%m-%d %H:%M:%S")
+        return f"{self._stamp_prefix}.{int((t - second) * 1000):03d}"
+
+    # Writer thread
+    def _run(self):
+        while True:
+            timeout = self.flush_interval if self._unflushed else None
+            try:
+                record = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._flush_all()
+                continue
+
+            # Drain whatever else is already queued as one batch
+            while record is not None:
+                if record[0] == _STOP:
+                    self._flush_all(fsync=self.fsync_on_sync)
+                    self._close_all()
+                    return
+                self._handle(record)
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    record = None
+
+            if self._unflushed >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_all()
+
+    def _handle(self, record):
+        op, path, t, message, echo = record
+        if op == _WRITE:
+            if t is not None:
+                message = f"{self.format_timestamp(t)} - {message}"
+            if echo:
+                print(message)
+            self._append(path, message + "\n", t)
+        elif op == _SYNC:
+            if path is None:
+                streams = list(self._streams.values())
+            else:
+                streams = [self._streams[path]] if path in self._streams else []
+            for stream in streams:
+                self._flush_stream(stream, fsync=self.fsync_on_sync)
+        elif op == _CLOSE:
+            stream = self._streams.pop(path, None)
+            if stream:
+                self._close_stream(stream)
+        elif op == _FLUSH:
+            self._flush_all()
+            message.set()
+
+    def _append(self, path, line, t):
+        stream = self._streams.get(path)
+        if stream is None:
+            stream = self._streams[path] = _LogStream(path)
+        else:
+            self._streams.move_to_end(path)
+
+        try:
+            if stream.file is not None and self._should_rotate(stream, t):
+                self._close_stream(stream)
+                stream.segment += 1
+            if stream.file is None:
+                self._open_stream(stream, t)
+            stream.file.write(line)
+        except OSError as e:
+            self.dropped += 1
+            print(f"LogWriter: failed to write {path}: {e}", file=sys.stderr)
+            return
+
+        stream.size += len(line)
+        stream.dirty = True
+        self._unflushed += 1
+
+    def _should_rotate(self, stream, t):
+        if self.max_bytes and stream.size >= self.max_bytes:
+            return True
+        return self.rotate_daily and t is not None and datetime.fromtimestamp(t).date() != stream.day
+
+    def _open_stream(self, stream, t):
+        # Keep a bounded number of handles open; per-device EMA files
+        # accumulate. The least recently written ones are closed first.
+        open_streams = [other for other in self._streams.values() if other.file is not None]
+        for oldest in open_streams[:max(0, len(open_streams) - self.max_open_files + 1)]:
+            self._close_stream(oldest)
+
+        path = stream.segment_path()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        stream.file = open(path, "a", encoding="utf-8")
+        stream.size = os.path.getsize(path)
+        stream.day = datetime.fromtimestamp(t if t is not None else time.time()).date()
+
+    def _flush_stream(self, stream, fsync=False):
+        if stream.file is None:
+            return
+        try:
+            stream.file.flush()
+            if fsync:
+                os.fsync(stream.file.fileno())
+        except OSError as e:
+            print(f"LogWriter: failed to flush {stream.path}: {e}", file=sys.stderr)
+        stream.dirty = False
+
+    def _flush_all(self, fsync=False):
+        for stream in self._streams.values():
+            if stream.dirty or fsync:
+                self._flush_stream(stream, fsync)
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def _close_stream(self, stream):
+        if stream.file is not None:
+            self._flush_stream(stream)
+            stream.file.close()
+            stream.file = None
+
+    def _close_all(self):
+        for stream in self._streams.values():
+            self._close_stream(stream)
+        self._streams.clear()
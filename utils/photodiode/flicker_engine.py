@@ -0,0 +1,143 @@
+import itertools
+import threading
+import time
+from connection.live_check_tracker import LatencyHistogram
+
+FLASH_ON = "FLASH_ON"
+FLASH_OFF = "FLASH_OFF"
+
+
+def prbs(order=7, seed=1):
+    """
+    Endless pseudo-random bit sequence from a Fibonacci LFSR
+    (PRBS7: x^7 + x^6 + 1, PRBS9: x^9 + x^5 + 1, PRBS15: x^15 + x^14 + 1).
+    """
+    taps = {7: 6, 9: 5, 15: 14}
+    if order not in taps:
+        raise ValueError(f"Unsupported PRBS order: {order}")
+    mask = (1 << order) - 1
+    state = (seed & mask) or 1
+    while True:
+        bit = ((state >> (order - 1)) ^ (state >> (taps[order] - 1))) & 1
+        state = ((state << 1) | bit) & mask
+        yield bit
+
+
+class Transition:
+    """One screen change: when it was meant to happen and when it did (perf_counter_ns)."""
+
+    __slots__ = ("index", "signal", "intended_ns", "actual_ns", "sent_ns")
+
+    def __init__(self, index, signal, intended_ns):
+        self.index = index
+        self.signal = signal
+        self.intended_ns = intended_ns
+        self.actual_ns = None   # send() was called
+        self.sent_ns = None     # message left the send queue, if the sender reports it
+
+    @property
+    def error_ms(self):
+        """How late send() was called, in ms."""
+        return (self.actual_ns - self.intended_ns) / 1e6
+
+
+class FlickerEngine:
+    """
+    Drives the photodiode screen flicker on absolute deadlines.
+
+    The pattern is a sequence of bits, one per period of 1 / frequency_hz:
+    a 1 shows the screen white for duty_cycle of the period, a 0 keeps it
+    black. The default pattern (1,) is a plain square wave; prbs() gives a
+    pseudo-random sequence. Each transition is due at start + its offset on
+    perf_counter_ns, so the time spent sending, logging or marking BCI2000
+    events never accumulates. The thread sleeps until spin_ms before a
+    deadline and busy-waits the rest.
+
+    send(signal, transition) is called at each deadline and should return
+    quickly; after_send(transition) then runs off the critical path.
+    """
+
+    def __init__(self, send, frequency_hz=0.5, duty_cycle=0.5, pattern=(1,), repeat=True,
+                 after_send=None, spin_ms=1.0):
+        if frequency_hz <= 0:
+            raise ValueError("Flicker frequency must be positive")
+        if not 0 < duty_cycle < 1:
+            raise ValueError("Duty cycle must be between 0 and 1")
+        if isinstance(pattern, (list, tuple, str)) and not any(int(bit) for bit in pattern):
+            raise ValueError("Flicker pattern must contain at least one 1 bit")
+        self.send = send
+        self.frequency_hz = frequency_hz
+        self.duty_cycle = duty_cycle
+        self.pattern = pattern
+        self.repeat = repeat
+        self.after_send = after_send
+        self.spin_ns = int(spin_ms * 1e6)
+        self.period_ns = int(1e9 / frequency_hz)
+        self.on_ns = int(self.period_ns * duty_cycle)
+
+        self._stop = threading.Event()
+        self.start_ns = None
+        self.start_wall = None
+        self.transitions = 0
+        self.lateness = LatencyHistogram()      # actual - intended, ms
+        self.queue_delay = LatencyHistogram()   # sent - intended, ms
+
+    def schedule(self):
+        """Yields (offset from start in ns, signal) for every transition, in order."""
+        bits = self.pattern
+        if self.repeat:
+            bits = itertools.cycle(bits) if isinstance(bits, (list, tuple, str)) else bits
+        for slot, bit in enumerate(bits):
+            # Long runs of 0 bits yield nothing, so stop() is checked here too
+            if self._stop.is_set():
+                return
+            if int(bit):
+                start = slot * self.period_ns
+                yield start, FLASH_ON
+                yield start + self.on_ns, FLASH_OFF
+
+    def stop(self):
+        self._stop.set()
+
+    def wait_until(self, deadline_ns):
+        """Sleeps until spin_ns before the deadline, then spins. False if stopped meanwhile."""
+        remaining = deadline_ns - time.perf_counter_ns() - self.spin_ns
+        if remaining > 0 and self._stop.wait(remaining / 1e9):
+            return False
+        while time.perf_counter_ns() < deadline_ns:
+            pass
+        return not self._stop.is_set()
+
+    def run(self, keep_running=None):
+        """Runs the pattern on the calling thread until it ends, stop() or keep_running() is False."""
+        # The same instant on both clocks, so transitions can be logged in wall time
+        self.start_ns = time.perf_counter_ns() + self.spin_ns
+        self.start_wall = time.time() + self.spin_ns / 1e9
+        for index, (offset_ns, signal) in enumerate(self.schedule()):
+            if keep_running is not None and not keep_running():
+                break
+            transition = Transition(index, signal, self.start_ns + offset_ns)
+            if not self.wait_until(transition.intended_ns):
+                break
+            transition.actual_ns = time.perf_counter_ns()
+            self.send(signal, transition)
+            self.lateness.record(transition.error_ms)
+            self.transitions += 1
+            if self.after_send:
+                self.after_send(transition)
+
+    def mark_sent(self, transition):
+        """Records when a transition's message actually left the send queue (first target only)."""
+        if transition.sent_ns is None:
+            transition.sent_ns = time.perf_counter_ns()
+            self.queue_delay.record((transition.sent_ns - transition.intended_ns) / 1e6)
+
+    def describe(self):
+        """One-line timing summary for the latency log."""
+        def fmt(value):
+            return "n/a" if value is None else f"{value:.3f}"
+        late = self.lateness.summary()
+        sent = self.queue_delay.summary()
+        return (f"Flicker timing: {self.transitions} transitions - send error p50 {fmt(late['p50'])} / "
+                f"p99 {fmt(late['p99'])} / max {fmt(late['max'])} ms, jitter {fmt(late['jitter'])} ms - "
+                f"on the wire p50 {fmt(sent['p50'])} / p99 {fmt(sent['p99'])} / max {fmt(sent['max'])} ms")
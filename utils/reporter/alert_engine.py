@@ -0,0 +1,134 @@
+import threading
+from utils.scheduler.timer_scheduler import TimerScheduler
+
+
+class TokenBucket:
+    """Allows `capacity` events at once and refills one every `period` seconds."""
+
+    def __init__(self, capacity, period, clock):
+        self.capacity = capacity
+        self.period = period
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.updated = clock()
+
+    def take(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.period)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class AlertEngine:
+    """
+    Sits in front of the mailer so an outage produces a handful of emails
+    instead of one per failed trigger or battery check.
+
+    Alerts are keyed by (kind, source). A key that keeps firing is emailed
+    again only after its repeat window, which starts at `window` seconds and
+    doubles with each repeat up to `max_window`; once the key has been quiet
+    for a whole repeat window it starts over. On top of that each kind has a
+    token bucket (`kind_burst` alerts, one more every `kind_period` s) so
+    many sources of one kind cannot flood, and all alerts share a global
+    bucket (`burst`, one more every `period` s). Everything held back is
+    counted per key and subject, with its first and last time, and
+    summarised in one digest email every `digest_interval` seconds (and on
+    close()).
+    """
+
+    def __init__(self, send, timers=None, window=3600, max_window=86400, kind_burst=3, kind_period=3600,
+                 burst=10, period=360, digest_interval=12 * 3600, log=None):
+        self.send = send                # send(subject, body), e.g. MailDispatcher.send
+        self.timers = timers or TimerScheduler.default()
+        self.clock = self.timers.clock
+        self.wall_clock = self.timers.wall_clock
+        self.window = window
+        self.max_window = max_window
+        self.kind_burst = kind_burst
+        self.kind_period = kind_period
+        self.log = log or (lambda message: None)
+
+        self._lock = threading.Lock()
+        self._bucket = TokenBucket(burst, period, self.clock)
+        self._kind_buckets = {}
+        self._keys = {}                 # key: {"sent": monotonic time of the last email, "seen": ..., "repeats": n}
+        self._suppressed = {}           # (kind, source, subject): {"count", "first", "last"}
+        self.sent = 0
+        self.suppressed = 0
+        self.digests = 0
+        self._digest_task = self.timers.call_every(digest_interval, self.send_digest)
+
+    def alert(self, kind, source, subject, body):
+        """Sends the alert or folds it into the next digest; returns True if it was sent."""
+        key = (kind, source)
+        now = self.clock()
+        with self._lock:
+            history = self._keys.get(key)
+            if history is None or now - history["seen"] > self._repeat_window(history):
+                history = self._keys[key] = {"sent": None, "seen": now, "repeats": 0}
+            history["seen"] = now
+            repeat_window = self._repeat_window(history)
+            bucket = self._kind_buckets.get(kind)
+            if bucket is None:
+                bucket = self._kind_buckets[kind] = TokenBucket(self.kind_burst, self.kind_period, self.clock)
+            allowed = ((history["sent"] is None or now - history["sent"] >= repeat_window)
+                       and bucket.take() and self._bucket.take())
+            if allowed:
+                if history["sent"] is not None:
+                    history["repeats"] += 1
+                history["sent"] = now
+                self.sent += 1
+            else:
+                self.suppressed += 1
+                timestamp = self.wall_clock()
+                entry = self._suppressed.get(key + (subject,))
+                if entry is None:
+                    self._suppressed[key + (subject,)] = {"count": 1, "first": timestamp, "last": timestamp}
+                else:
+                    entry["count"] += 1
+                    entry["last"] = timestamp
+        if allowed:
+            self.send(subject, body)
+        else:
+            self.log(f"Alert suppressed ({kind}, {source}): {subject}")
+        return allowed
+
+    def _repeat_window(self, history):
+        return min(self.max_window, self.window * 2 ** history["repeats"])
+
+    def send_digest(self):
+        """Emails one summary of the alerts suppressed since the last digest, if any."""
+        with self._lock:
+            suppressed, self._suppressed = self._suppressed, {}
+        if not suppressed:
+            return False
+        total = sum(entry["count"] for entry in suppressed.values())
+        lines = []
+        for (kind, source, subject), entry in sorted(suppressed.items(), key=lambda item: item[1]["first"]):
+            lines.append(
+                f"{entry['count']} x {subject} [{kind}{f', {source}' if source else ''}]\n"
+                f"    first {entry['first'].strftime('%Y-%m-%d %H:%M:%S')}, last {entry['last'].strftime('%Y-%m-%d %H:%M:%S')}"
+            )
+        subject = f"[Alert Digest] {total} suppressed alert(s)"
+        body = (
+            "These alerts repeated and were not emailed individually:\n\n"
+            + "\n".join(lines)
+            + f"\n\nDigest generated at: {self.wall_clock().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+            "This is an autogenerated alert email, please do not reply"
+        )
+        self.digests += 1
+        self.send(subject, body)
+        return True
+
+    def close(self):
+        """Stops the digest timer and sends what is still suppressed."""
+        self._digest_task.cancel()
+        self.send_digest()
+
+    def stats(self):
+        with self._lock:
+            waiting = sum(entry["count"] for entry in self._suppressed.values())
+        return {"sent": self.sent, "suppressed": self.suppressed, "digests": self.digests, "waiting": waiting}
@@ -1,113 +1,90 @@
 # Experiment night reporter
 import os
-import schedule
-import threading
-import time
-import smtplib
-from email.mime.text import MIMEText
-from datetime import datetime
+from datetime import datetime, timedelta
+from core.state_store import COUNTERS
+from utils.reporter.alert_engine import AlertEngine
+from utils.reporter.mail_dispatcher import MailDispatcher
+from utils.scheduler.timer_scheduler import TimerScheduler
 
 class ExperimentReporter:
-    def __init__(self, ui_instance, email_config):
-        self.ui = ui_instance
+    def __init__(self, state, journal, email_config, timers=None, log_timestamped=None, outbox_dir=None, mailer=None):
+        self.state = state
+        self.journal = journal      # counters and session events, see core.journal.Journal
         self.email_config = email_config
-
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        project_root = os.path.dirname(os.path.dirname(script_dir))
-        base_dir = os.path.join(project_root, "logs")
-        self.report_log_dir = os.path.join(base_dir, "email_report")
-
-        # Ensure all log directories exist
-        for directory in [self.report_log_dir]:
-            os.makedirs(directory, exist_ok=True)
+        # Set to ConnectionManager.log_timestamped once the server exists
+        self.log_timestamped = log_timestamped or (lambda message: print(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}"))
+        self.timers = timers or TimerScheduler.default()
+
+        # Mail goes out from the dispatcher's thread, through a durable outbox
+        # (or through `mailer`, anything with send(subject, body) and close())
+        if mailer is None:
+            if outbox_dir is None:
+                project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+                outbox_dir = os.path.join(project_root, "logs", "mail_outbox")
+            mailer = MailDispatcher(email_config, outbox_dir, log=lambda message: self.log_timestamped(message))
+        self.mailer = mailer
+        # Alerts are deduplicated, rate limited and batched into digests; reports are not
+        self.alerts = AlertEngine(self.mailer.send, timers=self.timers, log=lambda message: self.log_timestamped(message))
 
         # Schedule the report to run every day at 9:30 PM
-        schedule.every().day.at("21:30").do(self.send_report)
-        #schedule.every(1).minutes.do(self.send_report)     # (TESTING) sends reports after 1 min
-
-        # Run schedule in a background thread
-        self.scheduler_thread = threading.Thread(target=self._run_scheduler, daemon=True)
-        self.scheduler_thread.start()
+        self.report_task = self.timers.call_daily_at("21:30", self.send_report)
+        #self.report_task = self.timers.call_every(60, self.send_report)     # (TESTING) sends reports every 1 min
 
-    def _run_scheduler(self):
-        while True:
-            schedule.run_pending()
-            time.sleep(30)
-    
     def reset_ui_counter(self):
-        # Reset UI counters
-        self.ui.triggered_count = 0
-        self.ui.responded_count = 0
-        self.ui.completed_count = 0
-        self.ui.ignored_count = 0
+        # Reset the counters; ReportCounters and the UI follow the store
+        self.state.set(triggered=0, responded=0, completed=0, ignored=0)
 
-        self.ui.triggered_label.config(text="Triggered: 0")
-        self.ui.responded_label.config(text="Responded: 0")
-        self.ui.completed_label.config(text="Completed: 0")
-        self.ui.ignored_label.config(text="Ignored: 0")
+        self.log_timestamped(f"EMA Counter reset for today.")
 
-        self.ui.update_report_counter()
-
-        self.ui.connection_manager.log_timestamped(f"EMA Counter reset for today.")
 
+    def summary(self, days=7):
+        """Counter totals of the last `days` days, from the journal."""
+        today = self.timers.wall_clock().date()
+        totals = {}
+        for state in self.journal.days(today - timedelta(days=days - 1), today).values():
+            for key, value in self.journal.totals(state).items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
 
     def send_report(self):
-        date_str = datetime.now().strftime("%Y-%m-%d")
-        unsent_path = os.path.join(self.report_log_dir, f"{date_str}.unsent.txt")
-        sent_path = os.path.join(self.report_log_dir, f"{date_str}.sent.txt")
-
-        if not os.path.exists(unsent_path):
-            print(self.report_log_dir)
-            print(date_str)
-            print(unsent_path)
-            print(sent_path)
-            self.ui.connection_manager.log_timestamped(f"No unsent report found for today: {date_str}.")
-            return
-
-        try:
-            with open(unsent_path, "r") as f:
-                content = f.read().strip()
-                counts = {k.strip(): int(v.strip()) for k, v in (pair.split(":") for pair in content.split(","))}
-        except Exception as e:
-            self.ui.connection_manager.log_timestamped(f"Failed to read report file: {e}")
+        now = self.timers.wall_clock()
+        date_str = now.strftime("%Y-%m-%d")
+        today = self.journal.day_state(now.date())
+        if today["reported"] is not None:
+            self.log_timestamped(f"Report for today already sent: {date_str}.")
             return
+        _, state = self.state.snapshot()
+        counts = {key: state[key] for key in COUNTERS}
+        week = self.summary(7)
 
         subject = f"Daily EMA Report - {date_str}"
         body = (
             "Automated daily summary for today's EMA sessions:\n\n"
-            f"Total EMAs Triggered: {counts.get('Triggered', 0)}\n"
-            f"  - Responded: {counts.get('Responded', 0)}\n"
-            f"    - Of those responded, {counts.get('Completed', 0)} were fully completed.\n"
-            f"  - Ignored: {counts.get('Ignored', 0)}\n\n"
-            f"Report generated at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+            f"Total EMAs Triggered: {counts.get('triggered', 0)}\n"
+            f"  - Responded: {counts.get('responded', 0)}\n"
+            f"    - Of those responded, {counts.get('completed', 0)} were fully completed.\n"
+            f"  - Ignored: {counts.get('ignored', 0)}\n\n"
+            f"Last 7 days: {week.get('triggered', 0)} triggered, {week.get('responded', 0)} responded, "
+            f"{week.get('completed', 0)} completed, {week.get('ignored', 0)} ignored\n\n"
+            f"Report generated at: {now.strftime('%Y-%m-%d %H:%M:%S')}\n\n"
             "Please do not reply to this email."
         )
 
-        msg = MIMEText(body)
-        msg['Subject'] = subject
-        msg['From'] = self.email_config['sender']
-        msg['To'] = ", ".join(self.email_config['recipient'])
-
-        try:
-            with smtplib.SMTP_SSL(self.email_config['smtp_server'], self.email_config['port']) as server:
-                server.login(self.email_config['sender'], self.email_config['password'])
-                server.send_message(msg)
-            self.ui.connection_manager.log_timestamped(f"[{datetime.now()}] - Email sent successfully.")
-            os.rename(unsent_path, sent_path)
-            self.reset_ui_counter()
-        except Exception as e:
-            self.ui.connection_manager.log_timestamped(f"[{datetime.now()}] - Failed to send email: {e}")
-
-    def send_email(self, subject, body):
-        msg = MIMEText(body)
-        msg['Subject'] = subject
-        msg['From'] = self.email_config['sender']
-        msg['To'] = ", ".join(self.email_config['recipient'])
-        
-        try:
-            with smtplib.SMTP_SSL(self.email_config['smtp_server'], self.email_config['port']) as server:
-                server.login(self.email_config['sender'], self.email_config['password'])
-                server.send_message(msg)
-            self.ui.connection_manager.log_timestamped(f"[{datetime.now()}] - Alert email sent successfully.")
-        except Exception as e:
-            self.ui.connection_manager.log_timestamped(f"[{datetime.now()}] - Failed to send alert email: {e}")
\ No newline at end of file
+        # Queued in the durable outbox, so the day counts as reported
+        self.mailer.send(subject, body)
+        self.log_timestamped(f"[{now}] - Daily report queued for sending.")
+        self.journal.append("report", values=counts)
+        self.reset_ui_counter()
+
+    def send_email(self, subject, body, kind=None, source=None):
+        """
+        Queues an alert through the AlertEngine; never blocks the caller.
+        Repeats of the same (kind, source) are held back for the digest;
+        kind defaults to the subject.
+        """
+        return self.alerts.alert(kind or subject, source, subject, body)
+
+    def close(self):
+        self.report_task.cancel()
+        self.alerts.close()
+        self.mailer.close()
@@ -0,0 +1,206 @@
+import itertools
+import json
+import os
+import random
+import smtplib
+import threading
+import time
+from email.mime.text import MIMEText
+
+
+class MailDispatcher:
+    """
+    Sends email from a background thread so callers never wait on SMTP.
+
+    send() only queues the message and returns at once. The worker writes
+    it to the outbox directory (one JSON file per message, replaced
+    atomically) before anything else, then delivers due messages over one SMTP connection, keeps it open for idle_timeout
+    seconds so a burst reuses it, and on failure retries with exponential
+    backoff (base_delay * 2**n, capped at max_delay, with jitter). After
+    max_attempts a message moves to <outbox>/failed. Messages still in the
+    outbox when the process stops are sent after the next start.
+
+    email_config: smtp_server, port, sender, password, recipient, plus the
+    optional ssl (default True, False for plain SMTP) and timeout (seconds).
+    """
+
+    def __init__(self, email_config, outbox_dir, log=print, max_attempts=8, base_delay=30.0,
+                 max_delay=3600.0, idle_timeout=30.0, connect=None):
+        self.email_config = email_config
+        self.outbox_dir = outbox_dir
+        self.failed_dir = os.path.join(outbox_dir, "failed")
+        os.makedirs(self.failed_dir, exist_ok=True)
+        self.log = log
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.idle_timeout = idle_timeout
+        self.connect = connect or self._connect
+
+        self._condition = threading.Condition()
+        self._pending = []          # outbox entries, see send()
+        self._unsaved = []          # entries queued by send() that the worker has not written yet
+        self._counter = itertools.count()
+        self._running = True
+        self.sent = 0
+        self.failed = 0
+        self.connections = 0
+
+        self._load()
+        self._thread = threading.Thread(target=self._run, name="MailDispatcher", daemon=True)
+        self._thread.start()
+
+    # Outbox
+    def _load(self):
+        for name in sorted(os.listdir(self.outbox_dir)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.outbox_dir, name)
+            try:
+                with open(path, encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError) as e:
+                self.log(f"Unreadable outbox message {name}: {e}")
+                continue
+            entry["path"] = path
+            entry["next_try"] = 0.0     # retry what survived a restart right away
+            self._pending.append(entry)
+        if self._pending:
+            self.log(f"Mail outbox: {len(self._pending)} unsent message(s) from a previous run")
+
+    def _save(self, entry):
+        temp_path = entry["path"] + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({key: value for key, value in entry.items() if key not in ("path", "next_try")}, f)
+        os.replace(temp_path, entry["path"])
+
+    def send(self, subject, body):
+        """Queues a message; returns without touching the network."""
+        created = time.time()
+        name = f"{time.strftime('%Y%m%d_%H%M%S', time.localtime(created))}_{os.getpid()}_{next(self._counter):06d}.json"
+        entry = {"subject": subject, "body": body, "created": created, "attempts": 0,
+                 "path": os.path.join(self.outbox_dir, name), "next_try": 0.0}
+        with self._condition:
+            self._pending.append(entry)
+            self._unsaved.append(entry)
+            self._condition.notify()
+
+    def pending(self):
+        with self._condition:
+            return len(self._pending)
+
+    # Delivery
+    def _connect(self):
+        config = self.email_config
+        timeout = config.get("timeout", 30)
+        if config.get("ssl", True):
+            server = smtplib.SMTP_SSL(config["smtp_server"], config["port"], timeout=timeout)
+        else:
+            server = smtplib.SMTP(config["smtp_server"], config["port"], timeout=timeout)
+        if config.get("password"):
+            server.login(config["sender"], config["password"])
+        return server
+
+    def _message(self, entry):
+        msg = MIMEText(entry["body"])
+        msg['Subject'] = entry["subject"]
+        msg['From'] = self.email_config['sender']
+        msg['To'] = ", ".join(self.email_config['recipient'])
+        return msg
+
+    def _due(self):
+        now = time.monotonic()
+        return [entry for entry in self._pending if entry["next_try"] <= now]
+
+    def _run(self):
+        server = None
+        idle_since = 0.0
+        while True:
+            with self._condition:
+                while self._running and not self._unsaved:
+                    if self._due():
+                        break
+                    now = time.monotonic()
+                    deadlines = [entry["next_try"] for entry in self._pending]
+                    if server is not None:
+                        if now >= idle_since + self.idle_timeout:
+                            break   # close the idle connection
+                        deadlines.append(idle_since + self.idle_timeout)
+                    self._condition.wait(max(0.0, min(deadlines) - now) if deadlines else None)
+                unsaved, self._unsaved = self._unsaved, []
+                running = self._running
+                due = self._due()
+
+            # New messages reach the outbox first, also when stopping
+            for entry in unsaved:
+                try:
+                    self._save(entry)
+                except OSError as e:
+                    self.log(f"Could not write {entry['subject']} to the mail outbox: {e}")
+            if not running:
+                break
+            if not due:
+                if not unsaved:
+                    server = self._close(server)    # idle timeout
+                continue
+
+            for entry in due:
+                try:
+                    if server is None:
+                        server = self.connect()
+                        self.connections += 1
+                    server.send_message(self._message(entry))
+                except Exception as e:
+                    server = self._close(server)
+                    self._retry(entry, e)
+                    break   # the server is unreachable; back off the rest too
+                self._delivered(entry)
+            idle_since = time.monotonic()
+
+        self._close(server)
+
+    def _close(self, server):
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                pass
+        return None
+
+    def _delivered(self, entry):
+        with self._condition:
+            self._pending.remove(entry)
+        try:
+            os.remove(entry["path"])
+        except OSError:
+            pass
+        self.sent += 1
+        self.log(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] - Email sent successfully: {entry['subject']}")
+
+    def _retry(self, entry, error):
+        entry["attempts"] += 1
+        if entry["attempts"] >= self.max_attempts:
+            with self._condition:
+                self._pending.remove(entry)
+            os.replace(entry["path"], os.path.join(self.failed_dir, os.path.basename(entry["path"])))
+            self.failed += 1
+            self.log(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] - Giving up on email after {entry['attempts']} attempts: {entry['subject']} ({error})")
+            return
+        delay = min(self.max_delay, self.base_delay * 2 ** (entry["attempts"] - 1)) * random.uniform(0.8, 1.2)
+        entry["next_try"] = time.monotonic() + delay
+        self._save(entry)
+        # Messages queued behind it wait for the same retry
+        with self._condition:
+            for other in self._pending:
+                other["next_try"] = max(other["next_try"], entry["next_try"])
+        self.log(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] - Failed to send email (attempt {entry['attempts']}, retry in {delay:.0f} s): {error}")
+
+    def close(self, timeout=5.0):
+        """Stops the worker; unsent messages stay in the outbox."""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {"pending": self.pending(), "sent": self.sent, "failed": self.failed, "connections": self.connections}
@@ -0,0 +1,141 @@
+import csv
+import random
+import zlib
+from datetime import date, datetime, time as dt_time, timedelta
+
+import numpy as np
+
+
+def _minutes(clock):
+    """Minute of the day of "HH:MM" or a datetime.time."""
+    if isinstance(clock, str):
+        clock = dt_time.fromisoformat(clock)
+    return clock.hour * 60 + clock.minute
+
+
+class SchedulePlanner:
+    """
+    Plans every EMA trigger of a study up front from a seed.
+
+    Constraints:
+        window          ("09:00", "21:00"), triggers only inside it
+        min_gap/max_gap minutes between triggers of a day; the first one
+                        comes min_gap..max_gap after the window opens
+        daily_quota     at most this many triggers a day (None: as many as fit)
+        blackouts       daily ("HH:MM", "HH:MM") periods without triggers
+        blackout_dates  whole days without triggers
+
+    Blackouts are cut out of the window before planning, so gaps are
+    measured in active time and a gap that spans a blackout is longer on
+    the clock by the blackout's length.
+
+    All days are drawn in one pass: a (days, slots) matrix of gaps, its
+    cumulative sum per row, and masks for the window end, the quota and
+    the blackout dates. Rows are drawn in order from the seed, so planning
+    more days never changes the days already planned.
+    """
+
+    def __init__(self, seed=None, start_day=None, window=("09:00", "21:00"), min_gap=90, max_gap=150,
+                 daily_quota=None, blackouts=(), blackout_dates=()):
+        if min_gap <= 0 or max_gap < min_gap:
+            raise ValueError(f"Invalid gaps: min_gap={min_gap}, max_gap={max_gap}")
+        self.seed = seed if seed is not None else random.SystemRandom().randrange(2 ** 32)
+        self.start_day = start_day or date.today()
+        self.window = window
+        self.min_gap = min_gap
+        self.max_gap = max_gap
+        self.daily_quota = daily_quota
+        self.blackouts = tuple(blackouts)
+        self.blackout_dates = frozenset(blackout_dates)
+
+        # The active parts of the window: clock minutes each one starts and
+        # ends at, and the active minute it starts at
+        window_start, window_end = _minutes(window[0]), _minutes(window[1])
+        if window_end <= window_start:
+            raise ValueError(f"Empty window: {window}")
+        cuts = sorted((max(window_start, _minutes(begin)), min(window_end, _minutes(end))) for begin, end in self.blackouts)
+        segment_starts, active_starts, active = [], [], 0
+        position = window_start
+        for begin, end in cuts + [(window_end, window_end)]:
+            if begin > position:
+                segment_starts.append(position)
+                active_starts.append(active)
+                active += begin - position
+            position = max(position, end)
+        if not active:
+            raise ValueError(f"Blackouts {self.blackouts} cover the whole window {window}")
+        self._segment_starts = np.array(segment_starts, dtype=np.int64)
+        self._segment_ends = self._segment_starts + np.diff(active_starts + [active])
+        self._active_starts = np.array(active_starts, dtype=np.int64)
+        self.active_minutes = active
+        self.slots = active // min_gap + 1      # most triggers that can fit in a day
+
+    def settings(self):
+        """The seed and constraints as JSON-friendly values; SchedulePlanner.from_settings() rebuilds the same plan."""
+        return {"seed": self.seed, "start_day": self.start_day.isoformat(), "window": list(self.window),
+                "min_gap": self.min_gap, "max_gap": self.max_gap, "daily_quota": self.daily_quota,
+                "blackouts": [list(period) for period in self.blackouts],
+                "blackout_dates": sorted(day.isoformat() for day in self.blackout_dates)}
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings["seed"], date.fromisoformat(settings["start_day"]), tuple(settings["window"]),
+                   settings["min_gap"], settings["max_gap"], settings["daily_quota"],
+                   [tuple(period) for period in settings["blackouts"]],
+                   [date.fromisoformat(day) for day in settings["blackout_dates"]])
+
+    def active_until(self, moment):
+        """End of the active period `moment` falls in, or None if no trigger may start at `moment`."""
+        if moment.date() in self.blackout_dates:
+            return None
+        minute = moment.hour * 60 + moment.minute
+        for begin, end in zip(self._segment_starts, self._segment_ends):
+            if begin <= minute < end:
+                return datetime.combine(moment.date(), dt_time()) + timedelta(minutes=int(end))
+        return None
+
+    def derive(self, name):
+        """Same constraints, with a seed of its own derived from this one and `name` (e.g. a device ID)."""
+        seed = int(np.random.SeedSequence([self.seed, zlib.crc32(str(name).encode("utf-8"))]).generate_state(1)[0])
+        return SchedulePlanner(seed, self.start_day, self.window, self.min_gap, self.max_gap,
+                               self.daily_quota, self.blackouts, self.blackout_dates)
+
+    def plan(self, days):
+        """Start times of the first `days` study days, oldest first."""
+        rng = np.random.default_rng(self.seed)
+        gaps = rng.integers(self.min_gap, self.max_gap + 1, size=(days, self.slots), dtype=np.int64)
+        offsets = np.cumsum(gaps, axis=1)       # active minutes after the window opens
+
+        valid = offsets < self.active_minutes
+        if self.daily_quota is not None:
+            valid[:, self.daily_quota:] = False
+        day_numbers = np.arange(days, dtype=np.int64)
+        if self.blackout_dates:
+            off = [(day - self.start_day).days for day in self.blackout_dates]
+            valid &= ~np.isin(day_numbers, off)[:, None]
+
+        # Active minute -> clock minute, skipping the blackouts
+        segment = np.searchsorted(self._active_starts, offsets, side="right") - 1
+        clock_minutes = self._segment_starts[segment] + offsets - self._active_starts[segment]
+
+        start = np.datetime64(self.start_day, "m")
+        times = start + (day_numbers[:, None] * 1440 + clock_minutes)[valid].astype("timedelta64[m]")
+        return times.astype(datetime).tolist()
+
+    def export(self, path, days):
+        """Writes the plan of the first `days` days as CSV, with the seed and constraints on top, and returns it."""
+        plan = self.plan(days)
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            f.write(f"# seed={self.seed} start_day={self.start_day.isoformat()} window={self.window[0]}-{self.window[1]} "
+                    f"min_gap={self.min_gap} max_gap={self.max_gap} daily_quota={self.daily_quota} "
+                    f"blackouts={list(self.blackouts)} blackout_dates={sorted(day.isoformat() for day in self.blackout_dates)}\n")
+            writer = csv.writer(f)
+            writer.writerow(["date", "n", "start", "gap_minutes"])
+            previous = None
+            for start in plan:
+                same_day = previous is not None and previous.date() == start.date()
+                number = number + 1 if same_day else 1
+                gap = int((start - previous).total_seconds() // 60) if same_day else ""
+                writer.writerow([start.date().isoformat(), number, start.strftime("%H:%M"), gap])
+                previous = start
+        return plan
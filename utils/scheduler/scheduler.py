@@ -1,60 +1,96 @@
-from datetime import datetime, timedelta
-import threading
+import bisect
+import json
+import os
 import random
+from datetime import datetime, timedelta
+from utils.scheduler.schedule_planner import SchedulePlanner
+from utils.scheduler.timer_scheduler import TimerScheduler
+
+MISSED_START_POLICIES = ("fire", "skip", "rerandomize")
 
 class Scheduler:
-    def __init__(self, connection_manager, update_ui_callback=None):
+    def __init__(self, connection_manager, update_ui_callback=None, timers=None, planner=None, state_path=None,
+                 missed_start_policy="skip"):
         self.connection_manager = connection_manager
         self.update_ui_callback = update_ui_callback
+        self.timers = timers or TimerScheduler.default()
         self.timer = None
         self.is_first_session = True
 
+        # Start times come from a precomputed, seeded plan (see SchedulePlanner)
+        self.planner = planner or SchedulePlanner()
+        self.plan = []
+        self.plan_days = 0
+        self.armed = None       # the start the timer is set for
+        self.off_plan = False   # armed is not a planned start (the first one, or a catch-up)
+        self._due = None        # set while our own timer's start is being sent
+
+        # The planner's settings and the armed start are saved here, so a
+        # restart resumes the schedule (see resume())
+        self.state_path = state_path
+        if missed_start_policy not in MISSED_START_POLICIES:
+            raise ValueError(f"Unknown missed start policy: {missed_start_policy}")
+        self.missed_start_policy = missed_start_policy
+
     def get_next_start_time(self):
         """
-        Calculates the start time of the next EMA session.
-        
-        - If the EMA session is the first one in the study,
-        get a random time within the 10-60 min range after the initiation.
-        - The following next EMA sessions is scheduled within the 90-150 min range.
-        - Sessions are only scheduled between 9am-9pm of the day
-        - Allow next-day rescheduling if needed.
-        
+        Returns the start time of the next EMA session.
+
+        - The first session of the study starts right away.
+        - After that, sessions follow the planner's schedule (90-150 min
+        apart, 9am-9pm by default).
+        - A session started off the plan (Start button, a device request)
+        skips planned starts less than min_gap minutes after it.
         """
+        now = self.timers.wall_clock()
         if self.is_first_session:
-            #delay = random.randint(10, 70)
-            delay = 0
             self.is_first_session = False
-            next_start_time = datetime.now() + timedelta(seconds=2)
-            #return next_start_time
-        else:
-            min_delay = 90
-            max_delay = 150
-            delay = random.randint(min_delay, max_delay)
-        
-        next_start_time = datetime.now() + timedelta(minutes=delay)
-
-        # Check if it exceeds 9pm; if so, schedule for the next day at 9am with a new random delay
-        if next_start_time.hour >= 21:
-            next_start_time = next_start_time.replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
-            next_start_time += timedelta(minutes=delay)
-        elif next_start_time.hour < 9:
-            next_start_time = next_start_time.replace(hour=9, minute=0, second=0, microsecond=0)
-            next_start_time += timedelta(minutes=delay)
+            self.off_plan = True
+            return now + timedelta(seconds=2)
+
+        # Started by our own timer on a planned start: continue with the
+        # next one. Anything else counts from now.
+        due, self._due = self._due, None
+        if due is not None and not self.off_plan:
+            after = max(now, due)
         else:
-            next_start_time = next_start_time
+            after = now + timedelta(minutes=self.planner.min_gap)
+        self.off_plan = False
+        return self.next_planned(after)
 
-        #next_start_time = datetime.now() + timedelta(seconds=210)
-        
-        return next_start_time
+    def next_planned(self, after):
+        """The first planned start later than `after`, planning further ahead as needed."""
+        while True:
+            index = bisect.bisect_right(self.plan, after)
+            if index < len(self.plan):
+                return self.plan[index]
+            days = max(2 * self.plan_days, (after.date() - self.planner.start_day).days + 30)
+            if days > 3660:
+                raise ValueError(f"No EMA start can be planned after {after}")
+            self.plan = self.planner.plan(days)
+            self.plan_days = days
+            if self.connection_manager:
+                self.connection_manager.log_timestamped(f"EMA plan: {len(self.plan)} sessions over {days} days (seed {self.planner.seed})")
+
+    def export_plan(self, path, days=None):
+        """Writes the plan for audit (see SchedulePlanner.export)."""
+        return self.planner.export(path, days or max(self.plan_days, 30))
 
     def schedule_start(self):
         """Schedules the start signal, ensuring only one active timer at a time."""
+        next_start_time = self.get_next_start_time()
+        self._arm(next_start_time)
+        return next_start_time
+
+    def _arm(self, next_start_time):
         if self.timer:
             self.timer.cancel()  # Cancel the previous timer if it exists
-        
-        next_start_time = self.get_next_start_time()
-        delay_seconds = (next_start_time - datetime.now()).total_seconds()
+        self.armed = next_start_time
 
+        # The delay is taken between epoch times, so a DST change between now
+        # and the start does not move it; once armed, the timer runs on the
+        # monotonic clock and wall-clock jumps do not move it either
+        delay_seconds = next_start_time.timestamp() - self.timers.wall_clock().timestamp()
 
         if self.update_ui_callback:
             self.update_ui_callback(next_start_time)
@@ -64,9 +100,80 @@ class Scheduler:
         #    threading.Timer(init_delay_seconds, connection_manager.send_init_bci_signal).start()
 
         # Schedule sending the start signal after the calculated delay
-        self.timer = threading.Timer(delay_seconds, self.connection_manager.send_start_signal)
-        self.timer.start()
+        self.timer = self.timers.call_later(delay_seconds, self._fire)
+        self.save()
 
         self.connection_manager.log_timestamped(f"Next EMA session scheduled at: {next_start_time}")
 
-        return next_start_time
\ No newline at end of file
+    def _fire(self):
+        self._due = self.armed
+        self.connection_manager.send_start_signal()
+
+    # Persistence
+    def save(self):
+        """Writes the planner settings and the armed start to state_path (atomically)."""
+        if not self.state_path or self.armed is None:
+            return
+        state = {"planner": self.planner.settings(), "next_start": self.armed.timestamp(),
+                 "off_plan": self.off_plan, "saved_at": self.timers.wall_clock().timestamp()}
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.state_path)
+
+    def resume(self):
+        """
+        Re-arms the schedule saved before a restart, without replanning.
+        Returns the next start time, or None if there is nothing to resume.
+        A start missed while the server was down is handled by
+        missed_start_policy:
+            fire         start now (if inside the window, else skip)
+            skip         wait for the next planned start
+            rerandomize  a random time between now and the next planned
+                         start (keeping min_gap before it), inside the
+                         window; else skip
+        """
+        if not self.state_path or not os.path.exists(self.state_path):
+            return None
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+            planner = SchedulePlanner.from_settings(state["planner"])
+            next_start = datetime.fromtimestamp(state["next_start"])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.connection_manager.log_timestamped(f"Could not resume the EMA schedule from {self.state_path}: {e}")
+            return None
+
+        self.planner = planner
+        self.plan = []
+        self.plan_days = 0
+        self.is_first_session = False
+        self.off_plan = state.get("off_plan", False)
+        now = self.timers.wall_clock()
+        if next_start <= now:
+            missed = next_start
+            next_start = self._missed_start(missed, now)
+            self.connection_manager.log_timestamped(
+                f"EMA start at {missed} was missed while the server was down ({self.missed_start_policy}): next at {next_start}")
+        self.connection_manager.log_timestamped(f"Resumed the EMA schedule (seed {planner.seed})")
+        self._arm(next_start)
+        return next_start
+
+    def _missed_start(self, missed, now):
+        policy = self.missed_start_policy
+        active_until = self.planner.active_until(now)
+        if policy == "fire" and active_until:
+            self.off_plan = True
+            return now + timedelta(seconds=2)
+
+        upcoming = self.next_planned(now)
+        self.off_plan = False
+        if policy == "rerandomize" and active_until:
+            latest = min(active_until, upcoming - timedelta(minutes=self.planner.min_gap))
+            if latest > now:
+                # Seeded by the study and the missed start, so it can be audited
+                rng = random.Random(f"{self.planner.seed}:{missed.isoformat()}")
+                return now + (latest - now) * rng.random()
+        return upcoming
@@ -0,0 +1,237 @@
+import heapq
+import itertools
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+class TimerHandle:
+    """A scheduled callback. Use cancel() / reschedule() to change it."""
+
+    def __init__(self, scheduler, callback, args, interval=None, jitter=0.0, next_delay=None):
+        self._scheduler = scheduler
+        self.callback = callback
+        self.args = args
+        self.interval = interval        # seconds between runs of a periodic task
+        self.next_delay = next_delay    # or a function giving the delay to the next run
+        self.jitter = jitter
+        self.deadline = None            # on the scheduler's monotonic clock
+        self.cancelled = False
+        self._seq = None                # identifies the live heap entry
+
+    @property
+    def periodic(self):
+        return self.interval is not None or self.next_delay is not None
+
+    def cancel(self):
+        self._scheduler.cancel(self)
+
+    def reschedule(self, delay):
+        self._scheduler.reschedule(self, delay)
+
+    def remaining(self):
+        """Seconds until the next run, or None if cancelled."""
+        if self.cancelled or self.deadline is None:
+            return None
+        return max(0.0, self.deadline - self._scheduler.clock())
+
+
+class TimerScheduler:
+    """
+    Runs every timed task of the process on a single thread.
+
+    Deadlines are kept in a heap on the monotonic clock, so wall-clock
+    changes do not move them, and the thread sleeps until the earliest one.
+    Cancelled and rescheduled entries are dropped lazily when they reach the
+    top of the heap. Tasks run on the scheduler thread and must stay short;
+    anything slow should hand off to its own worker.
+    """
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, clock=time.monotonic, wall_clock=datetime.now, on_error=None, name="TimerScheduler"):
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.on_error = on_error
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def default(cls):
+        """The process-wide scheduler shared by components that were not given one."""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    def call_later(self, delay, callback, *args, jitter=0.0):
+        """Runs callback(*args) once after `delay` seconds (+/- jitter)."""
+        handle = TimerHandle(self, callback, args, jitter=jitter)
+        self._push(handle, delay)
+        return handle
+
+    def call_every(self, interval, callback, *args, first_delay=None, jitter=0.0):
+        """
+        Runs callback(*args) every `interval` seconds. Runs are spaced from
+        the previous deadline, not from when the callback finished, so they
+        do not drift; a run that falls behind is not repeated to catch up.
+        """
+        handle = TimerHandle(self, callback, args, interval=interval, jitter=jitter)
+        self._push(handle, interval if first_delay is None else first_delay)
+        return handle
+
+    def call_daily_at(self, clock_time, callback, *args):
+        """Runs callback(*args) every day at a wall-clock time given as "HH:MM"."""
+        hour, minute = map(int, clock_time.split(":"))
+
+        def seconds_until_next():
+            now = self.wall_clock()
+            target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if target <= now:
+                target += timedelta(days=1)
+            return (target - now).total_seconds()
+
+        handle = TimerHandle(self, callback, args, next_delay=seconds_until_next)
+        self._push(handle, seconds_until_next())
+        return handle
+
+    def cancel(self, handle):
+        with self._condition:
+            handle.cancelled = True
+            handle._seq = None
+
+    def reschedule(self, handle, delay):
+        """Moves a task (cancelled or not) to run `delay` seconds from now."""
+        handle.cancelled = False
+        self._push(handle, delay)
+
+    def pending(self):
+        with self._condition:
+            return sum(1 for _, seq, handle in self._heap if handle._seq == seq)
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+    def _push(self, handle, delay):
+        if handle.jitter:
+            delay += random.uniform(-handle.jitter, handle.jitter)
+        with self._condition:
+            handle.deadline = self.clock() + max(0.0, delay)
+            handle._seq = next(self._counter)
+            heapq.heappush(self._heap, (handle.deadline, handle._seq, handle))
+            # Only wake the thread if this is now the earliest deadline
+            if self._heap[0][2] is handle:
+                self._condition.notify()
+
+    def _pop_due(self):
+        """
+        Pops the earliest live handle if it is due, re-arming periodic ones;
+        otherwise returns None. Call with the condition held.
+        """
+        # Drop entries that were cancelled or superseded by reschedule()
+        while self._heap and self._heap[0][2]._seq != self._heap[0][1]:
+            heapq.heappop(self._heap)
+        if not self._heap or self._heap[0][0] > self.clock():
+            return None
+
+        deadline, _, handle = heapq.heappop(self._heap)
+        handle._seq = None
+        # Re-arm periodic tasks before running them, so the callback
+        # can still cancel or reschedule itself
+        if handle.periodic and not handle.cancelled:
+            if handle.next_delay is not None:
+                next_deadline = self.clock() + handle.next_delay()
+            else:
+                next_deadline = deadline + handle.interval
+                if next_deadline <= self.clock():
+                    next_deadline = self.clock() + handle.interval
+            if handle.jitter:
+                next_deadline += random.uniform(-handle.jitter, handle.jitter)
+            handle.deadline = next_deadline
+            handle._seq = next(self._counter)
+            heapq.heappush(self._heap, (next_deadline, handle._seq, handle))
+        return handle
+
+    def _next_due(self):
+        """Waits for and pops the next due handle; None once stopped."""
+        with self._condition:
+            while self._running:
+                handle = self._pop_due()
+                if handle is not None:
+                    return handle
+                if not self._heap:
+                    self._condition.wait()
+                else:
+                    self._condition.wait(self._heap[0][0] - self.clock())
+            return None
+
+    def _execute(self, handle):
+        try:
+            handle.callback(*handle.args)
+        except Exception as e:
+            if self.on_error:
+                self.on_error(handle, e)
+            else:
+                print(f"TimerScheduler: {getattr(handle.callback, '__name__', handle.callback)} failed: {e}", file=sys.stderr)
+
+    def _run(self):
+        while True:
+            handle = self._next_due()
+            if handle is None:
+                return
+            self._execute(handle)
+
+
+class VirtualTimerScheduler(TimerScheduler):
+    """
+    A TimerScheduler on a simulated clock, for fast-forwarding weeks of
+    operation (see "testing tools/simulate_study.py").
+
+    There is no thread: advance() and run_until() run every task that falls
+    due on the calling thread, in deadline order, first moving the clock to
+    the task's deadline. wall_clock() is `start` plus the simulated time, so
+    daily jobs and anything reading timers.wall_clock() follow it.
+    """
+
+    def __init__(self, start, on_error=None):
+        self.start = start
+        self.now = 0.0
+        self.on_error = on_error
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._running = True
+        self.ran = 0
+
+    def clock(self):
+        return self.now
+
+    def wall_clock(self):
+        return self.start + timedelta(seconds=self.now)
+
+    def advance(self, seconds):
+        """Runs everything due in the next `seconds` simulated seconds."""
+        target = self.now + seconds
+        while self._running:
+            with self._condition:
+                while self._heap and self._heap[0][2]._seq != self._heap[0][1]:
+                    heapq.heappop(self._heap)
+                if not self._heap or self._heap[0][0] > target:
+                    break
+                self.now = max(self.now, self._heap[0][0])
+                handle = self._pop_due()
+            self._execute(handle)
+            self.ran += 1
+        self.now = max(self.now, target)
+
+    def run_until(self, moment):
+        """Runs everything due up to the wall-clock datetime `moment`."""
+        self.advance((moment - self.wall_clock()).total_seconds())